@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Pipeline incremental por semestre (notebooks 01 → 08)
+Recalcula solo las etapas cuyo código, parámetros o datos cambiaron
+
+Uso:
+    python ejecutar_pipeline.py run data/processed/df_objetivo/2024-1.xlsx data/processed/df_objetivo/2024-2.xlsx
+    python ejecutar_pipeline.py status data/processed/df_objetivo/2024-1.xlsx data/processed/df_objetivo/2024-2.xlsx
+    python ejecutar_pipeline.py run --help
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from etapas_utils import main  # noqa: E402
+
+if __name__ == "__main__":
+    main()
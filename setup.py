@@ -10,6 +10,8 @@ import subprocess
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).parent / "src"))
+
 def check_python_version():
     """Check if Python version is compatible"""
     if sys.version_info < (3, 8):
@@ -36,9 +38,19 @@ def verify_data_structure():
         "data/processed/df_objetivo/2024-2.xlsx"
     ]
     
+    try:
+        from data_utils import buscar_artefacto
+    except ImportError:
+        buscar_artefacto = lambda ruta: None
+
     missing_files = []
     for file_path in required_files:
-        if not os.path.exists(file_path):
+        if os.path.exists(file_path):
+            continue
+        cached = buscar_artefacto(file_path)
+        if cached is not None:
+            print(f"   ♻️  {file_path} found in columnar cache: {cached.name}")
+        else:
             missing_files.append(file_path)
     
     if missing_files:
@@ -75,7 +87,11 @@ def test_imports():
 def test_data_loading():
     """Test if main dataset can be loaded"""
     try:
-        df = pd.read_excel("data/processed/df_objetivo/df_escalado.xlsx")
+        try:
+            from data_utils import cargar_dataset
+            df = cargar_dataset("data/processed/df_objetivo/df_escalado.xlsx")
+        except ImportError:
+            df = pd.read_excel("data/processed/df_objetivo/df_escalado.xlsx")
         print(f"✅ Dataset loaded successfully: {df.shape[0]} rows, {df.shape[1]} columns")
         
         # Check for target variable
@@ -89,6 +105,28 @@ def test_data_loading():
         print(f"❌ Failed to load dataset: {e}")
         return False
 
+def validate_data_quality():
+    """Check the raw semester file against the data-quality contract"""
+    data_file = "data/processed/df_objetivo/2024-2.xlsx"
+    if not os.path.exists(data_file):
+        print(f"⚠️  {data_file} not found, skipping data-quality check")
+        return True
+    try:
+        from validacion_utils import validar_datos
+    except ImportError as e:
+        print(f"❌ Could not import validacion_utils: {e}")
+        return False
+
+    result = validar_datos(data_file, verbose=False)
+    if not result['valido']:
+        print(f"❌ {result['errores']} data-quality violations in {data_file}:")
+        print(result['reporte'].to_string(index=False))
+        print(result['muestras'].to_string(index=False))
+        return False
+    print(f"✅ {result['filas_leidas']} rows pass the data-quality contract "
+          f"({result['advertencias']} warnings, {result['segundos']:.1f}s)")
+    return True
+
 def create_jupyter_config():
     """Create basic Jupyter configuration"""
     try:
@@ -114,6 +152,7 @@ def main():
         ("Data Structure", verify_data_structure),
         ("Package Imports", test_imports),
         ("Data Loading", test_data_loading),
+        ("Data Quality", validate_data_quality),
         ("Jupyter Config", create_jupyter_config)
     ]
     
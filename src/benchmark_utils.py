@@ -0,0 +1,463 @@
+"""
+Benchmarks de punta a punta: datos → modelo → explicación
+Datos sintéticos con el esquema del proyecto, tiempo y memoria pico de cada
+etapa, e historial JSON por commit para ver regresiones
+
+Uso:
+    python src/benchmark_utils.py run --tamanos 10000 100000
+    python src/benchmark_utils.py compare
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+DIRECTORIO_RAIZ = Path(__file__).resolve().parent.parent
+ARCHIVO_HISTORIAL = DIRECTORIO_RAIZ / "results" / "benchmarks" / "historial.jsonl"
+
+TARGET = 'RIESGO_DESERCION'
+# RIESGO_DESERCION se define con el percentil 80 del atraso: ~20% de positivos
+PROPORCION_RIESGO = 0.2
+TAMANOS = (10_000, 100_000, 1_000_000, 10_000_000)
+
+SEDES = ['BOGOTA', 'MEDELLIN', 'MANIZALES', 'PALMIRA', 'LA PAZ']
+NODOS = ['Admisión regular', 'PAES', 'PEAMA', 'Estudiantes que deben nivelar - Excepción COVID']
+N_FACULTADES = 20
+N_PLANES = 120
+N_MUNICIPIOS = 400
+
+
+def generar_dataset(n_filas, semilla=42, proporcion_faltantes=0.05):
+    """
+    Dataset sintético con el esquema de los datos crudos (antes de imputar)
+
+    PAPA, AVANCE_CARRERA, ATRASO_PORCENTUAL, NUMERO_MATRICULAS, ESTRATO y las
+    categóricas de cohorte con la jerarquía SEDE → FACULTAD → PLAN; el riesgo
+    depende de las variables académicas y tiene el desbalance real (~20%).
+
+    Parameters:
+    -----------
+    n_filas : int
+    semilla : int
+    proporcion_faltantes : float
+        Proporción de NaN en PAPA, PROME_ACADE, PUNTAJE_ADMISION y MUNICIPIO_NACIMIENTO
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    rng = np.random.default_rng(semilla)
+    plan = rng.integers(0, N_PLANES, n_filas)
+    facultad = plan % N_FACULTADES
+    sede = facultad % len(SEDES)
+
+    matriculas = rng.integers(1, 16, n_filas)
+    papa = np.clip(rng.normal(3.6, 0.5, n_filas), 0, 5).round(1)
+    avance = np.clip(matriculas * 7.5 + rng.normal(0, 12, n_filas), 0, 100).round(1)
+    atraso = np.clip(matriculas * 7.5 - avance + rng.normal(0, 5, n_filas), 0, None).round(1)
+    estrato = rng.choice(np.arange(1, 7), n_filas, p=[0.15, 0.3, 0.3, 0.15, 0.06, 0.04])
+
+    latente = 0.08 * atraso - 1.5 * (papa - 3.6) - 0.2 * estrato + rng.normal(0, 1, n_filas)
+    riesgo = (latente >= np.quantile(latente, 1 - PROPORCION_RIESGO)).astype(np.int64)
+
+    def _con_faltantes(valores):
+        valores = valores.astype(object if valores.dtype == object else np.float64)
+        valores[rng.random(n_filas) < proporcion_faltantes] = None if valores.dtype == object else np.nan
+        return valores
+
+    municipios = np.array([f'MUNICIPIO_{i:03d}' for i in range(N_MUNICIPIOS)], dtype=object)
+    return pd.DataFrame({
+        'SEDE': np.array(SEDES, dtype=object)[sede],
+        'FACULTAD': np.array([f'FACULTAD_{i:02d}' for i in range(N_FACULTADES)], dtype=object)[facultad],
+        'PLAN': np.array([f'PLAN_{i:03d}' for i in range(N_PLANES)], dtype=object)[plan],
+        'NODO_INICIO': np.array(NODOS, dtype=object)[rng.choice(len(NODOS), n_filas, p=[0.8, 0.08, 0.07, 0.05])],
+        'GENERO': np.array(['M', 'F'], dtype=object)[rng.integers(0, 2, n_filas)],
+        'MUNICIPIO_NACIMIENTO': _con_faltantes(municipios[rng.zipf(1.5, n_filas) % N_MUNICIPIOS]),
+        'EDAD': rng.integers(16, 40, n_filas),
+        'ESTRATO': estrato,
+        'PAPA': _con_faltantes(papa),
+        'PROME_ACADE': _con_faltantes(np.clip(papa + rng.normal(0, 0.2, n_filas), 0, 5).round(2)),
+        'PUNTAJE_ADMISION': _con_faltantes(rng.normal(650, 80, n_filas).round()),
+        'AVANCE_CARRERA': avance,
+        'ATRASO_PORCENTUAL': atraso,
+        'NUMERO_MATRICULAS': matriculas,
+        TARGET: riesgo,
+    })
+
+
+def dataset_escalado(df):
+    """
+    Versión numérica lista para modelar, con el esquema de df_escalado.xlsx:
+    numéricas estandarizadas, GENERO binaria y NODO_INICIO/SEDE en one-hot
+    """
+    numericas = ['EDAD', 'ESTRATO', 'PAPA', 'PROME_ACADE', 'PUNTAJE_ADMISION', 'AVANCE_CARRERA',
+                 'ATRASO_PORCENTUAL', 'NUMERO_MATRICULAS']
+    valores = df[numericas].to_numpy(dtype=np.float64)
+    medias = np.nanmean(valores, axis=0)
+    valores = np.where(np.isnan(valores), medias, valores)
+    valores = (valores - medias) / valores.std(axis=0)
+    X = pd.DataFrame(valores, columns=numericas, index=df.index)
+    X['GENERO'] = (df['GENERO'] == 'M').astype(np.float64)
+    X = pd.concat([X, pd.get_dummies(df[['NODO_INICIO', 'SEDE']], drop_first=True, dtype=np.float64)], axis=1)
+    return X, df[TARGET].to_numpy()
+
+
+def _silencioso(funcion):
+    """Ejecuta ``funcion`` sin imprimir ni mostrar figuras"""
+    import matplotlib.pyplot as plt
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return funcion()
+        finally:
+            plt.close('all')
+
+
+class _Contexto:
+    """Datos y modelos de un tamaño, creados solo cuando un caso los pide"""
+
+    def __init__(self, n_filas, semilla, filas_modelo, muestras_shap):
+        self.n_filas = n_filas
+        self.semilla = semilla
+        self.filas_modelo = min(filas_modelo, n_filas)
+        self.muestras_shap = muestras_shap
+        self._cache = {}
+
+    def _obtener(self, nombre, constructor):
+        if nombre not in self._cache:
+            self._cache[nombre] = constructor()
+        return self._cache[nombre]
+
+    @property
+    def crudo(self):
+        return self._obtener('crudo', lambda: generar_dataset(self.n_filas, self.semilla))
+
+    @property
+    def imputado(self):
+        from pipeline_utils import ImputadorGrupos
+        return self._obtener('imputado', lambda: _silencioso(lambda: ImputadorGrupos().ajustar_transformar(self.crudo)))
+
+    @property
+    def escalado(self):
+        return self._obtener('escalado', lambda: dataset_escalado(self.imputado))
+
+    @property
+    def entrenamiento(self):
+        """Subconjunto (filas_modelo) usado para SMOTE y para entrenar"""
+        def _construir():
+            X, y = self.escalado
+            return X.iloc[:self.filas_modelo], y[:self.filas_modelo]
+        return self._obtener('entrenamiento', _construir)
+
+    @property
+    def modelo(self):
+        def _construir():
+            from sklearn.ensemble import RandomForestClassifier
+            X, y = self.entrenamiento
+            return RandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=42).fit(X, y)
+        return self._obtener('modelo', _construir)
+
+    @property
+    def muestra(self):
+        return self._obtener('muestra', lambda: self.escalado[0].iloc[:self.muestras_shap])
+
+    @property
+    def shap_values(self):
+        from shap_utils import ExplicadorSHAP
+        return self._obtener('shap_values',
+                             lambda: _silencioso(lambda: ExplicadorSHAP(self.modelo).shap_values(self.muestra)))
+
+
+def _brf(ctx):
+    from imblearn.ensemble import BalancedRandomForestClassifier
+    X, y = ctx.entrenamiento
+    return BalancedRandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=42,
+                                          sampling_strategy='all', replacement=True, bootstrap=False).fit(X, y)
+
+
+def _smote(ctx):
+    from imblearn.over_sampling import SMOTE
+    X, y = ctx.entrenamiento
+    return SMOTE(random_state=42).fit_resample(X, y)
+
+
+def _smote_aproximado(ruta=None):
+    def _caso(ctx):
+        from remuestreo_utils import SMOTEAproximado
+        X, y = ctx.entrenamiento
+        return SMOTEAproximado(random_state=42).fit_resample(X, y, ruta=ruta)
+    return _caso
+
+
+def _rf(ctx):
+    from sklearn.ensemble import RandomForestClassifier
+    X, y = ctx.entrenamiento
+    return RandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=42).fit(X, y)
+
+
+def _eda(nombre):
+    def _caso(ctx):
+        import eda_utils
+        if nombre == 'comparar_datasets':
+            return eda_utils.comparar_datasets(ctx.crudo, ctx.imputado)
+        return getattr(eda_utils, nombre)(ctx.crudo)
+    return _caso
+
+
+def _shap(nombre):
+    def _caso(ctx):
+        import shap_utils
+        from shap_utils import limpiar_cache_shap
+        # Sin caché: se mide el cálculo, no la lectura del resultado anterior
+        limpiar_cache_shap()
+        X, y = ctx.escalado
+        muestra, n = ctx.muestra, ctx.muestras_shap
+        if nombre == 'crear_shap_plot':
+            return shap_utils.crear_shap_plot(ctx.modelo, X, muestra, max_samples=n, y_test=y[:n], mostrar=False)
+        if nombre == 'crear_plots_comparativos':
+            return shap_utils.crear_plots_comparativos(ctx.modelo, X, muestra, max_samples=n, y_test=y[:n],
+                                                       mostrar=False)
+        if nombre == 'mostrar_top_features':
+            return shap_utils.mostrar_top_features(ctx.modelo, X, muestra, max_samples=n, y_test=y[:n])
+        if nombre == 'ranking_convergente':
+            return shap_utils.ranking_convergente(ctx.modelo, muestra, max_samples=n, y_test=y[:n])
+        if nombre == 'calcular_shap_paralelo':
+            return shap_utils.calcular_shap_paralelo(ctx.modelo, muestra, tamano_bloque=max(n // 4, 1))
+        if nombre == 'importancia_por_cohorte':
+            return shap_utils.importancia_por_cohorte(ctx.shap_values, muestra, grupos=ctx.crudo.iloc[:n])
+        if nombre == 'renderizar_plots':
+            tareas = [{'tipo': tipo, 'archivo': f'benchmark_{tipo}.png', 'shap_values': ctx.shap_values,
+                       'X': muestra} for tipo in ('bar', 'beeswarm', 'comparativo')]
+            return shap_utils.renderizar_plots(tareas, directorio=ARCHIVO_HISTORIAL.parent / "plots")
+        raise ValueError(nombre)
+    return _caso
+
+
+# Nombre → (función, grupo, ¿escala con las filas del dataset?, datos que se preparan antes de medir)
+# Los casos que no escalan usan a lo sumo filas_modelo filas o muestras_shap muestras
+_SHAP = ('escalado', 'modelo', 'muestra')
+CASOS = {
+    'analizar_estructura_dataset': (_eda('analizar_estructura_dataset'), 'eda', True, ('crudo',)),
+    'analisis_rapido_dataset': (_eda('analisis_rapido_dataset'), 'eda', True, ('crudo',)),
+    'comparar_datasets': (_eda('comparar_datasets'), 'eda', True, ('crudo', 'imputado')),
+    'imputacion': (lambda ctx: __import__('pipeline_utils').ImputadorGrupos().ajustar_transformar(ctx.crudo),
+                   'preprocesamiento', True, ('crudo',)),
+    'escalado': (lambda ctx: dataset_escalado(ctx.imputado), 'preprocesamiento', True, ('imputado',)),
+    'smote': (_smote, 'modelo', False, ('entrenamiento',)),
+    'smote_aproximado': (_smote_aproximado(), 'modelo', False, ('entrenamiento',)),
+    'smote_aproximado_memmap': (_smote_aproximado(ARCHIVO_HISTORIAL.parent / "smote.npy"), 'modelo', False,
+                                ('entrenamiento',)),
+    'entrenamiento_rf': (_rf, 'modelo', False, ('entrenamiento',)),
+    'entrenamiento_brf': (_brf, 'modelo', False, ('entrenamiento',)),
+    'predict_proba': (lambda ctx: ctx.modelo.predict_proba(ctx.escalado[0]), 'modelo', True, ('escalado', 'modelo')),
+    'crear_shap_plot': (_shap('crear_shap_plot'), 'shap', False, _SHAP),
+    'crear_plots_comparativos': (_shap('crear_plots_comparativos'), 'shap', False, _SHAP),
+    'mostrar_top_features': (_shap('mostrar_top_features'), 'shap', False, _SHAP),
+    'ranking_convergente': (_shap('ranking_convergente'), 'shap', False, _SHAP),
+    'calcular_shap_paralelo': (_shap('calcular_shap_paralelo'), 'shap', False, _SHAP),
+    'importancia_por_cohorte': (_shap('importancia_por_cohorte'), 'shap', False, _SHAP + ('shap_values',)),
+    'renderizar_plots': (_shap('renderizar_plots'), 'shap', False, _SHAP + ('shap_values',)),
+}
+
+
+def _medir(funcion, ctx, repeticiones, perfil_memoria, requiere=()):
+    """Mejor tiempo de ``repeticiones`` corridas y, aparte, el pico de memoria de una corrida"""
+    # Los datos y modelos de entrada se construyen fuera de la medición
+    for nombre in requiere:
+        getattr(ctx, nombre)
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        _silencioso(lambda: funcion(ctx))
+        tiempos.append(time.perf_counter() - t0)
+    memoria = None
+    if perfil_memoria:
+        # tracemalloc ralentiza la ejecución: se mide en una corrida separada
+        tracemalloc.start()
+        try:
+            _silencioso(lambda: funcion(ctx))
+            memoria = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return min(tiempos), memoria
+
+
+def _commit_actual():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_RAIZ,
+                                capture_output=True, text=True, check=True)
+        commit = salida.stdout.strip()
+        sucio = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=DIRECTORIO_RAIZ,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if sucio else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar_benchmarks(tamanos=TAMANOS[:2], casos=None, repeticiones=1, perfil_memoria=True,
+                        filas_modelo=200_000, muestras_shap=200, semilla=42, historial=None):
+    """
+    Medir tiempo y memoria pico de cada caso en cada tamaño y agregarlo al historial
+
+    Parameters:
+    -----------
+    tamanos : iterable
+        Filas del dataset sintético (p. ej. 10_000 a 10_000_000)
+    casos : list, optional
+        Nombres de CASOS o grupos ('eda', 'preprocesamiento', 'modelo', 'shap'); por defecto todos
+    repeticiones : int
+        Corridas por caso; se guarda el mejor tiempo
+    perfil_memoria : bool
+        Medir la memoria pico con tracemalloc (una corrida adicional)
+    filas_modelo : int
+        Máximo de filas para SMOTE y entrenamiento
+    muestras_shap : int
+        Filas explicadas en los casos de SHAP
+    semilla : int
+    historial : str, Path o False
+        Archivo JSON Lines (None: results/benchmarks/historial.jsonl); False para no guardar
+
+    Returns:
+    --------
+    pandas.DataFrame : Un registro por (caso, tamaño)
+    """
+    seleccion = [nombre for nombre, (_, grupo, _, _) in CASOS.items()
+                 if casos is None or nombre in casos or grupo in casos]
+    desconocidos = set(casos or []) - set(CASOS) - {grupo for _, grupo, _, _ in CASOS.values()}
+    if desconocidos:
+        raise ValueError(f"Casos desconocidos: {sorted(desconocidos)}")
+
+    base = {
+        'commit': _commit_actual(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+    }
+    registros = []
+    print(f"=== BENCHMARKS: {len(seleccion)} casos × {len(tamanos)} tamaños (commit {base['commit']}) ===")
+    for n_filas in tamanos:
+        ctx = _Contexto(n_filas, semilla, filas_modelo, muestras_shap)
+        print(f"\n📏 {n_filas:,} filas")
+        for nombre in seleccion:
+            funcion, grupo, escala, requiere = CASOS[nombre]
+            segundos, memoria = _medir(funcion, ctx, repeticiones, perfil_memoria, requiere)
+            filas_usadas = n_filas if escala else min(n_filas, filas_modelo if grupo == 'modelo' else muestras_shap)
+            registros.append({**base, 'caso': nombre, 'grupo': grupo, 'filas': n_filas,
+                              'filas_procesadas': filas_usadas, 'segundos': round(segundos, 4),
+                              'memoria_pico_mb': round(memoria, 1) if memoria is not None else None,
+                              'filas_por_segundo': round(filas_usadas / max(segundos, 1e-9))})
+            memoria_texto = f" | {memoria:,.0f} MB" if memoria is not None else ""
+            print(f"   {nombre:<30} {segundos:>9.3f}s{memoria_texto}")
+
+    if historial is not False:
+        ruta = Path(historial) if historial is not None else ARCHIVO_HISTORIAL
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        with open(ruta, 'a', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        print(f"\n💾 {len(registros)} resultados agregados a {ruta}")
+    return pd.DataFrame(registros)
+
+
+def cargar_historial(historial=None):
+    """Historial completo de benchmarks como DataFrame"""
+    ruta = Path(historial) if historial is not None else ARCHIVO_HISTORIAL
+    if not ruta.exists():
+        return pd.DataFrame()
+    return pd.read_json(ruta, lines=True, dtype={'commit': str})
+
+
+def comparar_historial(historial=None, commit=None, referencia=None, umbral=0.2):
+    """
+    Comparar dos commits del historial y marcar regresiones
+
+    Parameters:
+    -----------
+    historial : str o Path, optional
+    commit : str, optional
+        Commit a evaluar (por defecto el último registrado)
+    referencia : str, optional
+        Commit de referencia (por defecto el anterior a ``commit``)
+    umbral : float
+        Aumento relativo de tiempo o memoria a partir del cual se marca regresión
+
+    Returns:
+    --------
+    pandas.DataFrame : Tiempos y memoria de ambos commits por (caso, filas), con 'Regresion'
+    """
+    df = cargar_historial(historial)
+    if df.empty:
+        print("⚠️ No hay historial de benchmarks")
+        return df
+    # Si un commit se midió varias veces, cuenta la última medición
+    df = df.sort_values('fecha').drop_duplicates(['commit', 'caso', 'filas'], keep='last')
+    orden = df.groupby('commit', sort=False)['fecha'].max().sort_values().index.tolist()
+    commit = commit or orden[-1]
+    if referencia is None:
+        anteriores = orden[:orden.index(commit)]
+        if not anteriores:
+            print(f"⚠️ No hay un commit anterior a {commit} para comparar")
+            return pd.DataFrame()
+        referencia = anteriores[-1]
+
+    columnas = ['caso', 'filas', 'segundos', 'memoria_pico_mb']
+    comparacion = df.loc[df['commit'] == referencia, columnas].merge(
+        df.loc[df['commit'] == commit, columnas], on=['caso', 'filas'], suffixes=('_antes', '_despues'))
+    comparacion['Cambio_tiempo'] = comparacion['segundos_despues'] / comparacion['segundos_antes'] - 1
+    comparacion['Cambio_memoria'] = comparacion['memoria_pico_mb_despues'] / comparacion['memoria_pico_mb_antes'] - 1
+    comparacion['Regresion'] = (comparacion['Cambio_tiempo'] > umbral) | (comparacion['Cambio_memoria'] > umbral)
+
+    print(f"=== BENCHMARKS {referencia} → {commit} ===")
+    for fila in comparacion.itertuples(index=False):
+        marca = "🔴" if fila.Regresion else ("🟢" if fila.Cambio_tiempo < -umbral else "⚪")
+        print(f"{marca} {fila.caso:<30} {fila.filas:>11,} filas: {fila.segundos_antes:.3f}s → "
+              f"{fila.segundos_despues:.3f}s ({fila.Cambio_tiempo:+.0%})")
+    print(f"\n{int(comparacion['Regresion'].sum())} regresiones (umbral {umbral:.0%})")
+    return comparacion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de deserción")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    run = subcomandos.add_parser('run', help="Ejecutar benchmarks y agregarlos al historial")
+    run.add_argument('--tamanos', type=int, nargs='+', default=list(TAMANOS[:2]))
+    run.add_argument('--casos', nargs='*', default=None,
+                     help=f"Casos o grupos (eda, preprocesamiento, modelo, shap). Casos: {', '.join(CASOS)}")
+    run.add_argument('--repeticiones', type=int, default=1)
+    run.add_argument('--sin-memoria', action='store_true', help="No medir memoria pico")
+    run.add_argument('--filas-modelo', type=int, default=200_000)
+    run.add_argument('--muestras-shap', type=int, default=200)
+    run.add_argument('--historial', default=None)
+
+    compare = subcomandos.add_parser('compare', help="Comparar los dos últimos commits del historial")
+    compare.add_argument('--commit', default=None)
+    compare.add_argument('--referencia', default=None)
+    compare.add_argument('--umbral', type=float, default=0.2)
+    compare.add_argument('--historial', default=None)
+
+    args = parser.parse_args(argv)
+    if args.comando == 'run':
+        ejecutar_benchmarks(args.tamanos, args.casos, args.repeticiones, not args.sin_memoria,
+                            args.filas_modelo, args.muestras_shap, historial=args.historial)
+    elif args.comando == 'compare':
+        regresiones = comparar_historial(args.historial, args.commit, args.referencia, args.umbral)
+        if not regresiones.empty and regresiones['Regresion'].any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Acceso a datos con caché columnar en disco
+Evita re-parsear los .xlsx entre etapas guardando cada resultado en Feather/Parquet
+con claves por hash de contenido
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DIRECTORIO_CACHE = Path(__file__).resolve().parent.parent / "data" / "processed" / "cache"
+MANIFIESTO = "manifest.json"
+FORMATOS = {'feather': '.feather', 'parquet': '.parquet'}
+
+
+def _pyarrow_disponible():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def hash_contenido(ruta, tamano_bloque=1 << 20):
+    """
+    Hash BLAKE2b (128 bits) del contenido de un archivo, leído por bloques
+
+    Parameters:
+    -----------
+    ruta : str o Path
+        Archivo a hashear
+    tamano_bloque : int
+        Bytes leídos por iteración
+
+    Returns:
+    --------
+    str : Hash hexadecimal de 32 caracteres
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _directorio(directorio):
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_CACHE
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def _leer_manifiesto(directorio):
+    ruta = directorio / MANIFIESTO
+    if not ruta.exists():
+        return {}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _escribir_manifiesto(directorio, manifiesto):
+    # Escritura atómica para no dejar el manifiesto a medias
+    temporal = directorio / (MANIFIESTO + '.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, directorio / MANIFIESTO)
+
+
+def _clave_fuente(ruta, hoja):
+    return f"{Path(ruta).resolve()}::{hoja if hoja is not None else 0}"
+
+
+def _hash_fuente(ruta, entrada):
+    """
+    Hash de contenido de la fuente; si tamaño y mtime coinciden con lo
+    registrado en el manifiesto se reutiliza sin volver a leer el archivo
+    """
+    info = os.stat(ruta)
+    if entrada and entrada.get('tamano') == info.st_size and entrada.get('mtime_ns') == info.st_mtime_ns:
+        return entrada['hash'], info
+    return hash_contenido(ruta), info
+
+
+def _escribir_artefacto(df, ruta, formato):
+    if formato == 'feather':
+        # Feather sin compresión: se puede leer con memory map sin copias
+        df.reset_index(drop=True).to_feather(ruta, compression='uncompressed')
+    else:
+        df.to_parquet(ruta, index=False)
+
+
+def _leer_artefacto(ruta):
+    ruta = Path(ruta)
+    if ruta.suffix == '.feather':
+        import pyarrow.feather as feather
+        tabla = feather.read_table(ruta, memory_map=True)
+    else:
+        import pyarrow.parquet as pq
+        tabla = pq.read_table(ruta, memory_map=True)
+    # split_blocks evita consolidar columnas numéricas en un bloque nuevo
+    return tabla.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def leer_excel_cacheado(ruta, hoja=None, directorio=None, formato='feather', **kwargs):
+    """
+    Lee un .xlsx a través de la caché columnar
+
+    La primera lectura parsea el Excel con ``pd.read_excel`` y guarda el
+    resultado como artefacto columnar con el hash de contenido de la fuente;
+    las siguientes leen el artefacto con memory map mientras el Excel no cambie.
+
+    Parameters:
+    -----------
+    ruta : str o Path
+        Archivo .xlsx de origen
+    hoja : str o int, optional
+        Hoja a leer (por defecto la primera)
+    directorio : str o Path, optional
+        Directorio de la caché (por defecto data/processed/cache)
+    formato : str
+        'feather' (lectura sin copias) o 'parquet' (comprimido)
+    **kwargs :
+        Argumentos adicionales para ``pd.read_excel``
+
+    Returns:
+    --------
+    pandas.DataFrame : Contenido de la hoja
+    """
+    hoja_excel = hoja if hoja is not None else 0
+    if not _pyarrow_disponible():
+        print("⚠️  pyarrow no está instalado, leyendo el Excel sin caché")
+        return pd.read_excel(ruta, sheet_name=hoja_excel, **kwargs)
+    if formato not in FORMATOS:
+        raise ValueError(f"formato debe ser uno de {list(FORMATOS)}, se recibió '{formato}'")
+
+    directorio = _directorio(directorio)
+    manifiesto = _leer_manifiesto(directorio)
+    clave = _clave_fuente(ruta, hoja) + (f"::{json.dumps(kwargs, sort_keys=True, default=str)}" if kwargs else "")
+    entrada = manifiesto.get(clave)
+    hash_fuente, info = _hash_fuente(ruta, entrada)
+
+    if entrada and entrada['hash'] == hash_fuente and (directorio / entrada['archivo']).exists():
+        return _leer_artefacto(directorio / entrada['archivo'])
+
+    df = pd.read_excel(ruta, sheet_name=hoja_excel, **kwargs)
+    archivo = f"{Path(ruta).stem}-{hash_fuente[:16]}{FORMATOS[formato]}"
+    try:
+        _escribir_artefacto(df, directorio / archivo, formato)
+    except Exception as e:
+        print(f"⚠️  No se pudo guardar en caché {Path(ruta).name}: {e}")
+        return df
+
+    # Eliminar el artefacto anterior de esta misma fuente
+    if entrada and entrada['archivo'] != archivo:
+        (directorio / entrada['archivo']).unlink(missing_ok=True)
+
+    manifiesto[clave] = {
+        'fuente': str(Path(ruta).resolve()),
+        'hoja': hoja,
+        'hash': hash_fuente,
+        'tamano': info.st_size,
+        'mtime_ns': info.st_mtime_ns,
+        'archivo': archivo,
+        'filas': int(df.shape[0]),
+        'columnas': int(df.shape[1]),
+        'creado': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _escribir_manifiesto(directorio, manifiesto)
+    return df
+
+
+def guardar_etapa(df, nombre, entradas=None, directorio=None, formato='feather', exportar_excel=None):
+    """
+    Guarda la salida de una etapa del pipeline como artefacto columnar
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Resultado de la etapa (por ejemplo el dataset imputado)
+    nombre : str
+        Nombre de la etapa, p. ej. 'df_objetivo_imputado'
+    entradas : list, optional
+        Rutas de los archivos de entrada de la etapa; su hash de contenido
+        queda registrado y ``cargar_etapa`` lo usa para invalidar la caché
+    directorio : str o Path, optional
+        Directorio de la caché (por defecto data/processed/cache)
+    formato : str
+        'feather' o 'parquet'
+    exportar_excel : str o Path, optional
+        Si se indica, también escribe la copia .xlsx para compatibilidad
+
+    Returns:
+    --------
+    Path : Ruta del artefacto guardado
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato debe ser uno de {list(FORMATOS)}, se recibió '{formato}'")
+    directorio = _directorio(directorio)
+    manifiesto = _leer_manifiesto(directorio)
+
+    ruta = directorio / f"{nombre}{FORMATOS[formato]}"
+    _escribir_artefacto(df, ruta, formato)
+    if exportar_excel:
+        df.to_excel(exportar_excel, index=False)
+
+    manifiesto[f"etapa::{nombre}"] = {
+        'etapa': nombre,
+        'archivo': ruta.name,
+        'entradas': {str(Path(e).resolve()): hash_contenido(e) for e in (entradas or [])},
+        'filas': int(df.shape[0]),
+        'columnas': int(df.shape[1]),
+        'fuente': str(Path(exportar_excel).resolve()) if exportar_excel else None,
+        'creado': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _escribir_manifiesto(directorio, manifiesto)
+    return ruta
+
+
+def cargar_etapa(nombre, directorio=None):
+    """
+    Carga la salida guardada de una etapa si sus entradas no han cambiado
+
+    Parameters:
+    -----------
+    nombre : str
+        Nombre de la etapa usado en ``guardar_etapa``
+    directorio : str o Path, optional
+        Directorio de la caché
+
+    Returns:
+    --------
+    pandas.DataFrame o None : None si no existe o si alguna entrada cambió
+    """
+    directorio = _directorio(directorio)
+    entrada = _leer_manifiesto(directorio).get(f"etapa::{nombre}")
+    if entrada is None or not (directorio / entrada['archivo']).exists():
+        return None
+    for ruta, hash_guardado in entrada['entradas'].items():
+        if not os.path.exists(ruta) or hash_contenido(ruta) != hash_guardado:
+            return None
+    return _leer_artefacto(directorio / entrada['archivo'])
+
+
+def buscar_artefacto(ruta_fuente, directorio=None):
+    """
+    Busca en la caché un artefacto asociado a un archivo de datos
+
+    Reconoce tanto lecturas cacheadas del Excel como etapas guardadas con
+    ``exportar_excel`` apuntando a ese archivo o con el mismo nombre.
+
+    Returns:
+    --------
+    Path o None : Ruta del artefacto, si existe
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_CACHE
+    if not (directorio / MANIFIESTO).exists():
+        return None
+    fuente = str(Path(ruta_fuente).resolve())
+    nombre = Path(ruta_fuente).stem
+    for entrada in _leer_manifiesto(directorio).values():
+        if entrada.get('fuente') == fuente or entrada.get('etapa') == nombre:
+            artefacto = directorio / entrada['archivo']
+            if artefacto.exists():
+                return artefacto
+    return None
+
+
+def cargar_dataset(ruta, hoja=None, directorio=None):
+    """
+    Carga un dataset del proyecto usando la caché cuando es posible
+
+    Si el .xlsx existe se lee con ``leer_excel_cacheado``; si no existe pero
+    hay un artefacto en caché para esa ruta, se carga el artefacto.
+    """
+    if os.path.exists(ruta):
+        return leer_excel_cacheado(ruta, hoja=hoja, directorio=directorio)
+    artefacto = buscar_artefacto(ruta, directorio)
+    if artefacto is None:
+        raise FileNotFoundError(f"No existe {ruta} ni un artefacto en caché para él")
+    return _leer_artefacto(artefacto)
+
+
+def _tipo_compacto(serie, max_proporcion_categorias, tolerancia, dispersas, densidad_maxima):
+    """
+    Tipo más pequeño que conserva los valores de la columna, o None si no hay uno mejor
+    """
+    dtype = serie.dtype
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        validos = serie.count()
+        if validos and serie.nunique(dropna=True) <= max_proporcion_categorias * validos:
+            return 'category'
+        return None
+    # Solo tipos numpy numéricos (no bool, category, fechas ni tipos extendidos)
+    if not isinstance(dtype, np.dtype) or dtype.kind not in 'iuf':
+        return None
+
+    valores = serie.to_numpy()
+    nulos = np.isnan(valores) if dtype.kind == 'f' else np.zeros(len(valores), dtype=bool)
+    presentes = valores[~nulos]
+    if not len(presentes):
+        return None
+
+    if not nulos.any():
+        # Indicadoras 0/1 (one-hot, binarias codificadas)
+        if np.isin(presentes, (0, 1)).all():
+            if dispersas and presentes.mean() <= densidad_maxima:
+                return pd.SparseDtype(bool, False)
+            return np.dtype(bool)
+        if dtype.kind in 'iu' or np.array_equal(presentes, np.trunc(presentes)):
+            minimo, maximo = presentes.min(), presentes.max()
+            for candidato in (np.int8, np.int16, np.int32):
+                info = np.iinfo(candidato)
+                if info.min <= minimo and maximo <= info.max:
+                    return np.dtype(candidato) if np.dtype(candidato).itemsize < dtype.itemsize else None
+            return None
+
+    if dtype == np.float64:
+        reducidos = presentes.astype(np.float32).astype(np.float64)
+        if np.all(np.abs(reducidos - presentes) <= tolerancia * np.abs(presentes)):
+            return np.dtype(np.float32)
+    return None
+
+
+def _bytes_columnas(df):
+    return df.memory_usage(deep=True, index=False)
+
+
+def restaurar_tipos(df, plan):
+    """
+    Devuelve una copia con los tipos originales de las columnas de ``plan``
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dataset optimizado con ``optimizar_tipos``
+    plan : dict
+        Columna → dtype original (segundo valor devuelto por ``optimizar_tipos``)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    df = df.copy(deep=False)
+    for col, original in plan.items():
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if isinstance(serie.dtype, pd.SparseDtype):
+            serie = serie.sparse.to_dense()
+        df[col] = serie.astype(original)
+    return df
+
+
+def validar_tipos(original, optimizado, plan, tolerancia=0.0):
+    """
+    Verifica que restaurar los tipos devuelve los valores originales
+
+    Parameters:
+    -----------
+    original : pandas.DataFrame
+    optimizado : pandas.DataFrame
+    plan : dict
+        Columna → dtype original
+    tolerancia : float
+        Error relativo admitido (solo columnas pasadas a float32)
+
+    Returns:
+    --------
+    pandas.DataFrame : Por columna convertida: dtype antes/después, bytes antes/después,
+                       error relativo máximo y si la conversión es válida
+    """
+    restaurado = restaurar_tipos(optimizado[list(plan)], plan)
+    bytes_antes = _bytes_columnas(original[list(plan)])
+    bytes_despues = _bytes_columnas(optimizado[list(plan)])
+    registros = []
+    for col, dtype_original in plan.items():
+        antes, despues = original[col], restaurado[col]
+        error = 0.0
+        valido = antes.equals(despues)
+        if not valido and antes.dtype.kind == 'f' and str(despues.dtype) == str(antes.dtype):
+            a, d = antes.to_numpy(), despues.to_numpy()
+            mismos_nulos = np.array_equal(np.isnan(a), np.isnan(d))
+            presentes = ~np.isnan(a)
+            relativo = np.abs(d[presentes] - a[presentes]) / np.maximum(np.abs(a[presentes]), np.finfo(float).tiny)
+            error = float(relativo.max()) if len(relativo) else 0.0
+            valido = mismos_nulos and error <= tolerancia
+        registros.append({
+            'columna': col,
+            'dtype_antes': dtype_original,
+            'dtype_despues': str(optimizado[col].dtype),
+            'bytes_antes': int(bytes_antes[col]),
+            'bytes_despues': int(bytes_despues[col]),
+            'error_relativo_max': error,
+            'valida': valido,
+        })
+    return pd.DataFrame(registros, columns=['columna', 'dtype_antes', 'dtype_despues', 'bytes_antes',
+                                            'bytes_despues', 'error_relativo_max', 'valida']).set_index('columna')
+
+
+def optimizar_tipos(df, max_proporcion_categorias=0.5, tolerancia=0.0, dispersas=False, densidad_maxima=0.1,
+                    excluir=('RIESGO_DESERCION',), validar=True):
+    """
+    Reduce la memoria del dataset con el tipo más pequeño seguro por columna
+
+    - Texto con pocos valores distintos (PLAN, SEDE, NODO_INICIO, MUNICIPIO_...) → category
+    - Indicadoras 0/1 (one-hot, binarias codificadas) → bool, o bool disperso si ``dispersas``
+    - Enteros de rango pequeño (ESTRATO, NUMERO_MATRICULAS, EDAD) → int8/int16/int32,
+      también floats sin decimales ni nulos
+    - float64 → float32 solo si el error relativo es ≤ ``tolerancia`` (0 = sin pérdida)
+
+    El cambio es reversible con ``restaurar_tipos`` y, con ``validar``, se
+    comprueba columna por columna antes de devolverlo.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dataset a optimizar
+    max_proporcion_categorias : float
+        Máxima proporción de valores distintos / no nulos para convertir texto a category
+    tolerancia : float
+        Error relativo admitido al pasar a float32 (p. ej. 1e-6 para variables escaladas;
+        los árboles de sklearn convierten X a float32 de todos modos)
+    dispersas : bool
+        Guardar indicadoras con densidad ≤ ``densidad_maxima`` como SparseDtype
+    densidad_maxima : float
+        Proporción máxima de unos para guardar una indicadora dispersa
+    excluir : iterable
+        Columnas que no se modifican (por defecto el target, para que siga siendo 0/1 entero)
+    validar : bool
+        Verificar que restaurar los tipos devuelve los valores originales
+
+    Returns:
+    --------
+    tuple : (df_optimizado, plan) con plan = {columna: dtype original}
+    """
+    excluir = set(excluir or ())
+    plan = {}
+    columnas = {}
+    for col in df.columns:
+        if col in excluir:
+            continue
+        nuevo = _tipo_compacto(df[col], max_proporcion_categorias, tolerancia, dispersas, densidad_maxima)
+        if nuevo is None:
+            continue
+        plan[col] = str(df[col].dtype)
+        columnas[col] = df[col].astype(nuevo)
+
+    optimizado = df.assign(**columnas) if columnas else df.copy(deep=False)
+
+    bytes_antes = int(_bytes_columnas(df).sum())
+    bytes_despues = int(_bytes_columnas(optimizado).sum())
+    print(f"🗜️ Tipos optimizados: {len(plan)} de {df.shape[1]} columnas")
+    print(f"   Memoria: {bytes_antes / 1024 ** 2:,.1f} MB → {bytes_despues / 1024 ** 2:,.1f} MB "
+          f"({bytes_antes - bytes_despues:,} bytes ahorrados, "
+          f"{100 * (1 - bytes_despues / max(bytes_antes, 1)):.1f}%)")
+
+    if validar and plan:
+        reporte = validar_tipos(df, optimizado, plan, tolerancia)
+        invalidas = reporte.index[~reporte['valida']].tolist()
+        if invalidas:
+            raise ValueError(f"La optimización de tipos alteró los valores de: {invalidas}")
+        print(f"   ✓ Validado: restaurar los tipos reproduce las {len(plan)} columnas originales")
+    return optimizado, plan
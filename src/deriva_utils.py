@@ -0,0 +1,583 @@
+"""
+Monitor de deriva de características y predicciones entre semestres
+Histogramas compactos por característica, por atribución SHAP y de la
+probabilidad predicha, construidos con los datos de entrenamiento y guardados
+junto al modelo; un semestre nuevo se compara con PSI y KS en una sola pasada
+por bloques, sin volver a cargar los datos de entrenamiento
+
+Uso:
+    python src/deriva_utils.py balanced_random_forest data/processed/df_objetivo/2025-1.xlsx
+    (sale con código 1 si la evidencia recomienda reentrenar)
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from eda_utils import _iterar_bloques, leer_por_bloques  # noqa: E402
+from pipeline_utils import ONEHOT_VARS  # noqa: E402
+
+N_CUANTILES = 100        # 99 cortes interiores: KS con resolución de un percentil
+N_BINS_PSI = 10          # el PSI se calcula sobre los deciles de referencia
+MAX_CATEGORIAS = 20      # con pocos valores distintos cada valor es su propio bin
+EPSILON = 1e-4           # proporción mínima por bin para que el PSI no diverja
+C_KS = 1.628             # valor crítico de KS de dos muestras con alfa = 0.01
+
+# Convención habitual del PSI: < 0.1 estable, 0.1–0.25 moderada, > 0.25 significativa
+UMBRALES_PSI = {'moderada': 0.1, 'significativa': 0.25}
+UMBRAL_KS = 0.15         # con miles de filas KS detecta diferencias sin importancia práctica
+GRUPOS = ('prediccion', 'caracteristica', 'shap')
+
+
+class Histograma:
+    """
+    Conteos de una variable en cortes fijos tomados de la referencia
+
+    Con cortes en los percentiles de entrenamiento (o en los valores distintos
+    si son pocos) basta con contar en qué bin cae cada valor nuevo: memoria
+    constante, fusionable entre bloques y con la FDA exacta en cada corte.
+
+    Parameters:
+    -----------
+    cortes : array-like
+        Límites interiores; el bin i contiene los valores en [cortes[i-1], cortes[i])
+    discreta : bool
+        True si cada bin es un valor (o categoría) de la referencia
+    """
+
+    def __init__(self, cortes, discreta=False):
+        self.cortes = np.asarray(cortes, dtype=np.float64)
+        self.discreta = discreta
+        self.conteos = np.zeros(len(self.cortes) + 1, dtype=np.int64)
+        self.nulos = 0
+        self.suma = 0.0
+
+    @classmethod
+    def desde_referencia(cls, valores, n_cuantiles=N_CUANTILES, max_categorias=MAX_CATEGORIAS,
+                         n_categorias=None):
+        """
+        Histograma de referencia con sus propios cortes
+
+        Parameters:
+        -----------
+        valores : array-like
+            Valores de referencia (los NaN cuentan como nulos)
+        n_cuantiles : int
+            Cortes en los percentiles 1/n … (n-1)/n para variables continuas
+        max_categorias : int
+            Hasta cuántos valores distintos se trata la variable como discreta
+        n_categorias : int, optional
+            Códigos 0 … n-1 de una variable categórica (incluye los que la
+            referencia no trae)
+        """
+        valores = np.asarray(valores, dtype=np.float64)
+        validos = valores[~np.isnan(valores)]
+        if n_categorias is not None:
+            return cls(np.arange(n_categorias - 1) + 0.5, discreta=True).agregar(valores)
+        distintos = np.unique(validos)
+        if len(distintos) <= max_categorias:
+            return cls((distintos[:-1] + distintos[1:]) / 2, discreta=True).agregar(valores)
+        cortes = np.unique(np.quantile(validos, np.arange(1, n_cuantiles) / n_cuantiles))
+        return cls(cortes).agregar(valores)
+
+    def vacio(self):
+        """Histograma con los mismos cortes y sin conteos"""
+        return Histograma(self.cortes, self.discreta)
+
+    def agregar(self, valores):
+        """Cuenta un bloque de valores"""
+        valores = np.asarray(valores, dtype=np.float64)
+        nulos = np.isnan(valores)
+        validos = valores[~nulos]
+        self.nulos += int(nulos.sum())
+        self.conteos += np.bincount(np.searchsorted(self.cortes, validos, side='right'),
+                                    minlength=len(self.conteos))
+        self.suma += float(validos.sum())
+        return self
+
+    def fusionar(self, otro):
+        """Suma los conteos de otro histograma con los mismos cortes"""
+        if not np.array_equal(self.cortes, otro.cortes):
+            raise ValueError("Solo se pueden fusionar histogramas con los mismos cortes")
+        self.conteos += otro.conteos
+        self.nulos += otro.nulos
+        self.suma += otro.suma
+        return self
+
+    @property
+    def n(self):
+        return int(self.conteos.sum())
+
+    @property
+    def media(self):
+        return self.suma / self.n if self.n else np.nan
+
+
+def _agrupar_psi(proporciones_ref, n_bins):
+    """Grupo de cada bin fino: los bins que empiezan en el mismo n-cuantil de la referencia"""
+    inicio = np.concatenate([[0.0], np.cumsum(proporciones_ref)[:-1]])
+    return np.minimum((inicio * n_bins + 1e-9).astype(np.int64), n_bins - 1)
+
+
+def psi(proporciones_ref, proporciones_nuevas, epsilon=EPSILON):
+    """Population Stability Index entre dos distribuciones sobre los mismos bins"""
+    p = np.maximum(np.asarray(proporciones_ref, dtype=np.float64), epsilon)
+    q = np.maximum(np.asarray(proporciones_nuevas, dtype=np.float64), epsilon)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def comparar_histogramas(referencia, nuevo, n_bins_psi=N_BINS_PSI):
+    """
+    PSI y KS entre un histograma de referencia y uno nuevo con los mismos cortes
+
+    El PSI usa los deciles de referencia (o las categorías si la variable es
+    discreta) más un bin de nulos; KS es la máxima distancia entre las FDA
+    evaluadas en los cortes, exacta en ellos y con resolución de un percentil.
+
+    Returns:
+    --------
+    dict : psi, ks, ks_critico (alfa = 0.01) y n de cada lado
+    """
+    n_ref, n_nuevo = referencia.n, nuevo.n
+    total_ref, total_nuevo = n_ref + referencia.nulos, n_nuevo + nuevo.nulos
+    if n_ref == 0 or n_nuevo == 0:
+        return {'psi': np.nan, 'ks': np.nan, 'ks_critico': np.nan, 'n_ref': n_ref, 'n_nuevo': n_nuevo}
+
+    conteos_ref, conteos_nuevos = referencia.conteos, nuevo.conteos
+    if not referencia.discreta:
+        grupos = _agrupar_psi(conteos_ref / n_ref, n_bins_psi)
+        conteos_ref = np.bincount(grupos, conteos_ref, minlength=n_bins_psi)
+        conteos_nuevos = np.bincount(grupos, conteos_nuevos, minlength=n_bins_psi)
+    if referencia.nulos or nuevo.nulos:
+        conteos_ref = np.append(conteos_ref, referencia.nulos)
+        conteos_nuevos = np.append(conteos_nuevos, nuevo.nulos)
+
+    fda_ref = np.cumsum(referencia.conteos)[:-1] / n_ref
+    fda_nueva = np.cumsum(nuevo.conteos)[:-1] / n_nuevo
+    return {
+        'psi': psi(conteos_ref / total_ref, conteos_nuevos / total_nuevo),
+        'ks': float(np.max(np.abs(fda_ref - fda_nueva))) if len(fda_ref) else 0.0,
+        'ks_critico': C_KS * np.sqrt((n_ref + n_nuevo) / (n_ref * n_nuevo)),
+        'n_ref': n_ref,
+        'n_nuevo': n_nuevo,
+    }
+
+
+def grupos_onehot(columnas, variables=ONEHOT_VARS):
+    """
+    Dummies de cada variable one-hot (p. ej. PLAN_<código>) presentes en ``columnas``
+
+    Se vigilan como una sola variable categórica en lugar de cientos de
+    columnas binarias; su atribución SHAP es la suma de la de sus dummies.
+    """
+    grupos = {}
+    for variable in variables:
+        dummies = [c for c in columnas if str(c).startswith(f"{variable}_")]
+        if dummies:
+            grupos[variable] = dummies
+    return grupos
+
+
+def _codigo_grupo(matriz):
+    """Categoría de cada fila: 0 si todas las dummies son 0 (categoría omitida), i+1 si la i-ésima es 1"""
+    return np.where(matriz.max(axis=1) > 0, matriz.argmax(axis=1) + 1, 0)
+
+
+def _tabla_variables(X, columnas, grupos):
+    """Columnas sueltas como float64 y cada grupo one-hot como su código de categoría"""
+    agrupadas = {c for dummies in grupos.values() for c in dummies}
+    tabla = {c: X[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columnas
+             if c in X.columns and c not in agrupadas}
+    for variable, dummies in grupos.items():
+        if all(c in X.columns for c in dummies):
+            tabla[variable] = _codigo_grupo(X[dummies].to_numpy(dtype=np.float64)).astype(np.float64)
+    return tabla
+
+
+def _tabla_shap(valores, columnas, grupos):
+    """Atribución SHAP por variable: las de un grupo one-hot se suman (SHAP es aditivo)"""
+    posicion = {c: j for j, c in enumerate(columnas)}
+    agrupadas = {c for dummies in grupos.values() for c in dummies}
+    tabla = {c: valores[:, j] for c, j in posicion.items() if c not in agrupadas}
+    for variable, dummies in grupos.items():
+        tabla[variable] = valores[:, [posicion[c] for c in dummies]].sum(axis=1)
+    return tabla
+
+
+def admite_shap(modelo):
+    """
+    True si TreeExplainer acepta el modelo (p. ej. no una regresión logística)
+
+    El explainer construido queda en la caché de shap_utils, así que el
+    cálculo posterior no lo vuelve a crear.
+    """
+    from shap_utils import ExplicadorSHAP
+
+    try:
+        ExplicadorSHAP(modelo).explainer
+    except Exception as error:  # shap lanza InvalidModelError u otros según la versión
+        print(f"⚠️  TreeExplainer no admite {type(modelo).__name__}: perfil sin atribuciones SHAP ({error})")
+        return False
+    return True
+
+
+def _valores_shap(modelo, X, clase):
+    from shap_utils import ExplicadorSHAP
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ExplicadorSHAP(modelo).valores_clase(X, clase=clase)
+
+
+class PerfilDeriva:
+    """
+    Huella compacta de la distribución de entrenamiento de un modelo
+
+    Guarda un ``Histograma`` por característica (los grupos one-hot como una
+    variable categórica), uno por atribución SHAP y uno de la probabilidad
+    predicha. Ocupa unos pocos KB por variable sin importar el número de filas.
+
+    Parameters:
+    -----------
+    n_cuantiles : int
+        Cortes por variable continua
+    max_categorias : int
+        Valores distintos a partir de los cuales una variable es continua
+    muestras_shap : int
+        Filas de referencia sobre las que se calculan los valores SHAP (0 para omitirlos)
+    random_state : int
+    """
+
+    def __init__(self, n_cuantiles=N_CUANTILES, max_categorias=MAX_CATEGORIAS, muestras_shap=500,
+                 random_state=42):
+        self.n_cuantiles = n_cuantiles
+        self.max_categorias = max_categorias
+        self.muestras_shap = muestras_shap
+        self.random_state = random_state
+
+    def _histograma(self, variable, valores):
+        n_categorias = len(self.grupos_[variable]) + 1 if variable in self.grupos_ else None
+        return Histograma.desde_referencia(valores, self.n_cuantiles, self.max_categorias, n_categorias)
+
+    def ajustar(self, X, modelo=None, X_prediccion=None, clase=1, grupos=None):
+        """
+        Construir los histogramas de referencia
+
+        Parameters:
+        -----------
+        X : pandas.DataFrame
+            Datos de entrenamiento con las columnas del modelo
+        modelo : estimador con predict_proba, optional
+            Sin modelo solo se perfilan las características
+        X_prediccion : pandas.DataFrame, optional
+            Datos para las referencias de predicción y SHAP; conviene el
+            conjunto de prueba, porque las probabilidades de un bosque sobre
+            sus propias filas de entrenamiento están sesgadas hacia 0 y 1
+        clase : int
+            Clase cuya probabilidad y atribución se vigilan
+        grupos : dict, optional
+            Variable → dummies (por defecto ``grupos_onehot(X.columns)``)
+
+        Returns:
+        --------
+        PerfilDeriva : self
+        """
+        inicio = time.time()
+        X_prediccion = X_prediccion if X_prediccion is not None else X
+        self.columnas_ = list(X.columns)
+        self.grupos_ = grupos if grupos is not None else grupos_onehot(self.columnas_)
+        self.clase = clase
+        self.n_referencia_ = len(X)
+        self.caracteristicas_ = {variable: self._histograma(variable, valores)
+                                 for variable, valores in _tabla_variables(X, self.columnas_, self.grupos_).items()}
+        self.prediccion_ = None
+        self.shap_ = {}
+        self.importancia_ = pd.Series(dtype=np.float64)
+        if modelo is not None:
+            proba = modelo.predict_proba(X_prediccion[self.columnas_])[:, clase]
+            self.prediccion_ = Histograma.desde_referencia(proba, self.n_cuantiles, self.max_categorias)
+            if self.muestras_shap and admite_shap(modelo):
+                n = min(self.muestras_shap, len(X_prediccion))
+                muestra = X_prediccion[self.columnas_].sample(n, random_state=self.random_state)
+                tabla = _tabla_shap(_valores_shap(modelo, muestra, clase), self.columnas_, self.grupos_)
+                self.shap_ = {variable: Histograma.desde_referencia(valores, self.n_cuantiles, self.max_categorias)
+                              for variable, valores in tabla.items()}
+                self.importancia_ = pd.Series({variable: float(np.mean(np.abs(valores)))
+                                               for variable, valores in tabla.items()}).sort_values(ascending=False)
+        print(f"📐 Perfil de deriva: {len(self.caracteristicas_)} variables, "
+              f"{len(self.shap_)} atribuciones SHAP, {len(X):,} filas ({time.time() - inicio:.2f}s)")
+        return self
+
+    def monitor(self, modelo=None, shap=True, random_state=None):
+        """Monitor vacío para comparar un semestre nuevo con este perfil"""
+        return MonitorDeriva(self, modelo, shap, random_state)
+
+    def guardar(self, ruta):
+        """Guarda el perfil con joblib (p. ej. junto al modelo en el registro)"""
+        joblib.dump(self, ruta)
+        return ruta
+
+    @staticmethod
+    def cargar(ruta):
+        """Carga un perfil guardado con ``guardar``"""
+        return joblib.load(ruta)
+
+
+class MonitorDeriva:
+    """
+    Acumula un semestre nuevo bloque a bloque sobre los cortes de un ``PerfilDeriva``
+
+    Las características y las probabilidades se cuentan en cada bloque; para
+    SHAP se mantiene una muestra uniforme de ``perfil.muestras_shap`` filas
+    (las de menor clave aleatoria, fusionable entre bloques) y los valores se
+    calculan una sola vez al pedir el resultado.
+
+    Parameters:
+    -----------
+    perfil : PerfilDeriva
+        Referencia ajustada
+    modelo : estimador con predict_proba, optional
+        Necesario para la deriva de predicciones y de atribuciones
+    shap : bool
+        Comparar las atribuciones SHAP si el perfil las tiene (requiere un
+        estimador que TreeExplainer acepte, no un ``BosqueCompilado``)
+    random_state : int, optional
+    """
+
+    def __init__(self, perfil, modelo=None, shap=True, random_state=None):
+        self.perfil = perfil
+        self.modelo = modelo
+        self.caracteristicas = {v: h.vacio() for v, h in perfil.caracteristicas_.items()}
+        usar_modelo = modelo is not None and perfil.prediccion_ is not None
+        self.prediccion = perfil.prediccion_.vacio() if usar_modelo else None
+        self.usar_shap = usar_modelo and shap and bool(perfil.shap_)
+        self._rng = np.random.default_rng(random_state if random_state is not None else perfil.random_state)
+        self._muestra = None
+        self._claves = np.empty(0)
+        self.filas_ = 0
+
+    def agregar(self, X):
+        """
+        Contar un bloque del semestre nuevo
+
+        Parameters:
+        -----------
+        X : pandas.DataFrame
+            Bloque con las columnas del modelo (ya transformado por el pipeline)
+        """
+        for variable, valores in _tabla_variables(X, self.perfil.columnas_, self.perfil.grupos_).items():
+            if variable in self.caracteristicas:
+                self.caracteristicas[variable].agregar(valores)
+        if self.prediccion is not None:
+            X_modelo = X[self.perfil.columnas_]
+            self.prediccion.agregar(self.modelo.predict_proba(X_modelo)[:, self.perfil.clase])
+            if self.usar_shap:
+                self._muestrear(X_modelo)
+        self.filas_ += len(X)
+        return self
+
+    def _muestrear(self, X):
+        claves = self._rng.random(len(X))
+        muestra = X if self._muestra is None else pd.concat([self._muestra, X], ignore_index=True)
+        claves = np.concatenate([self._claves, claves])
+        if len(claves) > self.perfil.muestras_shap:
+            menores = np.argpartition(claves, self.perfil.muestras_shap)[:self.perfil.muestras_shap]
+            muestra, claves = muestra.iloc[menores], claves[menores]
+        self._muestra = muestra.reset_index(drop=True)
+        self._claves = claves
+
+    def resultado(self):
+        """
+        Comparación con la referencia
+
+        Returns:
+        --------
+        pandas.DataFrame : Grupo ('prediccion', 'caracteristica', 'shap'),
+                           Variable, PSI, KS, KS_critico, Deriva, Nulos_ref_%,
+                           Nulos_nuevo_%, Media_ref, Media_nueva e Importancia
+                           (media de |SHAP| en la referencia)
+        """
+        comparaciones = []
+        if self.prediccion is not None:
+            comparaciones.append(('prediccion', 'probabilidad', self.perfil.prediccion_, self.prediccion))
+        comparaciones += [('caracteristica', v, self.perfil.caracteristicas_[v], h)
+                          for v, h in self.caracteristicas.items()]
+        if self.usar_shap and self._muestra is not None:
+            tabla = _tabla_shap(_valores_shap(self.modelo, self._muestra, self.perfil.clase),
+                                self.perfil.columnas_, self.perfil.grupos_)
+            comparaciones += [('shap', v, referencia, referencia.vacio().agregar(tabla[v]))
+                              for v, referencia in self.perfil.shap_.items()]
+
+        filas = []
+        for grupo, variable, referencia, nuevo in comparaciones:
+            c = comparar_histogramas(referencia, nuevo)
+            filas.append({
+                'Grupo': grupo,
+                'Variable': variable,
+                'PSI': c['psi'],
+                'KS': c['ks'],
+                'KS_critico': c['ks_critico'],
+                'Deriva': _nivel_deriva(c['psi']),
+                'Nulos_ref_%': 100 * referencia.nulos / max(referencia.n + referencia.nulos, 1),
+                'Nulos_nuevo_%': 100 * nuevo.nulos / max(nuevo.n + nuevo.nulos, 1),
+                # La media de los códigos de un grupo one-hot no tiene interpretación
+                'Media_ref': np.nan if variable in self.perfil.grupos_ else referencia.media,
+                'Media_nueva': np.nan if variable in self.perfil.grupos_ else nuevo.media,
+                'Importancia': self.perfil.importancia_.get(variable, np.nan),
+            })
+        df = pd.DataFrame(filas)
+        if df.empty:
+            return df
+        df['_grupo'] = df['Grupo'].map({g: i for i, g in enumerate(GRUPOS)})
+        return df.sort_values(['_grupo', 'PSI'], ascending=[True, False]).drop(columns='_grupo') \
+                 .reset_index(drop=True)
+
+
+def _nivel_deriva(valor_psi):
+    if np.isnan(valor_psi):
+        return 'sin datos'
+    if valor_psi >= UMBRALES_PSI['significativa']:
+        return 'significativa'
+    if valor_psi >= UMBRALES_PSI['moderada']:
+        return 'moderada'
+    return 'estable'
+
+
+def decidir_reentrenamiento(tabla, umbral_psi=UMBRALES_PSI['significativa'], umbral_ks=UMBRAL_KS, top_n=10):
+    """
+    Recomendar reentrenar solo si hay evidencia de deriva relevante
+
+    Una variable deriva si su PSI supera ``umbral_psi`` o si KS supera a la vez
+    su valor crítico y ``umbral_ks``. Cuenta como evidencia la deriva de la
+    probabilidad predicha, la de una de las ``top_n`` características más
+    importantes según SHAP (todas si no hay SHAP) o la de sus atribuciones.
+
+    Parameters:
+    -----------
+    tabla : pandas.DataFrame
+        Resultado de ``MonitorDeriva.resultado()``
+    umbral_psi : float
+    umbral_ks : float
+    top_n : int
+
+    Returns:
+    --------
+    dict : reentrenar (bool), motivos (list de str) y variables (DataFrame con las que derivan)
+    """
+    deriva = (tabla['PSI'] >= umbral_psi) | ((tabla['KS'] > tabla['KS_critico']) & (tabla['KS'] >= umbral_ks))
+    relevante = tabla['Grupo'] == 'prediccion'
+    importancia = tabla.loc[tabla['Grupo'] == 'caracteristica', ['Variable', 'Importancia']].dropna()
+    if len(importancia):
+        importantes = set(importancia.nlargest(top_n, 'Importancia')['Variable'])
+        relevante |= tabla['Grupo'].isin(['caracteristica', 'shap']) & tabla['Variable'].isin(importantes)
+    else:
+        relevante |= tabla['Grupo'] == 'caracteristica'
+
+    variables = tabla.loc[deriva & relevante]
+    etiquetas = {'prediccion': 'predicción', 'caracteristica': 'característica', 'shap': 'atribución SHAP'}
+    motivos = [f"{etiquetas[fila.Grupo]} {fila.Variable}: PSI={fila.PSI:.3f}, KS={fila.KS:.3f}"
+               for fila in variables.itertuples()]
+    return {'reentrenar': bool(len(variables)), 'motivos': motivos, 'variables': variables.reset_index(drop=True)}
+
+
+def monitorear_semestre(fuente, nombre, version=None, directorio=None, tamano_bloque=50000, hoja=None,
+                        shap=True, umbral_psi=UMBRALES_PSI['significativa'], umbral_ks=UMBRAL_KS, top_n=10):
+    """
+    Comparar un semestre nuevo con el perfil guardado junto a un modelo registrado
+
+    Lee el archivo por bloques, aplica el pipeline guardado con el modelo (si
+    lo hay), cuenta cada bloque y libera; la memoria no depende del tamaño del
+    archivo ni de los datos de entrenamiento, que no se vuelven a cargar.
+
+    Parameters:
+    -----------
+    fuente : str, Path, pandas.DataFrame o iterable de DataFrames
+        Semestre nuevo con las columnas originales (o ya transformado si el
+        modelo se registró sin pipeline)
+    nombre : str
+        Modelo en el registro (ver ``registry_utils.registrar_modelo``)
+    version : int, optional
+        Por defecto la más reciente
+    directorio : str o Path, optional
+        Raíz del registro (por defecto models/)
+    tamano_bloque : int
+        Filas por bloque
+    hoja : str, optional
+        Hoja de Excel a leer
+    shap : bool
+        Comparar también las atribuciones SHAP (carga el estimador completo)
+    umbral_psi, umbral_ks, top_n :
+        Ver ``decidir_reentrenamiento``
+
+    Returns:
+    --------
+    dict : tabla (DataFrame de ``resultado()``), decision, filas y segundos
+    """
+    from registry_utils import cargar_deriva, cargar_modelo, cargar_pipeline
+
+    inicio = time.time()
+    perfil = cargar_deriva(nombre, version, directorio)
+    if perfil is None:
+        raise KeyError(f"'{nombre}' no tiene perfil de deriva registrado")
+    usar_shap = shap and bool(perfil.shap_)
+    with contextlib.redirect_stdout(io.StringIO()):
+        modelo, _ = cargar_modelo(nombre, version, compilado=not usar_shap, directorio=directorio)
+    pipeline = cargar_pipeline(nombre, version, directorio)
+
+    monitor = MonitorDeriva(perfil, modelo, shap=usar_shap)
+    bloques = leer_por_bloques(fuente, tamano_bloque, hoja) if isinstance(fuente, (str, Path)) \
+        else _iterar_bloques(fuente, tamano_bloque)
+    for bloque in bloques:
+        if pipeline is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                bloque = pipeline.transformar(bloque)
+        monitor.agregar(bloque)
+    tabla = monitor.resultado()
+    decision = decidir_reentrenamiento(tabla, umbral_psi, umbral_ks, top_n)
+    segundos = time.time() - inicio
+
+    print(f"=== DERIVA {nombre}: {monitor.filas_:,} filas nuevas vs {perfil.n_referencia_:,} "
+          f"de entrenamiento ({segundos:.2f}s) ===")
+    conteo = tabla['Deriva'].value_counts()
+    print(f"   Estables: {conteo.get('estable', 0)} | Moderadas: {conteo.get('moderada', 0)} | "
+          f"Significativas: {conteo.get('significativa', 0)}")
+    if decision['reentrenar']:
+        print("🔁 Se recomienda reentrenar:")
+        for motivo in decision['motivos']:
+            print(f"   - {motivo}")
+    else:
+        print("✅ Sin deriva relevante: el modelo actual sigue vigente")
+    return {'tabla': tabla, 'decision': decision, 'filas': monitor.filas_, 'segundos': segundos}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deriva de un semestre nuevo frente a un modelo registrado")
+    parser.add_argument('modelo', help="Nombre del modelo en el registro")
+    parser.add_argument('fuente', help="Archivo del semestre nuevo (.xlsx, .csv o .parquet)")
+    parser.add_argument('--version', type=int, default=None)
+    parser.add_argument('--directorio', default=None, help="Raíz del registro (por defecto models/)")
+    parser.add_argument('--hoja', default=None)
+    parser.add_argument('--sin-shap', action='store_true', help="No comparar las atribuciones SHAP")
+    parser.add_argument('--umbral-psi', type=float, default=UMBRALES_PSI['significativa'])
+    parser.add_argument('--salida', default=None, help="CSV donde guardar la tabla completa")
+    args = parser.parse_args(argv)
+
+    resultado = monitorear_semestre(args.fuente, args.modelo, args.version, args.directorio, hoja=args.hoja,
+                                    shap=not args.sin_shap, umbral_psi=args.umbral_psi)
+    if args.salida:
+        resultado['tabla'].to_csv(args.salida, index=False)
+    # Código 1 para encadenar el reentrenamiento: deriva_utils.py ... || python ejecutar_pipeline.py run ...
+    if resultado['decision']['reentrenar']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,33 +3,324 @@ Utilidades para análisis exploratorio de datos (EDA)
 Funciones para análisis automático de estructura de datasets
 """
 
+import hashlib
+from collections import Counter, OrderedDict
+
 import pandas as pd
 import numpy as np
-from collections import Counter
+
+from pathlib import Path
+
+from instrumentacion_utils import instrumentar, tramo
+from sketch_utils import (ConjuntoHashes, HyperLogLog, SketchDataset,
+                          combinar_dtypes, hashear_filas)
+
+
+ID_KEYWORDS = ['COD_', 'CODIGO', 'DOCUMENTO']
+# Incluye los tipos compactos de data_utils.optimizar_tipos
+NUMERIC_DTYPES = ['int8', 'int16', 'int32', 'int64', 'float32', 'float64']
+CUANTILES_COMPARACION = np.linspace(0, 1, 21)
+MAX_ESTADISTICAS_CACHE = 4096
+
+
+def _clasificar_columna(col, dtype, unicos):
+    """
+    Asigna el tipo de variable usado en los reportes a partir del nombre,
+    el dtype y el número de valores únicos (sin nulos) de la columna
+    """
+    if 'FECHA' in col.upper():
+        return 'fecha'
+    if any(keyword in col.upper() for keyword in ID_KEYWORDS):
+        return 'identificador'
+    if unicos == 2:
+        return 'binaria'
+    if dtype in NUMERIC_DTYPES:
+        return 'numerica'
+    return 'categorica'
+
+
+def _contar_duplicados(codigos, tamanos, n_filas):
+    """
+    Cuenta filas duplicadas combinando los códigos factorizados de cada columna
+    en una única clave entera (equivalente a ``df.duplicated().sum()``)
+    """
+    if n_filas == 0 or not codigos:
+        return 0
+
+    limite = np.iinfo(np.int64).max
+    clave = np.zeros(n_filas, dtype=np.int64)
+    base = 1
+    for codigo, tamano in zip(codigos, tamanos):
+        radix = tamano + 1  # +1 para el centinela de nulos (-1)
+        if base > limite // radix:
+            # Comprimir la clave acumulada antes de que desborde int64
+            clave, uniques = pd.factorize(clave)
+            clave = clave.astype(np.int64)
+            base = len(uniques)
+        clave = clave * radix + (codigo.astype(np.int64) + 1)
+        base *= radix
+
+    filas_unicas = len(pd.unique(clave))
+    return int(n_filas - filas_unicas)
+
+
+@instrumentar(filas='df')
+def perfilar_dataset(df, calcular_duplicados=True):
+    """
+    Calcula en una sola pasada por columna todas las estadísticas que usan los
+    reportes de estructura (nulos, únicos, mínimo/máximo, tipo, binarias, unicidad)
+    
+    Cada columna se factoriza una sola vez; los códigos resultantes se reutilizan
+    para contar nulos, valores únicos, valores binarios, extremos y, al final,
+    para detectar filas duplicadas sin volver a recorrer el DataFrame.
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dataset a perfilar
+    calcular_duplicados : bool
+        Si contar filas duplicadas completas a partir de los códigos
+        
+    Returns:
+    --------
+    dict : Perfil con 'dimensiones', 'memoria_kb', 'estadisticas' (DataFrame
+           indexado por columna), 'valores_binarios', 'duplicados' y 'descriptivas'
+    """
+    n_filas = len(df)
+    registros = []
+    valores_binarios = {}
+    codigos = []
+    tamanos = []
+
+    with tramo('factorizar', filas=n_filas, columnas=df.shape[1]):
+        for col in df.columns:
+            serie = df[col]
+            dtype = str(serie.dtype)
+            codigo, uniques = pd.factorize(serie, use_na_sentinel=True)
+            unicos = len(uniques)
+            nulos = int((codigo == -1).sum())
+            tipo = _clasificar_columna(col, dtype, unicos)
+
+            minimo = maximo = np.nan
+            if dtype in NUMERIC_DTYPES and unicos > 0:
+                valores = np.asarray(uniques)
+                minimo = valores.min()
+                maximo = valores.max()
+
+            if tipo == 'binaria':
+                # factorize conserva el orden de aparición, igual que unique()
+                valores_binarios[col] = np.asarray(uniques)
+
+            registros.append({
+                'columna': col,
+                'dtype': dtype,
+                'tipo': tipo,
+                'nulos': nulos,
+                'no_nulos': n_filas - nulos,
+                'unicos': unicos,
+                'minimo': minimo,
+                'maximo': maximo,
+                'es_unica': unicos == n_filas and nulos == 0,
+            })
+
+            if calcular_duplicados:
+                codigos.append(codigo)
+                tamanos.append(unicos)
+
+    estadisticas = pd.DataFrame(
+        registros,
+        columns=['columna', 'dtype', 'tipo', 'nulos', 'no_nulos', 'unicos',
+                 'minimo', 'maximo', 'es_unica']
+    ).set_index('columna')
+    # Conservar el tipo nativo de los extremos (int vs float) para el reporte
+    for extremo in ('minimo', 'maximo'):
+        estadisticas[extremo] = pd.Series(
+            [registro[extremo] for registro in registros], index=estadisticas.index, dtype=object
+        )
+
+    numeric_vars = estadisticas.index[estadisticas['tipo'] == 'numerica'].tolist()
+    with tramo('describe', filas=n_filas, columnas=len(numeric_vars)):
+        descriptivas = df[numeric_vars].describe() if numeric_vars else None
+    with tramo('memoria'):
+        memoria_kb = df.memory_usage(deep=True).sum() / 1024
+    with tramo('duplicados', filas=n_filas):
+        duplicados = _contar_duplicados(codigos, tamanos, n_filas) if calcular_duplicados else None
+
+    return {
+        'dimensiones': df.shape,
+        'memoria_kb': memoria_kb,
+        'estadisticas': estadisticas,
+        'valores_binarios': valores_binarios,
+        'duplicados': duplicados,
+        'descriptivas': descriptivas,
+    }
+
+
+def perfilar_dataset_aproximado(fuente, precision=14, k_frecuentes=64, k_cuantiles=512):
+    """
+    Versión con memoria acotada de ``perfilar_dataset`` basada en sketches fusionables
+    
+    Los valores únicos se estiman con HyperLogLog, las categorías frecuentes con
+    Misra-Gries, los duplicados con un HyperLogLog sobre hashes de fila y los
+    cuantiles de describe() con un sketch de compactación. Nulos, conteos,
+    mínimos, máximos, medias y desviaciones son exactos.
+    
+    Parameters:
+    -----------
+    fuente : pandas.DataFrame o sketch_utils.SketchDataset
+        Dataset a perfilar, o un sketch ya construido (por ejemplo, la fusión
+        de los sketches de varios archivos semestrales)
+    precision : int
+        Precisión de HyperLogLog (2**precision bytes por columna)
+    k_frecuentes : int
+        Contadores Misra-Gries por columna
+    k_cuantiles : int
+        Capacidad por nivel del sketch de cuantiles
+        
+    Returns:
+    --------
+    dict : Perfil con la misma estructura de ``perfilar_dataset`` más
+           'top_categorias' y 'cotas_error'
+    """
+    if isinstance(fuente, SketchDataset):
+        sketch = fuente
+    else:
+        sketch = SketchDataset(precision, k_frecuentes, k_cuantiles).agregar(fuente)
+    return _perfil_desde_sketch(sketch)
+
+
+def _perfil_desde_sketch(sketch):
+    """
+    Convierte un SketchDataset (exacto o aproximado) al formato de perfil
+    que consume ``_reporte_estructura``
+    """
+    n_filas = sketch.n_filas
+    registros = []
+    valores_binarios = {}
+    top_categorias = {}
+    descriptivas = {}
+
+    for col, estado in sketch.columnas.items():
+        dtype = str(estado['dtype'])
+        nulos = estado['nulos']
+        unicos = sketch.unicos(col)
+        tipo = _clasificar_columna(col, dtype, unicos)
+        momentos = estado['momentos']
+
+        minimo = maximo = np.nan
+        if dtype in NUMERIC_DTYPES and momentos.n > 0:
+            minimo, maximo = momentos.minimo, momentos.maximo
+
+        if tipo == 'binaria':
+            valores_binarios[col] = np.asarray(list(estado['frecuentes'].contadores))
+
+        if tipo in ('categorica', 'identificador'):
+            top_categorias[col] = estado['frecuentes'].top(10)
+
+        if tipo == 'numerica':
+            q25, q50, q75 = estado['cuantiles'].cuantiles([0.25, 0.5, 0.75])
+            descriptivas[col] = [momentos.n, momentos.media, momentos.desviacion,
+                                 momentos.minimo, q25, q50, q75, momentos.maximo]
+
+        # Con HLL solo se puede afirmar unicidad dentro del margen de error
+        margen = 2 * estado['hll'].error_relativo * (n_filas - nulos)
+        registros.append({
+            'columna': col,
+            'dtype': dtype,
+            'tipo': tipo,
+            'nulos': nulos,
+            'no_nulos': n_filas - nulos,
+            'unicos': unicos,
+            'minimo': minimo,
+            'maximo': maximo,
+            'es_unica': nulos == 0 and n_filas > 0 and unicos >= n_filas - margen,
+        })
+
+    estadisticas = pd.DataFrame(
+        registros,
+        columns=['columna', 'dtype', 'tipo', 'nulos', 'no_nulos', 'unicos',
+                 'minimo', 'maximo', 'es_unica']
+    ).set_index('columna')
+    for extremo in ('minimo', 'maximo'):
+        estadisticas[extremo] = pd.Series(
+            [registro[extremo] for registro in registros], index=estadisticas.index, dtype=object
+        )
+
+    perfil = {
+        'dimensiones': (n_filas, len(sketch.columnas)),
+        'memoria_kb': sketch.memoria_kb,
+        'estadisticas': estadisticas,
+        'valores_binarios': valores_binarios,
+        'duplicados': sketch.duplicados(),
+        'descriptivas': pd.DataFrame(
+            descriptivas, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        ) if descriptivas else None,
+        'top_categorias': top_categorias,
+    }
+    if sketch.exacto:
+        return perfil
+
+    error_hll = sketch.filas_hll.error_relativo
+    error_frecuentes = max((e['frecuentes'].error_maximo for e in sketch.columnas.values()), default=0)
+    error_cuantiles = max((e['cuantiles'].error_rango for e in sketch.columnas.values()), default=0.0)
+
+    perfil['cotas_error'] = {
+        'unicos_error_relativo': error_hll,
+        'duplicados_error_absoluto': int(np.ceil(error_hll * n_filas)),
+        'frecuentes_subestimacion_maxima': error_frecuentes,
+        'cuantiles_error_rango': error_cuantiles,
+    }
+    return perfil
 
 
+@instrumentar(filas='df')
 def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=True, 
                                target_candidates=['PAPA', 'PROME_ACADE', 'AVANCE_CARRERA', 
-                                                'NUMERO_MATRICULAS', 'PUNTAJE_ADMISION']):
+                                                'NUMERO_MATRICULAS', 'PUNTAJE_ADMISION'],
+                               modo='exacto', precision=14):
     """
     Realiza un análisis completo de la estructura de un dataset
     
     Parameters:
     -----------
     df : pandas.DataFrame
-        Dataset a analizar
+        Dataset a analizar (con modo='aproximado' también se acepta un
+        sketch_utils.SketchDataset, por ejemplo la fusión de varios semestres)
     nombre_dataset : str
         Nombre descriptivo del dataset para mostrar en el reporte
     mostrar_jerarquia : bool
         Si mostrar el análisis de estructura jerárquica
     target_candidates : list
         Lista de variables candidatas a ser target
+    modo : str
+        'exacto' (por defecto) o 'aproximado' para usar sketches de memoria
+        acotada (ver ``perfilar_dataset_aproximado``)
+    precision : int
+        Precisión de HyperLogLog en modo aproximado
         
     Returns:
     --------
     dict : Diccionario con los resultados del análisis
     """
-    
+    if modo == 'exacto':
+        perfil = perfilar_dataset(df)
+    elif modo == 'aproximado':
+        perfil = perfilar_dataset_aproximado(df, precision=precision)
+    else:
+        raise ValueError(f"modo debe ser 'exacto' o 'aproximado', se recibió '{modo}'")
+    with tramo('reporte'):
+        return _reporte_estructura(perfil, nombre_dataset, mostrar_jerarquia, target_candidates)
+
+
+def _reporte_estructura(perfil, nombre_dataset, mostrar_jerarquia, target_candidates):
+    """
+    Imprime el reporte de estructura y arma el diccionario de resultados
+    a partir de un perfil ya calculado (ver ``perfilar_dataset``)
+    """
+    n_filas, n_columnas = perfil['dimensiones']
+    stats = perfil['estadisticas']
+    columnas = stats.index.tolist()
+
     print("=" * 80)
     print(f"📊 ANÁLISIS DE ESTRUCTURA DEL {nombre_dataset.upper()}")
     print("=" * 80)
@@ -37,45 +328,31 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     # 1. DIMENSIONALIDAD
     print("\n🔢 1. DIMENSIONALIDAD")
     print("-" * 30)
-    print(f"Número de filas (registros): {df.shape[0]:,}")
-    print(f"Número de columnas (variables): {df.shape[1]:,}")
-    print(f"Total de celdas: {df.shape[0] * df.shape[1]:,}")
+    print(f"Número de filas (registros): {n_filas:,}")
+    print(f"Número de columnas (variables): {n_columnas:,}")
+    print(f"Total de celdas: {n_filas * n_columnas:,}")
 
     # 2. INFORMACIÓN GENERAL
-    print(f"\nTamaño en memoria: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+    print(f"\nTamaño en memoria: {perfil['memoria_kb']:.2f} KB")
+
+    cotas = perfil.get('cotas_error')
+    if cotas:
+        print("\nℹ️ Modo aproximado (sketches):")
+        print(f"   • Valores únicos: ±{cotas['unicos_error_relativo'] * 100:.2f}% (error estándar HyperLogLog)")
+        print(f"   • Filas duplicadas: ±{cotas['duplicados_error_absoluto']:,} filas (error estándar)")
+        print(f"   • Categorías frecuentes: subestimación máxima {cotas['frecuentes_subestimacion_maxima']:,}")
+        print(f"   • Cuantiles: error de rango ≤ {cotas['cuantiles_error_rango'] * 100:.2f}%")
 
     # 3. ANÁLISIS DE TIPOS DE VARIABLES
     print("\n📝 2. ANÁLISIS DE TIPOS DE VARIABLES")
     print("-" * 40)
 
-    # Identificar tipos de variables automáticamente
-    numeric_vars = []
-    categorical_vars = []
-    binary_vars = []
-    date_vars = []
-    id_vars = []
-
-    for col in df.columns:
-        # Verificar si es fecha
-        if 'FECHA' in col.upper():
-            date_vars.append(col)
-        # Verificar si es ID o código
-        elif any(keyword in col.upper() for keyword in ['COD_', 'CODIGO', 'DOCUMENTO']):
-            id_vars.append(col)
-        else:
-            # Analizar el contenido de la columna
-            non_null_values = df[col].dropna()
-            unique_values = non_null_values.unique()
-            
-            # Variables binarias (solo 2 valores únicos)
-            if len(unique_values) == 2:
-                binary_vars.append(col)
-            # Variables numéricas
-            elif df[col].dtype in ['int64', 'float64']:
-                numeric_vars.append(col)
-            # Variables categóricas
-            else:
-                categorical_vars.append(col)
+    # Tipos ya identificados por el perfil
+    numeric_vars = stats.index[stats['tipo'] == 'numerica'].tolist()
+    categorical_vars = stats.index[stats['tipo'] == 'categorica'].tolist()
+    binary_vars = stats.index[stats['tipo'] == 'binaria'].tolist()
+    date_vars = stats.index[stats['tipo'] == 'fecha'].tolist()
+    id_vars = stats.index[stats['tipo'] == 'identificador'].tolist()
 
     print(f"🔢 Variables Numéricas ({len(numeric_vars)}):")
     for var in numeric_vars:
@@ -83,12 +360,12 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
 
     print(f"\n📂 Variables Categóricas ({len(categorical_vars)}):")
     for var in categorical_vars:
-        unique_count = df[var].nunique()
+        unique_count = stats.at[var, 'unicos']
         print(f"   • {var} ({unique_count} categorías únicas)")
 
     print(f"\n⚡ Variables Binarias ({len(binary_vars)}):")
     for var in binary_vars:
-        values = df[var].dropna().unique()
+        values = perfil['valores_binarios'][var]
         print(f"   • {var} (valores: {', '.join(map(str, values))})")
 
     print(f"\n📅 Variables de Fecha ({len(date_vars)}):")
@@ -97,7 +374,7 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
 
     print(f"\n🔑 Variables Identificadoras/Códigos ({len(id_vars)}):")
     for var in id_vars:
-        unique_count = df[var].nunique()
+        unique_count = stats.at[var, 'unicos']
         print(f"   • {var} ({unique_count} valores únicos)")
 
     # 4. ANÁLISIS DE CLAVES ÚNICAS E IDENTIFICADORES
@@ -105,10 +382,7 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("-" * 50)
 
     # Buscar posibles claves primarias
-    primary_key_candidates = []
-    for col in df.columns:
-        if df[col].nunique() == len(df) and not df[col].isnull().any():
-            primary_key_candidates.append(col)
+    primary_key_candidates = stats.index[stats['es_unica']].tolist()
 
     print("🎯 Candidatos a Clave Primaria:")
     if primary_key_candidates:
@@ -118,7 +392,7 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
         print("   • No se encontraron claves primarias únicas")
 
     # Análisis de duplicados
-    duplicated_rows = df.duplicated().sum()
+    duplicated_rows = perfil['duplicados']
     print(f"\n📋 Análisis de Duplicados:")
     print(f"   • Filas duplicadas completas: {duplicated_rows}")
 
@@ -126,8 +400,8 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("\n🔗 Posibles Claves Foráneas (códigos con múltiples referencias):")
     foreign_key_candidates = []
     for col in id_vars:
-        unique_count = df[col].nunique()
-        total_count = len(df[col].dropna())
+        unique_count = stats.at[col, 'unicos']
+        total_count = stats.at[col, 'no_nulos']
         if unique_count < total_count and unique_count > 1:
             foreign_key_candidates.append((col, unique_count, total_count))
 
@@ -140,9 +414,9 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("-" * 40)
 
     missing_analysis = []
-    for col in df.columns:
-        missing_count = df[col].isnull().sum()
-        missing_pct = (missing_count / len(df)) * 100
+    for col in columnas:
+        missing_count = stats.at[col, 'nulos']
+        missing_pct = (missing_count / n_filas) * 100 if n_filas else 0.0
         if missing_count > 0:
             missing_analysis.append((col, missing_count, missing_pct))
 
@@ -158,9 +432,8 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("\n📈 5. ESTADÍSTICAS DESCRIPTIVAS DE VARIABLES NUMÉRICAS")
     print("-" * 55)
 
-    if numeric_vars:
-        numeric_stats = df[numeric_vars].describe()
-        print(numeric_stats.round(2))
+    if numeric_vars and perfil['descriptivas'] is not None:
+        print(perfil['descriptivas'].round(2))
     else:
         print("No hay variables numéricas para analizar")
 
@@ -168,16 +441,12 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("\n🎯 6. RESUMEN DE CARDINALIDAD (Top variables con más categorías)")
     print("-" * 65)
 
-    cardinality_analysis = []
-    for col in df.columns:
-        unique_count = df[col].nunique()
-        cardinality_analysis.append((col, unique_count))
-
+    cardinality_analysis = [(col, int(stats.at[col, 'unicos'])) for col in columnas]
     cardinality_analysis.sort(key=lambda x: x[1], reverse=True)
 
     print("Top 10 variables por número de valores únicos:")
     for i, (col, unique_count) in enumerate(cardinality_analysis[:10], 1):
-        percentage = (unique_count / len(df)) * 100
+        percentage = (unique_count / n_filas) * 100 if n_filas else 0.0
         print(f"{i:2d}. {col}: {unique_count} valores únicos ({percentage:.1f}% del total)")
 
     # 8. ANÁLISIS ESPECÍFICO PARA MACHINE LEARNING
@@ -185,20 +454,21 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     print("-" * 45)
 
     print("📊 Variables Target Potenciales:")
-    available_targets = [var for var in target_candidates if var in df.columns]
+    available_targets = [var for var in target_candidates if var in stats.index]
 
     for var in available_targets:
-        if df[var].dtype in ['int64', 'float64']:
-            non_null_count = df[var].count()
-            min_val = df[var].min()
-            max_val = df[var].max()
+        if stats.at[var, 'dtype'] in NUMERIC_DTYPES:
+            non_null_count = stats.at[var, 'no_nulos']
+            min_val = stats.at[var, 'minimo']
+            max_val = stats.at[var, 'maximo']
             print(f"   • {var}: {non_null_count} valores válidos, rango [{min_val} - {max_val}]")
 
     print(f"\n🔄 Variables que requieren preprocesamiento:")
     preprocessing_needed = []
 
     # Variables categóricas con alta cardinalidad
-    high_cardinality = [(col, df[col].nunique()) for col in categorical_vars if df[col].nunique() > 20]
+    high_cardinality = [(col, int(stats.at[col, 'unicos'])) for col in categorical_vars
+                        if stats.at[col, 'unicos'] > 20]
     if high_cardinality:
         print("   📂 Categóricas con alta cardinalidad (>20 categorías):")
         for col, count in high_cardinality:
@@ -243,14 +513,14 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
         for level in hierarchy_levels:
             if len(level) == 3:
                 code_col, name_col, description = level
-                if code_col in df.columns and name_col in df.columns:
-                    unique_codes = df[code_col].nunique()
-                    unique_names = df[name_col].nunique()
+                if code_col in stats.index and name_col in stats.index:
+                    unique_codes = stats.at[code_col, 'unicos']
+                    unique_names = stats.at[name_col, 'unicos']
                     print(f"   • {description}: {unique_codes} códigos, {unique_names} nombres")
             else:
                 col, description = level
-                if col in df.columns:
-                    unique_count = df[col].nunique()
+                if col in stats.index:
+                    unique_count = stats.at[col, 'unicos']
                     print(f"   • {description}: {unique_count} registros únicos")
 
     print("\n" + "=" * 80)
@@ -259,7 +529,7 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
 
     # Mostrar un resumen final
     print(f"\n📋 RESUMEN EJECUTIVO:")
-    print(f"   • Dataset con {df.shape[0]:,} registros y {df.shape[1]} variables")
+    print(f"   • Dataset con {n_filas:,} registros y {n_columnas} variables")
     print(f"   • {len(numeric_vars)} variables numéricas, {len(categorical_vars)} categóricas")
     print(f"   • {len(binary_vars)} variables binarias, {len(date_vars)} de fecha")
     print(f"   • {len(id_vars)} identificadores/códigos")
@@ -268,7 +538,7 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
     
     # Retornar resultados estructurados
     resultados = {
-        'dimensiones': df.shape,
+        'dimensiones': perfil['dimensiones'],
         'tipos_variables': {
             'numericas': numeric_vars,
             'categoricas': categorical_vars,
@@ -283,10 +553,14 @@ def analizar_estructura_dataset(df, nombre_dataset="Dataset", mostrar_jerarquia=
         'targets_disponibles': available_targets,
         'preprocesamiento_requerido': preprocessing_needed
     }
+    if cotas:
+        resultados['top_categorias'] = perfil['top_categorias']
+        resultados['cotas_error'] = cotas
     
     return resultados
 
 
+@instrumentar(filas='df')
 def analisis_rapido_dataset(df, nombre_dataset="Dataset"):
     """
     Versión simplificada del análisis para obtener solo información básica
@@ -306,25 +580,159 @@ def analisis_rapido_dataset(df, nombre_dataset="Dataset"):
     print("-" * 40)
     
     # Información básica
+    with tramo('memoria'):
+        memoria_kb = df.memory_usage(deep=True).sum() / 1024
     print(f"Dimensiones: {df.shape[0]:,} filas × {df.shape[1]} columnas")
-    print(f"Memoria: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+    print(f"Memoria: {memoria_kb:.2f} KB")
     
     # Tipos de datos
     tipos = df.dtypes.value_counts()
     print(f"Tipos de datos: {dict(tipos)}")
     
     # Valores faltantes
-    missing = df.isnull().sum().sum()
+    with tramo('faltantes', filas=len(df)):
+        missing = df.isnull().sum().sum()
     missing_pct = (missing / (df.shape[0] * df.shape[1])) * 100
     print(f"Valores faltantes: {missing} ({missing_pct:.2f}%)")
     
     # Duplicados
-    duplicados = df.duplicated().sum()
+    with tramo('duplicados', filas=len(df)):
+        duplicados = df.duplicated().sum()
     print(f"Filas duplicadas: {duplicados}")
     
     return {
         'shape': df.shape,
-        'memory_kb': df.memory_usage(deep=True).sum() / 1024,
+        'memory_kb': memoria_kb,
+        'dtypes': dict(tipos),
+        'missing_values': missing,
+        'missing_percent': missing_pct,
+        'duplicated_rows': duplicados
+    }
+
+
+def leer_por_bloques(ruta, tamano_bloque=50000, hoja=None, **kwargs):
+    """
+    Lee un archivo por bloques de filas sin cargarlo completo en memoria
+    
+    Parameters:
+    -----------
+    ruta : str o Path
+        Archivo .csv/.txt, .xlsx/.xlsm (openpyxl en modo read_only) o .parquet
+    tamano_bloque : int
+        Número de filas por bloque
+    hoja : str, optional
+        Hoja de Excel a leer (por defecto la hoja activa)
+    **kwargs :
+        Argumentos adicionales para ``pd.read_csv``
+        
+    Yields:
+    -------
+    pandas.DataFrame : Bloques consecutivos del archivo
+    """
+    extension = Path(ruta).suffix.lower()
+
+    if extension in ('.csv', '.txt'):
+        yield from pd.read_csv(ruta, chunksize=tamano_bloque, **kwargs)
+
+    elif extension in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            hoja_excel = libro[hoja] if hoja else libro.active
+            filas = hoja_excel.iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            if encabezado is None:
+                return
+            bloque = []
+            for fila in filas:
+                bloque.append(fila)
+                if len(bloque) == tamano_bloque:
+                    yield pd.DataFrame(bloque, columns=encabezado)
+                    bloque = []
+            if bloque:
+                yield pd.DataFrame(bloque, columns=encabezado)
+        finally:
+            libro.close()
+
+    elif extension == '.parquet':
+        import pyarrow.parquet as pq
+
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque):
+            yield lote.to_pandas()
+
+    else:
+        raise ValueError(f"Formato no soportado para lectura por bloques: '{extension}'")
+
+
+def _iterar_bloques(fuente, tamano_bloque):
+    """
+    Normaliza la fuente de datos a un iterador de DataFrames: acepta una ruta,
+    un DataFrame (que se recorre por bloques) o un iterable de DataFrames
+    """
+    if isinstance(fuente, (str, Path)):
+        return leer_por_bloques(fuente, tamano_bloque)
+    if isinstance(fuente, pd.DataFrame):
+        return (fuente.iloc[i:i + tamano_bloque] for i in range(0, max(len(fuente), 1), tamano_bloque))
+    return iter(fuente)
+
+
+def analisis_rapido_streaming(fuente, nombre_dataset="Dataset", tamano_bloque=50000, modo='exacto'):
+    """
+    Versión por bloques de ``analisis_rapido_dataset`` con memoria acotada
+    
+    Acumula dimensiones, memoria, tipos, faltantes y hashes de fila bloque a
+    bloque, de modo que nunca se necesita el archivo completo en memoria.
+    
+    Parameters:
+    -----------
+    fuente : str, Path, pandas.DataFrame o iterable de DataFrames
+        Archivo a leer por bloques (ver ``leer_por_bloques``) o bloques ya leídos
+    nombre_dataset : str
+        Nombre descriptivo del dataset
+    tamano_bloque : int
+        Filas por bloque al leer desde archivo
+    modo : str
+        'exacto' guarda un hash de 8 bytes por fila distinta para contar
+        duplicados; 'aproximado' usa HyperLogLog con memoria fija
+        
+    Returns:
+    --------
+    dict : Resumen básico del dataset (mismas claves que ``analisis_rapido_dataset``)
+    """
+    if modo not in ('exacto', 'aproximado'):
+        raise ValueError(f"modo debe ser 'exacto' o 'aproximado', se recibió '{modo}'")
+
+    filas_distintas = ConjuntoHashes() if modo == 'exacto' else HyperLogLog()
+    n_filas = 0
+    memoria_kb = 0.0
+    dtypes = {}
+    missing = 0
+
+    for bloque in _iterar_bloques(fuente, tamano_bloque):
+        n_filas += len(bloque)
+        memoria_kb += bloque.memory_usage(deep=True).sum() / 1024
+        for col, dtype in bloque.dtypes.items():
+            dtypes[col] = combinar_dtypes(dtypes[col], dtype) if col in dtypes else dtype
+        missing += int(bloque.isnull().sum().sum())
+        filas_distintas.agregar_hashes(hashear_filas(bloque))
+
+    n_columnas = len(dtypes)
+    duplicados = int(max(0, n_filas - round(filas_distintas.estimar())))
+    tipos = pd.Series(list(dtypes.values()), dtype=object).value_counts()
+    missing_pct = (missing / (n_filas * n_columnas)) * 100 if n_filas * n_columnas else 0.0
+
+    print(f"📊 RESUMEN RÁPIDO: {nombre_dataset}")
+    print("-" * 40)
+    print(f"Dimensiones: {n_filas:,} filas × {n_columnas} columnas")
+    print(f"Memoria: {memoria_kb:.2f} KB")
+    print(f"Tipos de datos: {dict(tipos)}")
+    print(f"Valores faltantes: {missing} ({missing_pct:.2f}%)")
+    print(f"Filas duplicadas: {duplicados}")
+
+    return {
+        'shape': (n_filas, n_columnas),
+        'memory_kb': memoria_kb,
         'dtypes': dict(tipos),
         'missing_values': missing,
         'missing_percent': missing_pct,
@@ -332,43 +740,253 @@ def analisis_rapido_dataset(df, nombre_dataset="Dataset"):
     }
 
 
-def comparar_datasets(df_antes, df_despues, nombre_antes="Dataset Original", nombre_despues="Dataset Procesado"):
+def analizar_estructura_streaming(fuente, nombre_dataset="Dataset", mostrar_jerarquia=True,
+                                  target_candidates=['PAPA', 'PROME_ACADE', 'AVANCE_CARRERA',
+                                                     'NUMERO_MATRICULAS', 'PUNTAJE_ADMISION'],
+                                  tamano_bloque=50000, modo='exacto', precision=14):
+    """
+    Versión por bloques de ``analizar_estructura_dataset`` con memoria acotada
+    
+    Cada bloque se incorpora a un SketchDataset fusionable. En modo 'exacto'
+    los únicos y duplicados se cuentan con conjuntos de hashes de 64 bits y el
+    diccionario de resultados coincide con el de ``analizar_estructura_dataset``;
+    los cuartiles impresos en describe() provienen del sketch de cuantiles.
+    En modo 'aproximado' toda la memoria queda fija (ver ``perfilar_dataset_aproximado``).
+    
+    Parameters:
+    -----------
+    fuente : str, Path, pandas.DataFrame o iterable de DataFrames
+        Archivo a leer por bloques (ver ``leer_por_bloques``) o bloques ya leídos
+    nombre_dataset : str
+        Nombre descriptivo del dataset para mostrar en el reporte
+    mostrar_jerarquia : bool
+        Si mostrar el análisis de estructura jerárquica
+    target_candidates : list
+        Lista de variables candidatas a ser target
+    tamano_bloque : int
+        Filas por bloque al leer desde archivo
+    modo : str
+        'exacto' o 'aproximado'
+    precision : int
+        Precisión de HyperLogLog en modo aproximado
+        
+    Returns:
+    --------
+    dict : Diccionario con los resultados del análisis
+    """
+    if modo not in ('exacto', 'aproximado'):
+        raise ValueError(f"modo debe ser 'exacto' o 'aproximado', se recibió '{modo}'")
+
+    sketch = SketchDataset(precision=precision, exacto=(modo == 'exacto'))
+    for bloque in _iterar_bloques(fuente, tamano_bloque):
+        sketch.agregar(bloque)
+
+    perfil = _perfil_desde_sketch(sketch)
+    return _reporte_estructura(perfil, nombre_dataset, mostrar_jerarquia, target_candidates)
+
+
+# Estadísticas por huella de columna, compartidas entre todas las comparaciones
+_ESTADISTICAS_CACHE = OrderedDict()
+
+
+def huella_columna(serie):
+    """
+    Huella de 128 bits del contenido y el dtype de una columna
+
+    Dos columnas con la misma huella tienen los mismos valores, en el mismo
+    orden y con el mismo tipo, así que sus estadísticas son idénticas.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(serie.dtype).encode())
+    h.update(pd.util.hash_pandas_object(serie, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _estadisticas_columna(serie):
+    """Nulos y distribución de una columna (cuantiles si es numérica, frecuencias si no)"""
+    nulos = int(serie.isna().sum())
+    estadisticas = {'dtype': str(serie.dtype), 'filas': len(serie), 'nulos': nulos}
+    valores = serie.dropna()
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = valores.astype(np.float64)
+        estadisticas['cuantiles'] = (np.quantile(valores.to_numpy(), CUANTILES_COMPARACION)
+                                     if len(valores) else None)
+    else:
+        estadisticas['frecuencias'] = valores.astype(str).value_counts(normalize=True)
+    return estadisticas
+
+
+def _estadisticas_cacheadas(serie, huella):
+    if huella in _ESTADISTICAS_CACHE:
+        _ESTADISTICAS_CACHE.move_to_end(huella)
+        return _ESTADISTICAS_CACHE[huella]
+    estadisticas = _estadisticas_columna(serie)
+    _ESTADISTICAS_CACHE[huella] = estadisticas
+    while len(_ESTADISTICAS_CACHE) > MAX_ESTADISTICAS_CACHE:
+        _ESTADISTICAS_CACHE.popitem(last=False)
+    return estadisticas
+
+
+def perfilar_columnas(df):
+    """
+    Huella y estadísticas de cada columna, reutilizables como referencia en
+    muchas llamadas a ``comparar_datasets``
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dataset de referencia (normalmente el "antes")
+        
+    Returns:
+    --------
+    dict : 'dimensiones' y 'columnas' (columna → {'huella', 'estadisticas'})
+    """
+    return {
+        'dimensiones': df.shape,
+        'columnas': {
+            col: {'huella': huella, 'estadisticas': _estadisticas_cacheadas(df[col], huella)}
+            for col, huella in ((col, huella_columna(df[col])) for col in df.columns)
+        },
+    }
+
+
+def _cambio_distribucion(antes, despues):
+    """
+    Magnitud del cambio de distribución entre dos columnas: desplazamiento
+    máximo de cuantiles relativo al rango intercuartílico para numéricas, y
+    distancia de variación total entre frecuencias para categóricas
+    """
+    if 'cuantiles' in antes and 'cuantiles' in despues:
+        qa, qd = antes['cuantiles'], despues['cuantiles']
+        if qa is None or qd is None:
+            return 0.0 if qa is qd else 1.0
+        escala = qa[15] - qa[5]  # percentiles 75 y 25
+        if escala <= 0:
+            escala = max(qa[-1] - qa[0], abs(qa[10]), 1.0)
+        return float(np.max(np.abs(qd - qa)) / escala)
+    fa = antes.get('frecuencias')
+    fd = despues.get('frecuencias')
+    if fa is None or fd is None:
+        # Cambió de numérica a categórica o al revés
+        return 1.0
+    return float(0.5 * fa.sub(fd, fill_value=0).abs().sum())
+
+
+def diferencias_columnas(referencia, df_despues, umbral_distribucion=0.1):
+    """
+    Diferencias por columna entre un perfil de referencia y un dataset nuevo
+    
+    Las columnas cuya huella coincide con la de la referencia se marcan como
+    sin cambios sin calcular nada más; solo las demás se perfilan (o se toman
+    de la caché por huella si ya se vieron en otra variante).
+    
+    Parameters:
+    -----------
+    referencia : dict o pandas.DataFrame
+        Perfil de ``perfilar_columnas`` o el dataset "antes"
+    df_despues : pandas.DataFrame
+        Dataset procesado a comparar
+    umbral_distribucion : float
+        Cambio de distribución a partir del cual se marca la columna
+        
+    Returns:
+    --------
+    pandas.DataFrame : Una fila por columna común con dtype, nulos y cambio
+                       de distribución antes/después y la lista de cambios
+    """
+    if isinstance(referencia, pd.DataFrame):
+        referencia = perfilar_columnas(referencia)
+
+    registros = []
+    for col, info in referencia['columnas'].items():
+        if col not in df_despues.columns:
+            continue
+        antes = info['estadisticas']
+        huella = huella_columna(df_despues[col])
+        if huella == info['huella']:
+            despues, distribucion, cambios = antes, 0.0, []
+        else:
+            despues = _estadisticas_cacheadas(df_despues[col], huella)
+            distribucion = _cambio_distribucion(antes, despues)
+            cambios = [nombre for nombre, cambio in (
+                ('dtype', antes['dtype'] != despues['dtype']),
+                ('nulos', antes['nulos'] != despues['nulos']),
+                ('distribucion', distribucion > umbral_distribucion),
+            ) if cambio] or ['valores']
+        registros.append({
+            'columna': col,
+            'dtype_antes': antes['dtype'],
+            'dtype_despues': despues['dtype'],
+            'nulos_antes': antes['nulos'],
+            'nulos_despues': despues['nulos'],
+            'cambio_distribucion': distribucion,
+            'sin_cambios': not cambios,
+            'cambios': cambios,
+        })
+
+    return pd.DataFrame(
+        registros,
+        columns=['columna', 'dtype_antes', 'dtype_despues', 'nulos_antes', 'nulos_despues',
+                 'cambio_distribucion', 'sin_cambios', 'cambios']
+    ).set_index('columna')
+
+
+@instrumentar(filas='df_despues')
+def comparar_datasets(df_antes, df_despues, nombre_antes="Dataset Original", nombre_despues="Dataset Procesado",
+                      umbral_distribucion=0.1):
     """
     Compara dos datasets y muestra las diferencias principales
     
     Parameters:
     -----------
-    df_antes : pandas.DataFrame
-        Dataset antes del procesamiento
+    df_antes : pandas.DataFrame o dict
+        Dataset antes del procesamiento, o su perfil de ``perfilar_columnas``
+        para reutilizarlo al comparar contra muchas variantes
     df_despues : pandas.DataFrame
         Dataset después del procesamiento
     nombre_antes : str
         Nombre del primer dataset
     nombre_despues : str
         Nombre del segundo dataset
+    umbral_distribucion : float
+        Cambio de distribución a partir del cual se reporta una columna
+        
+    Returns:
+    --------
+    pandas.DataFrame : Diferencias por columna común (ver ``diferencias_columnas``)
     """
+    with tramo('perfil_referencia'):
+        referencia = df_antes if isinstance(df_antes, dict) else perfilar_columnas(df_antes)
+    forma_antes = referencia['dimensiones']
+    with tramo('diferencias_columnas', filas=len(df_despues), columnas=df_despues.shape[1]) as t:
+        diferencias = diferencias_columnas(referencia, df_despues, umbral_distribucion)
+        t.registrar(columnas_cambiadas=int((~diferencias['sin_cambios']).sum()))
+
     print("🔄 COMPARACIÓN DE DATASETS")
     print("=" * 50)
     
     # Comparar dimensiones
     print(f"\n📏 DIMENSIONES:")
-    print(f"   {nombre_antes}: {df_antes.shape[0]:,} × {df_antes.shape[1]}")
+    print(f"   {nombre_antes}: {forma_antes[0]:,} × {forma_antes[1]}")
     print(f"   {nombre_despues}: {df_despues.shape[0]:,} × {df_despues.shape[1]}")
     
-    filas_diff = df_despues.shape[0] - df_antes.shape[0]
-    cols_diff = df_despues.shape[1] - df_antes.shape[1]
+    filas_diff = df_despues.shape[0] - forma_antes[0]
+    cols_diff = df_despues.shape[1] - forma_antes[1]
     print(f"   Diferencia: {filas_diff:+} filas, {cols_diff:+} columnas")
     
-    # Comparar valores faltantes
-    missing_antes = df_antes.isnull().sum().sum()
-    missing_despues = df_despues.isnull().sum().sum()
+    # Comparar valores faltantes (de la referencia cacheada y del diff por columna)
+    comunes = diferencias.index
+    missing_antes = sum(info['estadisticas']['nulos'] for info in referencia['columnas'].values())
+    missing_despues = int(diferencias['nulos_despues'].sum()) + sum(
+        int(df_despues[col].isna().sum()) for col in df_despues.columns if col not in comunes
+    )
     print(f"\n❓ VALORES FALTANTES:")
     print(f"   {nombre_antes}: {missing_antes}")
     print(f"   {nombre_despues}: {missing_despues}")
     print(f"   Reducción: {missing_antes - missing_despues} valores faltantes")
     
     # Comparar columnas
-    cols_antes = set(df_antes.columns)
+    cols_antes = set(referencia['columnas'])
     cols_despues = set(df_despues.columns)
     cols_nuevas = cols_despues - cols_antes
     cols_eliminadas = cols_antes - cols_despues
@@ -380,3 +998,15 @@ def comparar_datasets(df_antes, df_despues, nombre_antes="Dataset Original", nom
         print(f"   Columnas eliminadas ({len(cols_eliminadas)}): {', '.join(list(cols_eliminadas)[:5])}{'...' if len(cols_eliminadas) > 5 else ''}")
     
     print(f"   Columnas comunes: {len(cols_antes & cols_despues)}")
+    
+    # Cambios por columna común
+    cambiadas = diferencias[~diferencias['sin_cambios']]
+    print(f"\n🔍 CAMBIOS POR COLUMNA:")
+    print(f"   Sin cambios (misma huella): {len(diferencias) - len(cambiadas)}")
+    for tipo_cambio, etiqueta in [('dtype', 'Tipo de dato'), ('nulos', 'Valores faltantes'),
+                                  ('distribucion', 'Distribución')]:
+        columnas = cambiadas.index[cambiadas['cambios'].map(lambda c: tipo_cambio in c)].tolist()
+        if columnas:
+            print(f"   {etiqueta} ({len(columnas)}): {', '.join(map(str, columnas[:5]))}{'...' if len(columnas) > 5 else ''}")
+    
+    return diferencias
@@ -0,0 +1,686 @@
+"""
+Pipeline incremental por semestre: etapas con dependencias y recálculo selectivo
+Etiquetado → imputación → codificación → escalado → entrenamiento → SHAP → plots
+como un grafo de etapas; cada etapa tiene una huella de su código, parámetros
+y entradas, se omite si la huella no cambió y las independientes (RF, BRF,
+XGBoost) se ejecutan en paralelo
+
+Uso:
+    python ejecutar_pipeline.py run data/processed/df_objetivo/2024-1.xlsx data/processed/df_objetivo/2024-2.xlsx
+    python ejecutar_pipeline.py status data/processed/df_objetivo/2024-1.xlsx data/processed/df_objetivo/2024-2.xlsx
+"""
+
+import argparse
+import contextlib
+import hashlib
+import inspect
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from data_utils import hash_contenido, leer_excel_cacheado  # noqa: E402
+from instrumentacion_utils import tramo  # noqa: E402
+
+DIRECTORIO_SRC = Path(__file__).resolve().parent
+DIRECTORIO_RAIZ = DIRECTORIO_SRC.parent
+DIRECTORIO_ETAPAS = DIRECTORIO_RAIZ / "data" / "processed" / "cache" / "etapas"
+DIRECTORIO_PLOTS = DIRECTORIO_RAIZ / "results" / "visualizations" / "pipeline"
+MANIFIESTO = "etapas.json"
+
+TARGET = 'RIESGO_DESERCION'
+
+# Parámetros por defecto de cada etapa del proyecto (los de los notebooks 01-08);
+# ``etapas_proyecto(parametros=...)`` los sobrescribe por nombre de etapa
+PARAMETROS_ETAPAS = {
+    # Contrato de calidad (validacion_utils) evaluado por bloques al leer cada semestre
+    'lectura': {'validar': True, 'planes_conocidos': None},
+    'etiquetado': {'parametros_riesgo': None, 'deduplicar': True,
+                   'descartar': ['DOCUMENTO', 'REGLA_RIESGO', 'AVANCE_ESPERADO']},
+    'imputacion': {},
+    'codificacion': {},
+    'escalado': {'scaling_strategies': None},
+    'division': {'test_size': 0.3, 'random_state': 42},
+    # 07_model_training_smote.ipynb entrena el RF sobre SMOTE; BRF balancea por sí mismo.
+    # smote='aproximado' usa SMOTEAproximado (remuestreo_utils) para históricos grandes
+    'entrenamiento_rf': {'hiperparametros': {}, 'smote': True, 'random_state': 42},
+    'entrenamiento_brf': {'hiperparametros': {}, 'smote': False, 'random_state': 42},
+    'entrenamiento_xgb': {'hiperparametros': {'n_estimators': 100, 'max_depth': 3}, 'smote': False,
+                          'random_state': 42},
+    'shap': {'max_samples': 500, 'muestreo': 'estratificado'},
+    'plots': {'tipos': ['bar', 'beeswarm'], 'top_n': 10, 'dpi': 150},
+}
+
+
+class Etapa:
+    """
+    Una etapa del pipeline
+
+    La función recibe ``(entradas, **parametros)``, donde ``entradas`` es un
+    dict nombre de dependencia → resultado de esa etapa, y devuelve un
+    resultado serializable con joblib. Debe estar definida a nivel de módulo
+    para poder ejecutarse en otro proceso.
+
+    Parameters:
+    -----------
+    nombre : str
+    funcion : callable
+    dependencias : list
+        Nombres de las etapas cuyos resultados necesita, en orden
+    parametros : dict
+        Argumentos de la función; forman parte de la huella
+    archivos : list
+        Archivos externos que lee (p. ej. el .xlsx del semestre); su hash de
+        contenido forma parte de la huella
+    modulos : list
+        Módulos de src/ cuyo código usa la etapa (p. ej. 'pipeline_utils');
+        cambiar cualquiera de ellos invalida la etapa
+    """
+
+    def __init__(self, nombre, funcion, dependencias=(), parametros=None, archivos=(), modulos=()):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.dependencias = list(dependencias)
+        self.parametros = dict(parametros or {})
+        self.archivos = [str(a) for a in archivos]
+        self.modulos = list(modulos)
+
+    def __repr__(self):
+        return f"Etapa('{self.nombre}', dependencias={self.dependencias})"
+
+
+def _hash_texto(texto):
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def huella_codigo(etapa):
+    """Hash del código fuente de la función y de los módulos declarados por la etapa"""
+    partes = {'funcion': inspect.getsource(etapa.funcion)}
+    for modulo in etapa.modulos:
+        ruta = DIRECTORIO_SRC / f"{modulo}.py"
+        partes[modulo] = hash_contenido(ruta) if ruta.exists() else None
+    return _hash_texto(json.dumps(partes, sort_keys=True))
+
+
+def huella_etapa(etapa, hashes_entradas):
+    """
+    Huella de una etapa: código, parámetros, hash de contenido de cada archivo
+    externo y hash del resultado de cada dependencia
+
+    Se usa el hash del *resultado* de las dependencias, no su huella: si una
+    etapa se vuelve a ejecutar y produce exactamente lo mismo, las siguientes
+    no se recalculan.
+
+    Parameters:
+    -----------
+    etapa : Etapa
+    hashes_entradas : dict
+        Dependencia → hash de contenido de su resultado guardado
+
+    Returns:
+    --------
+    str : Hash hexadecimal de 32 caracteres
+    """
+    contenido = {
+        'codigo': huella_codigo(etapa),
+        'parametros': etapa.parametros,
+        'archivos': {ruta: hash_contenido(ruta) if os.path.exists(ruta) else None for ruta in etapa.archivos},
+        'entradas': {dep: hashes_entradas[dep] for dep in etapa.dependencias},
+    }
+    return _hash_texto(json.dumps(contenido, sort_keys=True, default=repr))
+
+
+def _orden_topologico(etapas):
+    """Etapas en orden de dependencias; error si falta una dependencia o hay un ciclo"""
+    por_nombre = {}
+    for etapa in etapas:
+        if etapa.nombre in por_nombre:
+            raise ValueError(f"Etapa repetida: '{etapa.nombre}'")
+        por_nombre[etapa.nombre] = etapa
+    for etapa in etapas:
+        faltantes = [d for d in etapa.dependencias if d not in por_nombre]
+        if faltantes:
+            raise ValueError(f"La etapa '{etapa.nombre}' depende de etapas inexistentes: {faltantes}")
+
+    orden, estado = [], {}
+
+    def visitar(nombre, camino):
+        if estado.get(nombre) == 'hecha':
+            return
+        if estado.get(nombre) == 'visitando':
+            raise ValueError(f"Ciclo de dependencias: {' → '.join(camino + [nombre])}")
+        estado[nombre] = 'visitando'
+        for dep in por_nombre[nombre].dependencias:
+            visitar(dep, camino + [nombre])
+        estado[nombre] = 'hecha'
+        orden.append(por_nombre[nombre])
+
+    for etapa in etapas:
+        visitar(etapa.nombre, [])
+    return orden
+
+
+def _ancestros(etapas, objetivos):
+    """Etapas necesarias para obtener ``objetivos`` (incluidos)"""
+    por_nombre = {e.nombre: e for e in etapas}
+    desconocidos = [o for o in objetivos if o not in por_nombre]
+    if desconocidos:
+        raise ValueError(f"Etapas desconocidas: {desconocidos}. Opciones: {list(por_nombre)}")
+    necesarias, pendientes = set(), list(objetivos)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre not in necesarias:
+            necesarias.add(nombre)
+            pendientes.extend(por_nombre[nombre].dependencias)
+    return [e for e in etapas if e.nombre in necesarias]
+
+
+def _leer_manifiesto(directorio):
+    ruta = directorio / MANIFIESTO
+    if not ruta.exists():
+        return {}
+    return json.loads(ruta.read_text(encoding='utf-8'))
+
+
+def _escribir_manifiesto(directorio, manifiesto):
+    # Escritura atómica: una ejecución interrumpida nunca deja el manifiesto a medias
+    temporal = directorio / f"{MANIFIESTO}.{os.getpid()}.tmp"
+    temporal.write_text(json.dumps(manifiesto, indent=2, ensure_ascii=False), encoding='utf-8')
+    os.replace(temporal, directorio / MANIFIESTO)
+
+
+def _vigente(registro, huella, directorio):
+    return (registro is not None and registro['huella'] == huella
+            and (directorio / registro['archivo']).exists())
+
+
+def _ejecutar_etapa(nombre, funcion, parametros, rutas_entradas, ruta_salida):
+    """
+    Ejecuta una etapa (en este proceso o en uno del pool): carga las entradas
+    desde disco, llama a la función y guarda el resultado de forma atómica
+
+    Returns:
+    --------
+    dict : 'hash' del resultado, 'segundos' y 'salida' (lo impreso por la etapa)
+    """
+    t0 = time.perf_counter()
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida), tramo('etapa', etapa=nombre):
+        entradas = {dep: joblib.load(ruta) for dep, ruta in rutas_entradas.items()}
+        resultado = funcion(entradas, **parametros)
+    temporal = Path(f"{ruta_salida}.{os.getpid()}.tmp")
+    joblib.dump(resultado, temporal, compress=0)
+    os.replace(temporal, ruta_salida)
+    return {'hash': hash_contenido(ruta_salida), 'segundos': time.perf_counter() - t0,
+            'salida': salida.getvalue()}
+
+
+def ejecutar_etapas(etapas, directorio=None, n_procesos=None, forzar=(), objetivos=None):
+    """
+    Ejecutar el grafo de etapas recalculando solo lo que cambió
+
+    Una etapa se reutiliza si su huella (ver ``huella_etapa``) coincide con la
+    de su última ejecución y su resultado sigue en disco. Las demás se lanzan
+    en cuanto sus dependencias terminan, hasta ``n_procesos`` a la vez. Si una
+    etapa falla, las que dependen de ella se marcan como bloqueadas y el resto
+    continúa.
+
+    Parameters:
+    -----------
+    etapas : list
+        Lista de ``Etapa``
+    directorio : str o Path, optional
+        Dónde guardar resultados y manifiesto (por defecto data/processed/cache/etapas)
+    n_procesos : int, optional
+        Etapas simultáneas (por defecto os.cpu_count(); 1 = en serie, en este proceso)
+    forzar : list
+        Etapas a recalcular aunque su huella no haya cambiado
+    objetivos : list, optional
+        Ejecutar solo estas etapas y sus dependencias
+
+    Returns:
+    --------
+    pandas.DataFrame : Etapa, Estado ('reutilizada', 'ejecutada', 'error' o
+                       'bloqueada'), Resultado_cambio, Segundos y Huella
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_ETAPAS
+    directorio.mkdir(parents=True, exist_ok=True)
+    etapas = _orden_topologico(etapas)
+    if objetivos:
+        etapas = _ancestros(etapas, objetivos)
+    forzar = set(forzar or ())
+    desconocidas = forzar - {e.nombre for e in etapas}
+    if desconocidas:
+        raise ValueError(f"No se puede forzar etapas que no están en el grafo: {sorted(desconocidas)}")
+    n_procesos = max(1, min(n_procesos or os.cpu_count() or 1, len(etapas)))
+
+    manifiesto = _leer_manifiesto(directorio)
+    pendientes = list(etapas)
+    hashes, filas, fallidas, en_curso = {}, {}, set(), {}
+    t0 = time.perf_counter()
+    print(f"=== PIPELINE INCREMENTAL: {len(etapas)} etapas ({n_procesos} procesos) ===")
+
+    def resolver_listas():
+        """Reutiliza o lanza cada etapa cuyas dependencias ya terminaron"""
+        avance = True
+        while avance:
+            avance = False
+            for etapa in list(pendientes):
+                if any(dep in fallidas for dep in etapa.dependencias):
+                    pendientes.remove(etapa)
+                    fallidas.add(etapa.nombre)
+                    filas[etapa.nombre] = {'Estado': 'bloqueada', 'Resultado_cambio': None,
+                                           'Segundos': 0.0, 'Huella': None}
+                    print(f"   ⛔ {etapa.nombre}: bloqueada por una dependencia con error")
+                    avance = True
+                    continue
+                if not all(dep in hashes for dep in etapa.dependencias):
+                    continue
+                pendientes.remove(etapa)
+                avance = True
+                huella = huella_etapa(etapa, hashes)
+                registro = manifiesto.get(etapa.nombre)
+                if etapa.nombre not in forzar and _vigente(registro, huella, directorio):
+                    hashes[etapa.nombre] = registro['hash']
+                    filas[etapa.nombre] = {'Estado': 'reutilizada', 'Resultado_cambio': False,
+                                           'Segundos': 0.0, 'Huella': huella}
+                    print(f"   ♻️  {etapa.nombre}: sin cambios")
+                    continue
+                argumentos = (etapa.nombre, etapa.funcion, etapa.parametros,
+                              {dep: directorio / manifiesto[dep]['archivo'] for dep in etapa.dependencias},
+                              directorio / f"{etapa.nombre}.joblib")
+                print(f"   ▶️  {etapa.nombre}: ejecutando")
+                if pool is None:
+                    futuro = Future()
+                    try:
+                        futuro.set_result(_ejecutar_etapa(*argumentos))
+                    except Exception as error:
+                        futuro.set_exception(error)
+                else:
+                    futuro = pool.submit(_ejecutar_etapa, *argumentos)
+                en_curso[futuro] = (etapa, huella)
+                if pool is None:
+                    return
+
+    def registrar(futuro):
+        etapa, huella = en_curso.pop(futuro)
+        try:
+            resultado = futuro.result()
+        except Exception as error:
+            fallidas.add(etapa.nombre)
+            filas[etapa.nombre] = {'Estado': 'error', 'Resultado_cambio': None, 'Segundos': None,
+                                   'Huella': huella}
+            detalle = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+            print(f"   ❌ {etapa.nombre}: {type(error).__name__}: {error}\n{detalle}")
+            return
+        anterior = manifiesto.get(etapa.nombre, {}).get('hash')
+        manifiesto[etapa.nombre] = {
+            'huella': huella,
+            'hash': resultado['hash'],
+            'archivo': f"{etapa.nombre}.joblib",
+            'segundos': round(resultado['segundos'], 3),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+        }
+        _escribir_manifiesto(directorio, manifiesto)
+        hashes[etapa.nombre] = resultado['hash']
+        cambio = resultado['hash'] != anterior
+        filas[etapa.nombre] = {'Estado': 'ejecutada', 'Resultado_cambio': cambio,
+                               'Segundos': resultado['segundos'], 'Huella': huella}
+        print(f"   ✓ {etapa.nombre} ({resultado['segundos']:.2f}s"
+              f"{'' if cambio else ', mismo resultado que antes'})")
+        for linea in resultado['salida'].rstrip().splitlines():
+            print(f"      {linea}")
+
+    with (ProcessPoolExecutor(max_workers=n_procesos) if n_procesos > 1
+          else contextlib.nullcontext()) as pool:
+        resolver_listas()
+        while en_curso:
+            if pool is None:
+                listos = list(en_curso)
+            else:
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                registrar(futuro)
+            resolver_listas()
+
+    resumen = pd.DataFrame([{'Etapa': e.nombre, **filas[e.nombre]} for e in etapas])
+    conteo = resumen['Estado'].value_counts()
+    print(f"✓ Pipeline en {time.perf_counter() - t0:.2f}s ("
+          + ", ".join(f"{estado}: {n}" for estado, n in conteo.items()) + ")")
+    return resumen
+
+
+def estado_etapas(etapas, directorio=None):
+    """
+    Qué etapas se ejecutarían, sin ejecutar nada
+
+    Returns:
+    --------
+    pandas.DataFrame : Etapa, Estado ('al día', 'desactualizada', 'nueva' o
+                       'pendiente de dependencias'), Fecha y Segundos de la última ejecución
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_ETAPAS
+    manifiesto = _leer_manifiesto(directorio)
+    hashes, filas = {}, []
+    for etapa in _orden_topologico(etapas):
+        registro = manifiesto.get(etapa.nombre)
+        if registro is None:
+            estado = 'nueva'
+        elif not all(dep in hashes for dep in etapa.dependencias):
+            estado = 'pendiente de dependencias'
+        elif _vigente(registro, huella_etapa(etapa, hashes), directorio):
+            estado = 'al día'
+            hashes[etapa.nombre] = registro['hash']
+        else:
+            estado = 'desactualizada'
+        filas.append({'Etapa': etapa.nombre, 'Estado': estado,
+                      'Fecha': registro['fecha'] if registro else None,
+                      'Segundos': registro['segundos'] if registro else None})
+    return pd.DataFrame(filas, columns=['Etapa', 'Estado', 'Fecha', 'Segundos'])
+
+
+def cargar_resultado(nombre, directorio=None):
+    """Resultado guardado de la última ejecución de una etapa"""
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_ETAPAS
+    registro = _leer_manifiesto(directorio).get(nombre)
+    if registro is None:
+        raise KeyError(f"La etapa '{nombre}' no se ha ejecutado en {directorio}")
+    return joblib.load(directorio / registro['archivo'])
+
+
+# =================================================================
+# ETAPAS DEL PROYECTO
+# =================================================================
+
+def _etapa_lectura(entradas, ruta, hoja=None, validar=False, planes_conocidos=None):
+    ruta = Path(ruta)
+    if validar:
+        from validacion_utils import Contrato, leer_validado
+
+        return leer_validado(ruta, Contrato(planes_conocidos=planes_conocidos), hoja=hoja)
+    if ruta.suffix in ('.xlsx', '.xls'):
+        return leer_excel_cacheado(ruta, hoja=hoja)
+    if ruta.suffix == '.csv':
+        return pd.read_csv(ruta)
+    if ruta.suffix == '.parquet':
+        return pd.read_parquet(ruta)
+    if ruta.suffix == '.feather':
+        return pd.read_feather(ruta)
+    raise ValueError(f"Formato de fuente no soportado: {ruta.suffix}")
+
+
+def _etapa_reportados(entradas, ruta, hoja='Hoja2', columna='DOCUMENTO'):
+    documentos = _etapa_lectura(entradas, ruta, hoja)[columna].dropna()
+    return np.sort(pd.unique(documentos))
+
+
+def _etapa_etiquetado(entradas, parametros_riesgo=None, deduplicar=True, descartar=()):
+    """
+    Etiquetado del histórico completo
+
+    Los semestres llegan en el orden de ``fuentes`` (cronológico) y se
+    concatenan del más reciente al más antiguo: ``etiquetar_riesgo`` conserva
+    la primera fila de cada DOCUMENTO, así que un estudiante que sigue
+    matriculado queda con su registro más reciente. El umbral de atraso por
+    percentil (``umbral_atraso=None``) se calcula sobre todos los semestres
+    juntos, no por semestre; para reproducir el del notebook se fija en
+    ``parametros_riesgo`` (17.86 para 2024-2).
+    """
+    from etiquetado_utils import etiquetar_riesgo
+
+    semestres = [df for nombre, df in entradas.items() if nombre.startswith('lectura')]
+    df = pd.concat(semestres[::-1], ignore_index=True) if len(semestres) > 1 else semestres[0]
+    df, _ = etiquetar_riesgo(df, parametros=parametros_riesgo, deduplicar=deduplicar,
+                             documentos_reportados=entradas.get('reportados'))
+    return df.drop(columns=[c for c in descartar if c in df.columns]).reset_index(drop=True)
+
+
+def _etapa_imputacion(entradas):
+    from pipeline_utils import COLUMNAS_ELIMINAR, ImputadorGrupos, _normalizar_categorias
+
+    df = entradas['etiquetado']
+    df = _normalizar_categorias(df.drop(columns=[c for c in COLUMNAS_ELIMINAR if c in df.columns]))
+    imputador = ImputadorGrupos().ajustar(df)
+    return {'imputador': imputador, 'datos': imputador.transformar(df)}
+
+
+def _etapa_codificacion(entradas):
+    from pipeline_utils import PipelinePreprocesamiento
+
+    pipeline = PipelinePreprocesamiento(target=TARGET)
+    pipeline.imputador_ = entradas['imputacion']['imputador']
+    datos = entradas['imputacion']['datos']
+    pipeline._ajustar_codificacion(datos)
+    return {'pipeline': pipeline, 'datos': pipeline._codificar(datos)}
+
+
+def _etapa_escalado(entradas, scaling_strategies=None):
+    from pipeline_utils import SCALING_STRATEGIES
+
+    pipeline = entradas['codificacion']['pipeline']
+    codificado = entradas['codificacion']['datos']
+    pipeline.scaling_strategies = dict(scaling_strategies or SCALING_STRATEGIES)
+    pipeline._ajustar_escalado(codificado)
+    pipeline.columnas_salida_ = codificado.columns.tolist()
+    pipeline.ajustado = True
+    # El pipeline queda completo: sirve para transformar() semestres nuevos
+    return {'pipeline': pipeline, 'datos': pipeline._escalar(codificado.copy())}
+
+
+def _etapa_division(entradas, test_size=0.3, random_state=42):
+    from sklearn.model_selection import train_test_split
+
+    df = entradas['escalado']['datos']
+    X = df.drop(columns=[TARGET])
+    no_numericas = X.select_dtypes(exclude=['number', 'bool']).columns.tolist()
+    if no_numericas:
+        print(f"⚠️ Columnas no numéricas fuera del modelo: {no_numericas}")
+        X = X.drop(columns=no_numericas)
+    X_train, X_test, y_train, y_test = train_test_split(X, df[TARGET], test_size=test_size,
+                                                        random_state=random_state, stratify=df[TARGET])
+    print(f"Entrenamiento: {len(X_train):,} filas | Prueba: {len(X_test):,} filas | {X.shape[1]} características")
+    return {'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test}
+
+
+def _etapa_entrenamiento(entradas, modelo, hiperparametros=None, smote=False, random_state=42):
+    from search_utils import modelo_base
+
+    division = entradas['division']
+    X_train, y_train = division['X_train'], division['y_train']
+    if smote == 'aproximado':
+        from remuestreo_utils import SMOTEAproximado
+        X_train, y_train = SMOTEAproximado(random_state=random_state).fit_resample(X_train, y_train)
+        print(f"SMOTE aproximado: {len(division['X_train']):,} → {len(X_train):,} filas")
+    elif smote:
+        from imblearn.over_sampling import SMOTE
+        X_train, y_train = SMOTE(random_state=random_state).fit_resample(X_train, y_train)
+        print(f"SMOTE: {len(division['X_train']):,} → {len(X_train):,} filas")
+    estimador = modelo_base(modelo, random_state=random_state).set_params(**(hiperparametros or {}))
+    return estimador.fit(X_train, y_train)
+
+
+def _etapa_evaluacion(entradas):
+    from registry_utils import metricas_modelo
+
+    division = entradas['division']
+    filas = []
+    for nombre, modelo in entradas.items():
+        if nombre.startswith('entrenamiento_'):
+            metricas = metricas_modelo(modelo, division['X_test'], division['y_test'])
+            filas.append({'Modelo': nombre.removeprefix('entrenamiento_'), **metricas})
+    evaluacion = pd.DataFrame(filas)
+    print(evaluacion.drop(columns=['matriz_confusion']).round(4).to_string(index=False))
+    return evaluacion
+
+
+def _etapa_shap(entradas, modelo, max_samples=500, muestreo='estratificado'):
+    from shap_utils import ExplicadorSHAP, seleccionar_muestra
+
+    division = entradas['division']
+    estimador = entradas[f'entrenamiento_{modelo}']
+    X_muestra, _ = seleccionar_muestra(estimador, division['X_test'], max_samples, muestreo,
+                                       y_test=division['y_test'])
+    importancias = pd.Series(estimador.feature_importances_, index=division['X_test'].columns)
+    return {'X': X_muestra, 'shap_values': ExplicadorSHAP(estimador).shap_values(X_muestra),
+            'importancias': importancias.sort_values(ascending=False)}
+
+
+def _etapa_plots(entradas, directorio=None, tipos=('bar', 'beeswarm'), top_n=10, dpi=150):
+    from shap_utils import renderizar_plots
+
+    tareas = []
+    for nombre, explicacion in entradas.items():
+        modelo = nombre.removeprefix('shap_')
+        for tipo in tipos:
+            tareas.append({'tipo': tipo, 'archivo': f"{modelo}_shap_{tipo}.png",
+                           'shap_values': explicacion['shap_values'], 'X': explicacion['X']})
+        tareas.append({'tipo': 'importancias', 'archivo': f"{modelo}_importancias.png",
+                       'importancias': explicacion['importancias'], 'top_n': top_n})
+    return renderizar_plots(tareas, directorio or DIRECTORIO_PLOTS, n_procesos=1, dpi=dpi)
+
+
+def _nombre_lectura(ruta):
+    return f"lectura_{Path(ruta).stem}"
+
+
+def etapas_proyecto(fuentes, reportados=None, parametros=None, modelos=('rf', 'brf', 'xgb'),
+                    modelos_shap=('brf',), directorio_plots=None):
+    """
+    Grafo de etapas de los notebooks 01 → 08
+
+    Cada archivo de ``fuentes`` (p. ej. uno por semestre) se lee en su propia
+    etapa, así que agregar un semestre solo parsea el archivo nuevo; luego
+    etiquetado, imputación, codificación, escalado, división, un entrenamiento
+    por modelo (independientes entre sí), evaluación, SHAP por modelo y plots.
+
+    Parameters:
+    -----------
+    fuentes : list
+        Archivos de datos crudos (.xlsx, .csv, .parquet o .feather) en orden
+        cronológico: con DOCUMENTO repetidos entre semestres se conserva la
+        fila del último
+    reportados : tuple, optional
+        (ruta, hoja) con los DOCUMENTO reportados (Hoja2 de 01_data_preparation)
+    parametros : dict, optional
+        Etapa → parámetros que sobrescriben PARAMETROS_ETAPAS; 'shap' aplica a
+        todas las etapas shap_<modelo>
+    modelos : list
+        Modelos a entrenar: 'rf', 'brf' y/o 'xgb'
+    modelos_shap : list
+        Modelos a explicar con SHAP (deben estar en ``modelos``)
+    directorio_plots : str o Path, optional
+        Carpeta de los .png (por defecto results/visualizations/pipeline)
+
+    Returns:
+    --------
+    list : Etapas listas para ``ejecutar_etapas``
+    """
+    if not fuentes:
+        raise ValueError("Se necesita al menos un archivo de datos")
+    parametros = parametros or {}
+    desconocidos = [m for m in modelos_shap if m not in modelos]
+    if desconocidos:
+        raise ValueError(f"Modelos para SHAP que no se entrenan: {desconocidos}")
+
+    def _parametros(nombre, base=None):
+        return {**PARAMETROS_ETAPAS.get(base or nombre, {}), **parametros.get(nombre, {})}
+
+    etapas = [Etapa(_nombre_lectura(ruta), _etapa_lectura, parametros={'ruta': str(ruta), **_parametros('lectura')},
+                    archivos=[ruta], modulos=['data_utils', 'eda_utils', 'validacion_utils']) for ruta in fuentes]
+    lecturas = [e.nombre for e in etapas]
+    if len(set(lecturas)) != len(lecturas):
+        raise ValueError(f"Hay fuentes con el mismo nombre de archivo: {lecturas}")
+    if reportados is not None:
+        ruta, hoja = reportados
+        etapas.append(Etapa('reportados', _etapa_reportados, parametros={'ruta': str(ruta), 'hoja': hoja},
+                            archivos=[ruta], modulos=['data_utils']))
+        lecturas.append('reportados')
+
+    etapas += [
+        Etapa('etiquetado', _etapa_etiquetado, lecturas, _parametros('etiquetado'),
+              modulos=['etiquetado_utils']),
+        Etapa('imputacion', _etapa_imputacion, ['etiquetado'], _parametros('imputacion'),
+              modulos=['pipeline_utils']),
+        Etapa('codificacion', _etapa_codificacion, ['imputacion'], _parametros('codificacion'),
+              modulos=['pipeline_utils']),
+        Etapa('escalado', _etapa_escalado, ['codificacion'], _parametros('escalado'),
+              modulos=['pipeline_utils']),
+        Etapa('division', _etapa_division, ['escalado'], _parametros('division')),
+    ]
+    for modelo in modelos:
+        nombre = f'entrenamiento_{modelo}'
+        parametros_modelo = {'modelo': modelo, **_parametros(nombre)}
+        modulos = ['search_utils'] + (['remuestreo_utils'] if parametros_modelo.get('smote') == 'aproximado' else [])
+        etapas.append(Etapa(nombre, _etapa_entrenamiento, ['division'], parametros_modelo, modulos=modulos))
+    etapas.append(Etapa('evaluacion', _etapa_evaluacion,
+                        ['division'] + [f'entrenamiento_{m}' for m in modelos],
+                        _parametros('evaluacion'), modulos=['registry_utils', 'search_utils']))
+    for modelo in modelos_shap:
+        etapas.append(Etapa(f'shap_{modelo}', _etapa_shap, ['division', f'entrenamiento_{modelo}'],
+                            {'modelo': modelo, **PARAMETROS_ETAPAS['shap'], **parametros.get('shap', {}),
+                             **parametros.get(f'shap_{modelo}', {})},
+                            modulos=['shap_utils']))
+    if modelos_shap:
+        plots = _parametros('plots')
+        plots['directorio'] = str(directorio_plots or plots.get('directorio') or DIRECTORIO_PLOTS)
+        etapas.append(Etapa('plots', _etapa_plots, [f'shap_{m}' for m in modelos_shap], plots,
+                            modulos=['shap_utils']))
+    return etapas
+
+
+def _argumentos_proyecto(parser):
+    parser.add_argument('fuentes', nargs='+', help="Archivos de datos crudos, p. ej. uno por semestre")
+    parser.add_argument('--reportados', default=None,
+                        help="RUTA[:HOJA] con los DOCUMENTO reportados (hoja por defecto: Hoja2)")
+    parser.add_argument('--config', default=None, help="JSON etapa → parámetros (ver PARAMETROS_ETAPAS)")
+    parser.add_argument('--modelos', nargs='+', default=['rf', 'brf', 'xgb'])
+    parser.add_argument('--shap', nargs='*', default=['brf'], help="Modelos a explicar con SHAP")
+    parser.add_argument('--directorio', default=None, help="Caché de etapas")
+    parser.add_argument('--plots', default=None, help="Carpeta de los plots")
+
+
+def _etapas_desde_argumentos(args):
+    reportados = None
+    if args.reportados:
+        ruta, _, hoja = args.reportados.partition(':')
+        reportados = (ruta, hoja or 'Hoja2')
+    parametros = json.loads(Path(args.config).read_text(encoding='utf-8')) if args.config else None
+    return etapas_proyecto(args.fuentes, reportados, parametros, args.modelos, args.shap, args.plots)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline incremental de deserción (notebooks 01 → 08)")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    run = subcomandos.add_parser('run', help="Ejecutar las etapas cuya huella cambió")
+    _argumentos_proyecto(run)
+    run.add_argument('--n-procesos', type=int, default=None)
+    run.add_argument('--forzar', nargs='*', default=[], help="Etapas a recalcular de todos modos")
+    run.add_argument('--hasta', nargs='*', default=None, help="Ejecutar solo estas etapas y sus dependencias")
+
+    status = subcomandos.add_parser('status', help="Mostrar qué etapas están al día, sin ejecutar")
+    _argumentos_proyecto(status)
+
+    args = parser.parse_args(argv)
+    etapas = _etapas_desde_argumentos(args)
+    if args.comando == 'run':
+        resumen = ejecutar_etapas(etapas, args.directorio, args.n_procesos, args.forzar, args.hasta)
+        if resumen['Estado'].isin(['error', 'bloqueada']).any():
+            sys.exit(1)
+    elif args.comando == 'status':
+        print(estado_etapas(etapas, args.directorio).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Etiquetado vectorizado de RIESGO_DESERCION a partir de una tabla de reglas
+Reproduce la derivación de 01_data_preparation.ipynb (AVANCE_ESPERADO,
+ATRASO_PORCENTUAL, umbral del percentil 80, condiciones por matrículas, PAPA y
+ESTRATO, y los DOCUMENTO reportados en Hoja2) en una sola pasada sobre arreglos
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+TARGET = 'RIESGO_DESERCION'
+COLUMNA_REGLA = 'REGLA_RIESGO'
+COLUMNA_DOCUMENTO = 'DOCUMENTO'
+SIN_REGLA = 'ninguna'
+REGLA_DOCUMENTO = 'documento_reportado'
+
+# Valores de 01_data_preparation.ipynb; umbral_atraso=None usa el percentil
+PARAMETROS_RIESGO = {
+    'factor_avance': 8,          # avance esperado = NUMERO_MATRICULAS × 8
+    'umbral_atraso': None,       # el notebook fija 17.86 (percentil 80 de 2024-2)
+    'percentil_umbral': 0.8,
+    'papa_minimo': 3.6,
+    'matriculas_novato': 4,
+    'pbm_bajo': 3,
+}
+
+# Cada regla es una conjunción de condiciones (columna, operador, valor); un
+# estudiante está en riesgo si cumple cualquier regla. Los valores de texto se
+# toman de los parámetros. El orden define qué regla se reporta si varias aplican.
+REGLAS_RIESGO = [
+    {'nombre': 'general', 'condiciones': [('NUMERO_MATRICULAS', '>', 'matriculas_novato'),
+                                          ('ATRASO_PORCENTUAL', '>', 'umbral_atraso'),
+                                          ('PAPA', '<', 'papa_minimo')]},
+    {'nombre': 'novato', 'condiciones': [('NUMERO_MATRICULAS', '<=', 'matriculas_novato'),
+                                         ('PAPA', '<', 'papa_minimo')]},
+    {'nombre': 'sin_papa_estrato_0', 'condiciones': [('PAPA', 'nulo', None),
+                                                     ('ESTRATO', '==', 0)]},
+    {'nombre': 'sin_papa_estrato_1_pbm_bajo', 'condiciones': [('PAPA', 'nulo', None),
+                                                              ('ESTRATO', '==', 1),
+                                                              ('PBM_CALCULADO', '<', 'pbm_bajo')]},
+]
+
+_OPERADORES = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+    'nulo': lambda x, _: np.isnan(x),
+    'no_nulo': lambda x, _: ~np.isnan(x),
+    'en': lambda x, valores: np.isin(x, valores),
+}
+
+
+def derivar_atraso(df, factor_avance=PARAMETROS_RIESGO['factor_avance']):
+    """
+    AVANCE_ESPERADO y ATRASO_PORCENTUAL (recortado en 0) como arreglos
+
+    Returns:
+    --------
+    tuple : (avance_esperado, atraso_porcentual) en float64
+    """
+    matriculas = df['NUMERO_MATRICULAS'].to_numpy(dtype=np.float64, na_value=np.nan)
+    avance = df['AVANCE_CARRERA'].to_numpy(dtype=np.float64, na_value=np.nan)
+    avance_esperado = matriculas * factor_avance
+    # np.maximum propagaría NaN igual que clip(lower=0)
+    atraso = np.maximum(avance_esperado - avance, 0)
+    return avance_esperado, atraso
+
+
+def compilar_reglas(reglas=REGLAS_RIESGO, parametros=None):
+    """
+    Resolver parámetros y deduplicar condiciones de una tabla de reglas
+
+    Cada condición distinta se evalúa una sola vez aunque aparezca en varias
+    reglas (p. ej. ``PAPA < 3.6`` o ``PAPA nulo``).
+
+    Parameters:
+    -----------
+    reglas : list
+        Dicts con 'nombre' y 'condiciones' [(columna, operador, valor)]
+    parametros : dict
+        Valores para las condiciones que nombran un parámetro
+
+    Returns:
+    --------
+    dict : 'nombres', 'columnas', 'condiciones' (únicas) y 'indices' (por regla)
+    """
+    parametros = {**PARAMETROS_RIESGO, **(parametros or {})}
+    condiciones = {}
+    indices = []
+    for regla in reglas:
+        propios = []
+        for columna, operador, valor in regla['condiciones']:
+            if operador not in _OPERADORES:
+                raise ValueError(f"Operador desconocido '{operador}' en la regla '{regla['nombre']}'")
+            if isinstance(valor, str):
+                if parametros.get(valor) is None:
+                    raise ValueError(f"El parámetro '{valor}' de la regla '{regla['nombre']}' no tiene valor")
+                valor = parametros[valor]
+            clave = (columna, operador, tuple(valor) if isinstance(valor, (list, tuple, set)) else valor)
+            propios.append(condiciones.setdefault(clave, len(condiciones)))
+        indices.append(propios)
+    return {
+        'nombres': [regla['nombre'] for regla in reglas],
+        'columnas': sorted({columna for columna, _, _ in condiciones}),
+        'condiciones': list(condiciones),
+        'indices': indices,
+    }
+
+
+def evaluar_reglas(arreglos, compiladas):
+    """
+    Evaluar las reglas compiladas sobre columnas ya convertidas a arreglos
+
+    Parameters:
+    -----------
+    arreglos : dict
+        Columna → arreglo float64 (NaN para faltantes)
+    compiladas : dict
+        Resultado de ``compilar_reglas``
+
+    Returns:
+    --------
+    numpy.ndarray : Matriz booleana (reglas, filas), una fila contigua por regla
+    """
+    n_filas = len(next(iter(arreglos.values())))
+    valores = [_OPERADORES[operador](arreglos[columna], valor)
+               for columna, operador, valor in compiladas['condiciones']]
+    disparos = np.empty((len(compiladas['indices']), n_filas), dtype=bool)
+    for j, propios in enumerate(compiladas['indices']):
+        np.logical_and.reduce([valores[i] for i in propios], out=disparos[j])
+    return disparos
+
+
+def etiquetar_riesgo(df, reglas=REGLAS_RIESGO, parametros=None, documentos_reportados=None,
+                     deduplicar=True, columna_documento=COLUMNA_DOCUMENTO):
+    """
+    Derivar RIESGO_DESERCION para todo un histórico en una sola pasada
+
+    1. AVANCE_ESPERADO y ATRASO_PORCENTUAL; si ``umbral_atraso`` es None se
+       usa el percentil ``percentil_umbral`` del atraso
+    2. Todas las reglas se evalúan sobre arreglos NumPy; REGLA_RIESGO guarda
+       la primera regla que se cumplió (o 'ninguna')
+    3. Duplicados de DOCUMENTO con una tabla hash de la columna (primera
+       aparición, como ``drop_duplicates(subset="DOCUMENTO")``) y pertenencia
+       a los documentos reportados con una tabla hash de esos documentos, en
+       una sola consulta por fila en lugar de varios ``isin`` encadenados
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Histórico con NUMERO_MATRICULAS, AVANCE_CARRERA, PAPA, ESTRATO,
+        PBM_CALCULADO y DOCUMENTO
+    reglas : list
+        Tabla de reglas (por defecto REGLAS_RIESGO)
+    parametros : dict
+        Valores que sobrescriben PARAMETROS_RIESGO (p. ej. {'umbral_atraso': 17.86})
+    documentos_reportados : array-like, optional
+        DOCUMENTO que deben quedar en riesgo (Hoja2)
+    deduplicar : bool
+        Quitar filas con DOCUMENTO repetido
+    columna_documento : str
+
+    Returns:
+    --------
+    tuple : (df etiquetado, resumen) con resumen = dict con 'umbral_atraso',
+            'reglas' (DataFrame de disparos por regla), 'duplicados',
+            'documentos_coinciden', 'ya_en_riesgo', 'nuevos_en_riesgo',
+            'distribucion' y 'segundos'
+    """
+    t0 = time.perf_counter()
+    parametros = {**PARAMETROS_RIESGO, **(parametros or {})}
+    n_filas = len(df)
+
+    avance_esperado, atraso = derivar_atraso(df, parametros['factor_avance'])
+    if parametros['umbral_atraso'] is None:
+        parametros['umbral_atraso'] = float(np.nanquantile(atraso, parametros['percentil_umbral']))
+
+    compiladas = compilar_reglas(reglas, parametros)
+    derivadas = {'AVANCE_ESPERADO': avance_esperado, 'ATRASO_PORCENTUAL': atraso}
+    faltantes = [c for c in compiladas['columnas'] if c not in derivadas and c not in df.columns]
+    if faltantes:
+        raise KeyError(f"Columnas requeridas por las reglas que no están en el dataset: {faltantes}")
+    arreglos = {columna: derivadas[columna] if columna in derivadas
+                else df[columna].to_numpy(dtype=np.float64, na_value=np.nan)
+                for columna in compiladas['columnas']}
+
+    disparos = evaluar_reglas(arreglos, compiladas)
+    riesgo = np.logical_or.reduce(disparos, axis=0)
+    nombres = np.array(compiladas['nombres'] + [REGLA_DOCUMENTO, SIN_REGLA], dtype=object)
+    # Primera regla cumplida: se asigna de la última a la primera para que gane la de mayor prioridad
+    primera = np.full(n_filas, len(nombres) - 1, dtype=np.int8 if len(nombres) < 128 else np.int32)
+    for j in range(len(disparos) - 1, -1, -1):
+        primera[disparos[j]] = j
+
+    # DOCUMENTO: tabla hash de la columna para duplicados y de los reportados para pertenencia
+    mantener = slice(None)
+    duplicados = 0
+    documentos_coinciden = ya_en_riesgo = nuevos_en_riesgo = 0
+    if columna_documento in df.columns:
+        documentos = df[columna_documento]
+        if deduplicar:
+            repetidos = documentos.duplicated(keep='first').to_numpy()
+            duplicados = int(repetidos.sum())
+            if duplicados:
+                mantener = np.flatnonzero(~repetidos)
+        if documentos_reportados is not None:
+            reportados = pd.Index(pd.unique(pd.Series(documentos_reportados).dropna()))
+            marcados = documentos.isin(reportados).to_numpy()
+            documentos_coinciden = int(reportados.isin(documentos[marcados]).sum())
+            ya_en_riesgo = int((marcados & riesgo)[mantener].sum())
+            nuevos = marcados & ~riesgo
+            nuevos_en_riesgo = int(nuevos[mantener].sum())
+            riesgo = riesgo | nuevos
+            primera[nuevos] = len(nombres) - 2
+
+    resultado = df.iloc[mantener] if isinstance(mantener, np.ndarray) else df.copy(deep=False)
+    resultado = resultado.assign(**{
+        'AVANCE_ESPERADO': avance_esperado[mantener],
+        'ATRASO_PORCENTUAL': atraso[mantener],
+        TARGET: riesgo[mantener].astype(np.int64),
+        COLUMNA_REGLA: pd.Categorical.from_codes(primera[mantener], categories=nombres),
+    })
+
+    conteo_reglas = pd.DataFrame({
+        'Regla': compiladas['nombres'],
+        'Cumplen': [int(np.count_nonzero(d[mantener])) for d in disparos],
+        'Primera_regla': np.bincount(primera[mantener], minlength=len(nombres))[:len(compiladas['nombres'])],
+    })
+    distribucion = resultado[TARGET].value_counts().sort_index()
+    segundos = time.perf_counter() - t0
+
+    print(f"🏷️ ETIQUETADO DE {TARGET}: {n_filas:,} filas en {segundos:.2f}s")
+    print(f"   Umbral de atraso: {parametros['umbral_atraso']:.2f}")
+    for fila in conteo_reglas.itertuples(index=False):
+        print(f"   {fila.Regla:<30} cumplen: {fila.Cumplen:>9,} | primera regla: {fila.Primera_regla:>9,}")
+    if deduplicar:
+        print(f"   DOCUMENTO duplicados eliminados: {duplicados:,}")
+    if documentos_reportados is not None:
+        print(f"   Documentos reportados presentes: {documentos_coinciden:,} "
+              f"(ya en riesgo: {ya_en_riesgo:,}, nuevos: {nuevos_en_riesgo:,})")
+    print(f"   Distribución: {distribucion.to_dict()} ({100 * distribucion.get(1, 0) / max(len(resultado), 1):.1f}% en riesgo)")
+
+    return resultado, {
+        'umbral_atraso': parametros['umbral_atraso'],
+        'reglas': conteo_reglas,
+        'duplicados': duplicados,
+        'documentos_coinciden': documentos_coinciden,
+        'ya_en_riesgo': ya_en_riesgo,
+        'nuevos_en_riesgo': nuevos_en_riesgo,
+        'distribucion': distribucion,
+        'segundos': segundos,
+    }
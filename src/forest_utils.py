@@ -0,0 +1,251 @@
+"""
+Inferencia de bosques aplanados para puntuar un estudiante con baja latencia
+Exporta un RandomForest / BalancedRandomForest entrenado a arreglos contiguos
+de nodos y lo evalúa con NumPy, para una fila o para muchas a la vez
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+HOJA = -1  # sklearn.tree._tree.TREE_LEAF
+# A partir de este número de filas se recorre árbol por árbol (mejor localidad de caché)
+FILAS_POR_ARBOL = 256
+
+
+class BosqueCompilado:
+    """
+    Bosque de árboles de decisión aplanado en arreglos contiguos
+
+    Todos los nodos de todos los árboles comparten los arreglos ``feature``,
+    ``threshold``, ``izquierda``, ``derecha`` y ``proba`` (índices globales).
+    Para pocas filas la evaluación avanza a la vez todos los pares (fila,
+    árbol) que aún no llegaron a una hoja, un nivel por iteración; para lotes
+    grandes recorre árbol por árbol con todas las filas a la vez, sobre X
+    transpuesta para que cada nivel lea columnas contiguas. Las probabilidades son las
+    mismas que ``predict_proba`` de sklearn: X se lleva a float32 igual que en
+    sklearn y los árboles se suman en el mismo orden.
+
+    Parameters:
+    -----------
+    modelo : RandomForestClassifier o BalancedRandomForestClassifier entrenado
+    """
+
+    def __init__(self, modelo=None):
+        if modelo is not None:
+            self._compilar(modelo)
+
+    def _compilar(self, modelo):
+        arboles = [est.tree_ for est in modelo.estimators_]
+        tamanos = np.array([a.node_count for a in arboles])
+        desplazamientos = np.concatenate([[0], np.cumsum(tamanos)[:-1]])
+
+        feature, threshold, izquierda, derecha, proba, faltantes_izquierda = [], [], [], [], [], []
+        for arbol, inicio in zip(arboles, desplazamientos):
+            propio = np.arange(arbol.node_count) + inicio
+            hoja = arbol.children_left == HOJA
+            feature.append(np.where(hoja, 0, arbol.feature))
+            threshold.append(np.where(hoja, 0.0, arbol.threshold))
+            izquierda.append(np.where(hoja, propio, arbol.children_left + inicio))
+            derecha.append(np.where(hoja, propio, arbol.children_right + inicio))
+            valores = arbol.value[:, 0, :]
+            proba.append(valores / valores.sum(axis=1, keepdims=True))
+            faltantes = getattr(arbol, 'missing_go_to_left', None)
+            faltantes_izquierda.append(np.zeros(arbol.node_count, dtype=bool) if faltantes is None
+                                       else np.asarray(faltantes, dtype=bool) & ~hoja)
+
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.izquierda = np.concatenate(izquierda).astype(np.intp)
+        self.derecha = np.concatenate(derecha).astype(np.intp)
+        self.proba = np.ascontiguousarray(np.concatenate(proba), dtype=np.float64)
+        self.faltantes_izquierda = np.concatenate(faltantes_izquierda)
+        self.raices = desplazamientos.astype(np.intp)
+        self.es_hoja = self.izquierda == np.arange(len(self.izquierda))
+        self.profundidad = int(max(a.max_depth for a in arboles))
+        self.classes_ = np.asarray(modelo.classes_)
+        columnas = getattr(modelo, 'feature_names_in_', None)
+        self.columnas = list(columnas) if columnas is not None else None
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    @property
+    def n_nodos(self):
+        return len(self.feature)
+
+    def _matriz(self, X):
+        """Igual que sklearn: columnas en el orden del ajuste y valores en float32"""
+        if isinstance(X, dict):
+            X = [X[col] for col in self.columnas]
+        elif isinstance(X, pd.Series):
+            X = X[self.columnas] if self.columnas is not None else X
+        elif isinstance(X, pd.DataFrame) and self.columnas is not None:
+            if not X.columns.equals(self._indice_columnas):
+                X = X[self.columnas]
+        X = np.asarray(X, dtype=np.float32)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    @property
+    def _indice_columnas(self):
+        if getattr(self, '_indice', None) is None:
+            self._indice = pd.Index(self.columnas)
+        return self._indice
+
+    def _hojas(self, X):
+        """Hoja alcanzada por cada fila en cada árbol: arreglo (filas, árboles)"""
+        nodos = np.tile(self.raices, len(X))
+        filas = np.repeat(np.arange(len(X)), self.n_arboles)
+        activos = np.arange(len(nodos))
+        hay_nulos = np.isnan(X).any()
+        while len(activos):
+            actuales = nodos[activos]
+            valores = X[filas[activos], self.feature[actuales]]
+            a_izquierda = valores <= self.threshold[actuales]
+            if hay_nulos:
+                a_izquierda |= np.isnan(valores) & self.faltantes_izquierda[actuales]
+            siguientes = np.where(a_izquierda, self.izquierda[actuales], self.derecha[actuales])
+            nodos[activos] = siguientes
+            activos = activos[~self.es_hoja[siguientes]]
+        return nodos.reshape(len(X), self.n_arboles)
+
+    def _proba_por_arbol(self, X):
+        """Suma de probabilidades árbol por árbol, vectorizada sobre todas las filas"""
+        n = len(X)
+        X_plano = np.ascontiguousarray(X.T).ravel()
+        hay_nulos = np.isnan(X_plano).any()
+        suma = np.zeros((n, self.proba.shape[1]))
+        for raiz in self.raices:
+            nodos = np.full(n, raiz, dtype=np.intp)
+            activos = np.arange(n)
+            while len(activos):
+                actuales = nodos[activos]
+                valores = X_plano[self.feature[actuales] * n + activos]
+                a_izquierda = valores <= self.threshold[actuales]
+                if hay_nulos:
+                    a_izquierda |= np.isnan(valores) & self.faltantes_izquierda[actuales]
+                siguientes = np.where(a_izquierda, self.izquierda[actuales], self.derecha[actuales])
+                nodos[activos] = siguientes
+                activos = activos[~self.es_hoja[siguientes]]
+            suma += self.proba[nodos]
+        return suma
+
+    def predict_proba(self, X, tamano_lote=10000):
+        """
+        Probabilidades por clase, idénticas a ``modelo.predict_proba``
+
+        Parameters:
+        -----------
+        X : DataFrame, Series, o arreglo (filas, características) o (características,)
+        tamano_lote : int
+            Filas evaluadas a la vez (acota la memoria de los índices de nodo)
+
+        Returns:
+        --------
+        numpy.ndarray : (filas, clases)
+        """
+        X = self._matriz(X)
+        if len(X) <= FILAS_POR_ARBOL:
+            return self.proba[self._hojas(X)].sum(axis=1) / self.n_arboles
+        if len(X) <= tamano_lote:
+            return self._proba_por_arbol(X) / self.n_arboles
+        return np.concatenate([self.predict_proba(X[i:i + tamano_lote], tamano_lote)
+                               for i in range(0, len(X), tamano_lote)])
+
+    def predict(self, X, tamano_lote=10000):
+        return self.classes_[np.argmax(self.predict_proba(X, tamano_lote), axis=1)]
+
+    def riesgo(self, estudiante):
+        """
+        Probabilidad de la clase positiva (RIESGO_DESERCION = 1) de un solo
+        estudiante, dado como dict columna → valor, Series, DataFrame de una fila o arreglo
+        """
+        return float(self.predict_proba(estudiante)[0, -1])
+
+    _ARREGLOS = ('feature', 'threshold', 'izquierda', 'derecha', 'proba', 'faltantes_izquierda',
+                 'raices', 'es_hoja', 'classes_')
+
+    def guardar(self, ruta):
+        """
+        Guarda los arreglos sin comprimir: en un .npz, o en un directorio con un
+        .npy por arreglo si la ruta no termina en .npz (cargable con ``mmap_mode``)
+        """
+        ruta = Path(ruta)
+        columnas = np.array(self.columnas if self.columnas is not None else [], dtype=str)
+        if ruta.suffix == '.npz':
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(ruta, **{nombre: getattr(self, nombre) for nombre in self._ARREGLOS},
+                     profundidad=self.profundidad, columnas=columnas)
+        else:
+            ruta.mkdir(parents=True, exist_ok=True)
+            for nombre in self._ARREGLOS:
+                np.save(ruta / f"{nombre}.npy", np.ascontiguousarray(getattr(self, nombre)))
+            np.save(ruta / "profundidad.npy", np.array(self.profundidad))
+            np.save(ruta / "columnas.npy", columnas)
+        print(f"💾 Bosque compilado guardado en {ruta} ({self.n_arboles} árboles, {self.n_nodos:,} nodos)")
+        return ruta
+
+    @staticmethod
+    def cargar(ruta, mmap_mode=None):
+        """
+        Carga un bosque guardado con ``guardar``
+
+        Con un directorio de .npy y ``mmap_mode='r'`` los arreglos se mapean en
+        memoria en lugar de leerse: la carga no depende del tamaño del bosque y
+        varios procesos que cargan el mismo bosque comparten una sola copia en RAM.
+        """
+        ruta = Path(ruta)
+        if ruta.is_dir():
+            datos = {archivo.stem: np.load(archivo, mmap_mode=mmap_mode) for archivo in ruta.glob("*.npy")}
+        else:
+            with np.load(ruta, allow_pickle=True) as archivo:
+                datos = {nombre: archivo[nombre] for nombre in archivo.files}
+        bosque = BosqueCompilado()
+        for nombre in BosqueCompilado._ARREGLOS:
+            if nombre in datos:
+                setattr(bosque, nombre, datos[nombre])
+        if 'es_hoja' not in datos:
+            bosque.es_hoja = bosque.izquierda == np.arange(len(bosque.izquierda))
+        bosque.profundidad = int(datos['profundidad'])
+        columnas = datos['columnas']
+        bosque.columnas = [str(c) for c in columnas] if len(columnas) else None
+        return bosque
+
+
+def compilar_bosque(modelo, X_verificacion=None):
+    """
+    Aplana un bosque entrenado y, si se da X_verificacion, comprueba que las
+    probabilidades coinciden con sklearn y compara la latencia de una fila
+
+    Parameters:
+    -----------
+    modelo : RandomForestClassifier o BalancedRandomForestClassifier entrenado
+    X_verificacion : pandas.DataFrame, optional
+        Filas para verificar equivalencia y medir latencia
+
+    Returns:
+    --------
+    BosqueCompilado : Bosque listo para ``predict_proba`` / ``riesgo``
+    """
+    bosque = BosqueCompilado(modelo)
+    print(f"✓ Bosque compilado: {bosque.n_arboles} árboles, {bosque.n_nodos:,} nodos, "
+          f"profundidad {bosque.profundidad}")
+    if X_verificacion is not None and len(X_verificacion):
+        diferencia = np.abs(bosque.predict_proba(X_verificacion) - modelo.predict_proba(X_verificacion)).max()
+        print(f"   Diferencia máxima con sklearn: {diferencia:.2e}")
+
+        fila = X_verificacion.iloc[[0]]
+        repeticiones = 50
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            modelo.predict_proba(fila)
+        sklearn_ms = (time.perf_counter() - t0) / repeticiones * 1000
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            bosque.predict_proba(fila)
+        compilado_ms = (time.perf_counter() - t0) / repeticiones * 1000
+        print(f"   Latencia de una fila: sklearn {sklearn_ms:.2f} ms | compilado {compilado_ms:.3f} ms")
+    return bosque
@@ -0,0 +1,323 @@
+"""
+Instrumentación ligera de las secciones costosas de eda_utils y shap_utils
+Tramos con tiempo, filas, memoria pico y cProfile opcional, como flujo de
+eventos estructurados y archivo de trazas agregable entre corridas
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+
+class _TramoNulo:
+    """Tramo de costo casi nulo usado cuando la instrumentación está apagada"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def registrar(self, **datos):
+        pass
+
+
+_NULO = _TramoNulo()
+
+
+class _Sesion:
+    """Estado de una sesión de instrumentación activa"""
+
+    def __init__(self, memoria, perfil, top_perfil, archivo, directorio_perfiles, suscriptores):
+        self.id = uuid.uuid4().hex[:12]
+        self.memoria = memoria
+        self.perfil = perfil
+        self.top_perfil = top_perfil
+        self.archivo = Path(archivo) if archivo is not None else None
+        self.directorio_perfiles = Path(directorio_perfiles) if directorio_perfiles is not None else None
+        self.suscriptores = list(suscriptores or [])
+        self.eventos = []
+        self.pila = []
+        self.tracemalloc_propio = False
+
+
+_SESION = None
+
+
+class _Tramo:
+    def __init__(self, sesion, nombre, datos):
+        self.sesion = sesion
+        self.nombre = nombre
+        self.datos = datos
+        self.pico = 0
+        self.perfilador = None
+
+    def registrar(self, **datos):
+        """Agrega datos al evento del tramo (p. ej. filas calculadas dentro)"""
+        self.datos.update(datos)
+
+    def __enter__(self):
+        sesion = self.sesion
+        self.padre = sesion.pila[-1] if sesion.pila else None
+        self.ruta = f"{self.padre.ruta}/{self.nombre}" if self.padre is not None else self.nombre
+        sesion.pila.append(self)
+        if sesion.memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+            if self.padre is not None:
+                self.padre.pico = max(self.padre.pico, pico)
+            tracemalloc.reset_peak()
+            self.memoria_inicio = actual
+        # cProfile no admite perfiladores anidados: solo se perfilan los tramos raíz
+        if sesion.perfil and self.padre is None:
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+        self.inicio = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        segundos = time.perf_counter() - self.t0
+        sesion = self.sesion
+        if self.perfilador is not None:
+            self.perfilador.disable()
+        evento = {
+            'ejecucion': sesion.id,
+            'pid': os.getpid(),
+            'tramo': self.ruta,
+            'nombre': self.nombre,
+            'nivel': len(sesion.pila) - 1,
+            'inicio': self.inicio,
+            'segundos': segundos,
+            **self.datos,
+        }
+        if sesion.memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+            self.pico = max(self.pico, pico)
+            evento['memoria_delta_mb'] = (actual - self.memoria_inicio) / 1024 ** 2
+            evento['memoria_pico_mb'] = (self.pico - self.memoria_inicio) / 1024 ** 2
+            if self.padre is not None:
+                self.padre.pico = max(self.padre.pico, self.pico)
+            tracemalloc.reset_peak()
+        if tipo_error is not None:
+            evento['error'] = tipo_error.__name__
+        if self.perfilador is not None:
+            evento['perfil'] = _resumen_perfil(self.perfilador, sesion.top_perfil)
+            if sesion.directorio_perfiles is not None:
+                sesion.directorio_perfiles.mkdir(parents=True, exist_ok=True)
+                ruta_perfil = sesion.directorio_perfiles / f"{sesion.id}_{len(sesion.eventos)}_{self.nombre}.prof"
+                self.perfilador.dump_stats(ruta_perfil)
+                evento['archivo_perfil'] = str(ruta_perfil)
+        sesion.pila.pop()
+        sesion.eventos.append(evento)
+        for suscriptor in sesion.suscriptores:
+            suscriptor(evento)
+        return False
+
+
+def _resumen_perfil(perfilador, top):
+    """Las ``top`` funciones con más tiempo acumulado"""
+    estadisticas = pstats.Stats(perfilador, stream=io.StringIO())
+    filas = []
+    for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in estadisticas.stats.items():
+        filas.append({'funcion': f"{Path(archivo).name}:{linea}({funcion})", 'llamadas': llamadas,
+                      'segundos_propios': round(propio, 6), 'segundos_acumulados': round(acumulado, 6)})
+    filas.sort(key=lambda f: f['segundos_acumulados'], reverse=True)
+    return filas[:top]
+
+
+def tramo(nombre, **datos):
+    """
+    Medir una sección de código
+
+    Con la instrumentación apagada devuelve un contexto vacío compartido, así
+    que dejarlo en funciones usadas a menudo no tiene costo apreciable.
+
+    Parameters:
+    -----------
+    nombre : str
+        Nombre de la sección; se anida con el del tramo que la contiene
+    **datos :
+        Datos adicionales del evento (p. ej. ``filas=len(df)``)
+
+    Uso:
+        with tramo('duplicados', filas=len(df)) as t:
+            ...
+            t.registrar(duplicados=n)
+    """
+    if _SESION is None:
+        return _NULO
+    return _Tramo(_SESION, nombre, datos)
+
+
+def instrumentar(nombre=None, filas=None):
+    """
+    Decorador: cada llamada a la función es un tramo
+
+    Parameters:
+    -----------
+    nombre : str, optional
+        Nombre del tramo (por defecto el de la función)
+    filas : str, optional
+        Nombre del argumento cuyo ``len()`` se registra como filas
+    """
+    def decorador(funcion):
+        nombre_tramo = nombre or funcion.__name__
+        firma = inspect.signature(funcion) if filas is not None else None
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _SESION is None:
+                return funcion(*args, **kwargs)
+            datos = {}
+            if firma is not None:
+                valor = firma.bind_partial(*args, **kwargs).arguments.get(filas)
+                if hasattr(valor, '__len__'):
+                    datos['filas'] = len(valor)
+            with _Tramo(_SESION, nombre_tramo, datos):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def activar_instrumentacion(memoria=False, perfil=False, top_perfil=15, archivo=None,
+                            directorio_perfiles=None, suscriptores=None):
+    """
+    Empezar a registrar tramos
+
+    Parameters:
+    -----------
+    memoria : bool
+        Medir memoria con tracemalloc (delta y pico por tramo; ralentiza)
+    perfil : bool
+        Ejecutar cProfile en cada tramo raíz y guardar sus ``top_perfil`` funciones
+    top_perfil : int
+        Funciones por perfil en el evento
+    archivo : str o Path, optional
+        Archivo JSON Lines al que se agregan los eventos al desactivar
+    directorio_perfiles : str o Path, optional
+        Carpeta donde guardar los .prof completos (para snakeviz / pstats)
+    suscriptores : list, optional
+        Funciones que reciben cada evento en cuanto se cierra su tramo
+    """
+    global _SESION
+    if _SESION is not None:
+        desactivar_instrumentacion()
+    _SESION = _Sesion(memoria, perfil, top_perfil, archivo, directorio_perfiles, suscriptores)
+    if memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _SESION.tracemalloc_propio = True
+    return _SESION.id
+
+
+def desactivar_instrumentacion():
+    """
+    Dejar de registrar y devolver los eventos de la sesión
+
+    Returns:
+    --------
+    list : Eventos (dicts) en orden de cierre
+    """
+    global _SESION
+    sesion, _SESION = _SESION, None
+    if sesion is None:
+        return []
+    if sesion.tracemalloc_propio:
+        tracemalloc.stop()
+    if sesion.archivo is not None and sesion.eventos:
+        sesion.archivo.parent.mkdir(parents=True, exist_ok=True)
+        fecha = datetime.now().isoformat(timespec='seconds')
+        with open(sesion.archivo, 'a', encoding='utf-8') as f:
+            for evento in sesion.eventos:
+                f.write(json.dumps({'fecha': fecha, **evento}, ensure_ascii=False, default=str) + "\n")
+    return sesion.eventos
+
+
+class instrumentacion:
+    """
+    Contexto que activa la instrumentación y deja los eventos en ``.eventos``
+
+    Uso:
+        with instrumentacion(memoria=True) as traza:
+            analizar_estructura_dataset(df)
+        traza.resumen()
+    """
+
+    def __init__(self, **opciones):
+        self.opciones = opciones
+        self.eventos = []
+
+    def __enter__(self):
+        activar_instrumentacion(**self.opciones)
+        return self
+
+    def __exit__(self, *exc):
+        self.eventos = desactivar_instrumentacion()
+        return False
+
+    def resumen(self):
+        return resumir_eventos(self.eventos)
+
+
+def resumir_eventos(eventos):
+    """
+    Tabla de tramos en orden de ejecución, con el porcentaje del tiempo de su raíz
+
+    Returns:
+    --------
+    pandas.DataFrame : tramo, nivel, segundos, porcentaje y, si existen, filas y memoria
+    """
+    df = pd.DataFrame(eventos)
+    if df.empty:
+        return df
+    df = df.sort_values(['inicio', 'nivel']).reset_index(drop=True)
+    raiz = df['tramo'].str.split('/').str[0]
+    totales = df.loc[df['nivel'] == 0].groupby('tramo')['segundos'].sum()
+    df['porcentaje'] = 100 * df['segundos'] / raiz.map(totales)
+    columnas = [c for c in ('tramo', 'nivel', 'segundos', 'porcentaje', 'filas', 'memoria_delta_mb',
+                            'memoria_pico_mb', 'error') if c in df.columns]
+    return df[columnas]
+
+
+def agregar_trazas(rutas):
+    """
+    Agregar archivos de trazas de varias corridas (p. ej. las programadas)
+
+    Parameters:
+    -----------
+    rutas : str, Path o lista
+        Archivos JSON Lines escritos con ``activar_instrumentacion(archivo=...)``
+
+    Returns:
+    --------
+    pandas.DataFrame : Por tramo: ejecuciones, llamadas, segundos total/medio/p50/p95/máximo
+                       y filas y memoria pico medias si se registraron
+    """
+    rutas = [rutas] if isinstance(rutas, (str, Path)) else list(rutas)
+    df = pd.concat([pd.read_json(ruta, lines=True) for ruta in rutas], ignore_index=True)
+    agregados = {
+        'ejecuciones': ('ejecucion', 'nunique'),
+        'llamadas': ('segundos', 'size'),
+        'segundos_total': ('segundos', 'sum'),
+        'segundos_medio': ('segundos', 'mean'),
+        'segundos_p50': ('segundos', 'median'),
+        'segundos_p95': ('segundos', lambda s: s.quantile(0.95)),
+        'segundos_max': ('segundos', 'max'),
+    }
+    if 'filas' in df.columns:
+        agregados['filas_medias'] = ('filas', 'mean')
+    if 'memoria_pico_mb' in df.columns:
+        agregados['memoria_pico_mb_media'] = ('memoria_pico_mb', 'mean')
+    return df.groupby('tramo').agg(**agregados).sort_values('segundos_total', ascending=False)
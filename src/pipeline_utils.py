@@ -0,0 +1,397 @@
+"""
+Pipeline de preprocesamiento ajustado una sola vez y reutilizable
+Imputación, codificación y escalado de los notebooks 04 y 06 como un objeto
+serializable que transforma nuevos semestres sin reajustar ni escribir Excel
+"""
+
+import hashlib
+import pickle
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+from sklearn.impute import IterativeImputer
+from sklearn.preprocessing import MinMaxScaler, PowerTransformer, RobustScaler, StandardScaler
+
+DIRECTORIO_MODELOS = Path(__file__).resolve().parent.parent / "models"
+
+TARGET = 'RIESGO_DESERCION'
+
+# Configuración de 04_data_imputation.ipynb
+COLUMNAS_ELIMINAR = ['MUNICIPIO_RESIDENCIA']
+IMPUTAR_MODA = ['MUNICIPIO_NACIMIENTO']
+# Grupos de más específico a más general: si el PLAN no tiene datos se usa FACULTAD, luego SEDE
+IMPUTAR_MEDIA_GRUPO = {'PUNTAJE_ADMISION': ['PLAN', 'FACULTAD', 'SEDE']}
+IMPUTAR_MICE = ['PAPA', 'PROME_ACADE']
+
+# Normalizaciones hechas a mano en df_objetivo_imputado_2.xlsx (ver 06_feature_encoding.ipynb)
+DISCAPACIDAD_NO = 'NO'
+NODO_COVID = 'Estudiantes que deben nivelar - Excepción COVID'
+
+# Configuración de 06_feature_encoding.ipynb
+LABEL_VARS = ['GENERO', 'NACIONALIDAD', 'VICTIMAS_DEL_CONFLICTO', 'DISCAPACIDAD']
+ONEHOT_VARS = ['PLAN', 'SUBACCESO', 'CARACTER_COLEGIO', 'NODO_INICIO']
+TARGET_ENCODING_VARS = ['APERTURA', 'MUNICIPIO_NACIMIENTO', 'MUNICIPIO_RESIDENCIA_FAM']
+SCALING_STRATEGIES = {
+    'AVANCE_CARRERA': 'minmax',
+    'EDAD': 'power_standard',
+    'PAPA': 'robust',
+    'PBM_CALCULADO': 'robust',
+    'ESTRATO': 'power_standard',
+    'PUNTAJE_ADMISION': 'standard',
+    'ATRASO_PORCENTUAL': 'robust',
+}
+ESCALADORES = {'minmax': MinMaxScaler, 'robust': RobustScaler, 'standard': StandardScaler}
+# Cada IterativeImputer guarda un estimador por columna e iteración
+MAX_CACHE_MICE = 8
+
+
+def _normalizar_categorias(df):
+    """DISCAPACIDAD binaria SI/NO y NODO_INICIO reducido a 3 categorías"""
+    if 'DISCAPACIDAD' in df.columns:
+        discapacidad = df['DISCAPACIDAD']
+        df['DISCAPACIDAD'] = discapacidad.where(discapacidad.isna() | (discapacidad == DISCAPACIDAD_NO), 'SI')
+    if 'NODO_INICIO' in df.columns:
+        nodo = df['NODO_INICIO'].astype(object)
+        df['NODO_INICIO'] = nodo.where(~nodo.astype(str).str.startswith(NODO_COVID), NODO_COVID)
+    return df
+
+
+def _codigos(serie, categorias):
+    """Posición de cada valor en ``categorias`` (-1 si es nulo o no se vio al ajustar)"""
+    return pd.Categorical(serie, categories=categorias).codes
+
+
+# IterativeImputer ya ajustados, por huella de los datos de entrada (LRU)
+_CACHE_MICE = OrderedDict()
+
+
+def _medias_por_grupo(valores, grupos):
+    """
+    Media de ``valores`` por grupo en una sola pasada: factorize + bincount
+
+    Returns:
+    --------
+    tuple : (pandas.Index de grupos, array de medias; NaN si el grupo no tiene datos)
+    """
+    codigos, categorias = pd.factorize(grupos)
+    validos = (codigos >= 0) & ~np.isnan(valores)
+    sumas = np.bincount(codigos[validos], weights=valores[validos], minlength=len(categorias))
+    conteos = np.bincount(codigos[validos], minlength=len(categorias))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = sumas / conteos
+    return pd.Index(categorias), medias
+
+
+def _ajustar_mice(datos):
+    """IterativeImputer ajustado, reutilizado si ya se ajustó sobre los mismos datos"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(','.join(map(str, datos.columns)).encode())
+    h.update(pd.util.hash_pandas_object(datos, index=False).to_numpy().tobytes())
+    huella = h.hexdigest()
+    if huella in _CACHE_MICE:
+        print("♻️ Usando IterativeImputer en caché")
+        _CACHE_MICE.move_to_end(huella)
+        return _CACHE_MICE[huella]
+    imputador = IterativeImputer(random_state=0).fit(datos)
+    _CACHE_MICE[huella] = imputador
+    while len(_CACHE_MICE) > MAX_CACHE_MICE:
+        _CACHE_MICE.popitem(last=False)
+    return imputador
+
+
+class ImputadorGrupos:
+    """
+    Imputación por moda, por media de grupo con respaldo jerárquico y MICE
+
+    Las medias de cada nivel (p. ej. PLAN → FACULTAD → SEDE) se calculan una
+    vez con bincount sobre los códigos de grupo; al transformar, cada fila
+    faltante busca su grupo con ``Index.get_indexer`` y toma la media del
+    primer nivel que tenga datos, o la media global. El IterativeImputer se
+    ajusta una sola vez (y se reutiliza si los datos de ajuste no cambian);
+    imputar un semestre nuevo solo ejecuta ``transform``.
+
+    Parameters:
+    -----------
+    moda : list
+        Columnas a imputar con la moda
+    media_grupo : dict
+        Columna → lista de columnas de grupo, de la más específica a la más general
+    mice : list
+        Columnas a imputar conjuntamente con IterativeImputer
+    """
+
+    def __init__(self, moda=None, media_grupo=None, mice=None):
+        self.moda = list(IMPUTAR_MODA if moda is None else moda)
+        self.media_grupo = dict(IMPUTAR_MEDIA_GRUPO if media_grupo is None else media_grupo)
+        self.mice = list(IMPUTAR_MICE if mice is None else mice)
+
+    def ajustar(self, df):
+        """Calcula modas, medias por grupo de cada nivel y ajusta el IterativeImputer"""
+        self.modas_ = {col: df[col].mode()[0] for col in self.moda if col in df.columns}
+        self.medias_grupo_ = {}
+        for col, niveles in self.media_grupo.items():
+            if col not in df.columns:
+                continue
+            valores = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            niveles = [niveles] if isinstance(niveles, str) else niveles
+            self.medias_grupo_[col] = (
+                [(grupo,) + _medias_por_grupo(valores, df[grupo].to_numpy()) for grupo in niveles
+                 if grupo in df.columns],
+                float(np.nanmean(valores)) if (~np.isnan(valores)).any() else np.nan,
+            )
+        self.columnas_mice_ = [c for c in self.mice if c in df.columns]
+        self.mice_ = _ajustar_mice(df[self.columnas_mice_]) if self.columnas_mice_ else None
+        return self
+
+    def transformar(self, df):
+        """Devuelve una copia de ``df`` con los faltantes imputados"""
+        df = df.copy(deep=False)
+        for col, moda in self.modas_.items():
+            if col in df.columns:
+                df[col] = df[col].fillna(moda)
+        for col, (niveles, media_global) in self.medias_grupo_.items():
+            if col not in df.columns:
+                continue
+            valores = df[col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            faltantes = np.flatnonzero(np.isnan(valores))
+            for grupo, categorias, medias in niveles:
+                if not len(faltantes):
+                    break
+                if grupo not in df.columns:
+                    continue
+                posiciones = categorias.get_indexer(df[grupo].to_numpy()[faltantes])
+                relleno = np.where(posiciones >= 0, medias[posiciones], np.nan)
+                valores[faltantes] = relleno
+                faltantes = faltantes[np.isnan(relleno)]
+            valores[faltantes] = media_global
+            df[col] = valores
+        if self.mice_ is not None:
+            faltantes = [c for c in self.columnas_mice_ if c not in df.columns]
+            if faltantes:
+                raise ValueError(f"Faltan columnas imputadas con MICE al ajustar: {faltantes}")
+            df[self.columnas_mice_] = self.mice_.transform(df[self.columnas_mice_])
+        return df
+
+    def ajustar_transformar(self, df):
+        return self.ajustar(df).transformar(df)
+
+
+def _target_encoding(x, y, min_samples_leaf=20, smoothing=10.0):
+    """
+    Media suavizada del target por categoría, con la misma fórmula que
+    ``category_encoders.TargetEncoder`` con sus valores por defecto
+    (categorías vistas una sola vez → prior)
+    """
+    prior = float(y.mean())
+    estadisticas = y.groupby(x.astype(object)).agg(['count', 'mean'])
+    suavizado = 1 / (1 + np.exp(-(estadisticas['count'] - min_samples_leaf) / smoothing))
+    codificacion = prior * (1 - suavizado) + estadisticas['mean'] * suavizado
+    codificacion[estadisticas['count'] == 1] = prior
+    return codificacion, prior
+
+
+class PipelinePreprocesamiento:
+    """
+    Imputación + codificación + escalado ajustados una vez sobre el dataset de
+    entrenamiento y aplicables a cualquier semestre nuevo
+
+    ``ajustar`` aprende todos los parámetros (imputación con ``ImputadorGrupos``,
+    clases de cada codificación y parámetros de escalado);
+    ``transformar`` los aplica en una sola pasada vectorizada, sin reajustar y
+    sin archivos intermedios. Las categorías no vistas al ajustar se codifican
+    como -1 (label), sin dummy activa (one-hot) o con el prior (target).
+
+    Parameters:
+    -----------
+    target : str
+        Variable objetivo, usada solo para ajustar el target encoding
+    scaling_strategies : dict
+        Columna → 'minmax', 'robust', 'standard' o 'power_standard'
+    """
+
+    def __init__(self, target=TARGET, scaling_strategies=None):
+        self.target = target
+        self.scaling_strategies = dict(scaling_strategies or SCALING_STRATEGIES)
+        self.ajustado = False
+
+    def ajustar(self, df):
+        """
+        Ajusta todas las etapas sobre un DataFrame con la variable objetivo
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame
+            Dataset con variable objetivo (p. ej. df_objetivo_riesgo_real.xlsx)
+
+        Returns:
+        --------
+        PipelinePreprocesamiento : self, ajustado
+        """
+        inicio = time.perf_counter()
+        df = _normalizar_categorias(df.drop(columns=[c for c in COLUMNAS_ELIMINAR if c in df.columns]))
+
+        # 1. Imputación
+        self.imputador_ = ImputadorGrupos().ajustar(df)
+        df = self.imputador_.transformar(df)
+
+        # 2. Codificación
+        self._ajustar_codificacion(df)
+
+        # 3. Escalado: parámetros afines (x * escala + desplazamiento) por columna
+        codificado = self._codificar(df)
+        self._ajustar_escalado(codificado)
+
+        self.columnas_salida_ = codificado.columns.tolist()
+        self.ajustado = True
+        print(f"✓ Pipeline ajustado en {time.perf_counter() - inicio:.2f}s "
+              f"({len(self.columnas_salida_)} columnas de salida)")
+        return self
+
+    def _ajustar_codificacion(self, df):
+        """Clases de label/one-hot y target encoding sobre datos ya imputados"""
+        self.clases_label_ = {col: np.sort(df[col].dropna().unique()) for col in LABEL_VARS if col in df.columns}
+        self.categorias_onehot_ = {col: pd.Index(df[col].dropna().unique()).sort_values().to_numpy()
+                                   for col in ONEHOT_VARS if col in df.columns}
+        self.target_encoding_ = {}
+        if self.target in df.columns:
+            for col in TARGET_ENCODING_VARS:
+                if col in df.columns:
+                    codificacion, prior = _target_encoding(df[col], df[self.target])
+                    self.target_encoding_[col] = (codificacion.index.to_numpy(), codificacion.to_numpy(), prior)
+        else:
+            print(f"⚠️ '{self.target}' no está en los datos: se omite el target encoding")
+        return self
+
+    def _ajustar_escalado(self, codificado):
+        """Parámetros afines del escalado sobre datos ya codificados"""
+        self.power_ = None
+        self.columnas_power_ = [c for c, e in self.scaling_strategies.items()
+                                if e == 'power_standard' and c in codificado.columns]
+        if self.columnas_power_:
+            self.power_ = PowerTransformer(method='yeo-johnson').fit(codificado[self.columnas_power_])
+        self.columnas_escaladas_ = [c for c in self.scaling_strategies if c in codificado.columns]
+        escalas, desplazamientos = [], []
+        for col in self.columnas_escaladas_:
+            estrategia = self.scaling_strategies[col]
+            valores = codificado[[col]].to_numpy(dtype=np.float64)
+            if estrategia == 'power_standard':
+                posicion = self.columnas_power_.index(col)
+                valores = self.power_.transform(codificado[self.columnas_power_])[:, [posicion]]
+                escalador = StandardScaler().fit(valores)
+            else:
+                escalador = ESCALADORES[estrategia]().fit(valores)
+            escala, desplazamiento = self._afin(escalador)
+            escalas.append(escala)
+            desplazamientos.append(desplazamiento)
+        self.escala_ = np.array(escalas, dtype=np.float64)
+        self.desplazamiento_ = np.array(desplazamientos, dtype=np.float64)
+        return self
+
+    @staticmethod
+    def _afin(escalador):
+        """Escala y desplazamiento equivalentes de un escalador de sklearn ajustado"""
+        if isinstance(escalador, MinMaxScaler):
+            return escalador.scale_[0], escalador.min_[0]
+        centro = escalador.center_[0] if isinstance(escalador, RobustScaler) else escalador.mean_[0]
+        escala = escalador.scale_[0]
+        return 1 / escala, -centro / escala
+
+    def _codificar(self, df):
+        """Label, one-hot y target encoding con las clases aprendidas, sin reajustar"""
+        columnas = {}
+        for col in df.columns:
+            if col in self.categorias_onehot_:
+                codigos = _codigos(df[col], self.categorias_onehot_[col])
+                # drop_first=True: se omite la primera categoría
+                for posicion, categoria in enumerate(self.categorias_onehot_[col][1:], start=1):
+                    columnas[f"{col}_{categoria}"] = codigos == posicion
+                continue
+            if col in self.clases_label_:
+                columnas[col] = _codigos(df[col], self.clases_label_[col]).astype(np.int64)
+            elif col in self.target_encoding_:
+                categorias, valores, prior = self.target_encoding_[col]
+                codigos = _codigos(df[col].astype(object), categorias)
+                columnas[col] = np.where(codigos >= 0, valores[codigos], prior)
+            else:
+                columnas[col] = df[col].to_numpy()
+        # get_dummies deja las dummies al final, en el orden de ONEHOT_VARS
+        orden = [c for c in df.columns if c not in self.categorias_onehot_]
+        orden += [f"{col}_{categoria}" for col in self.categorias_onehot_ if col in df.columns
+                  for categoria in self.categorias_onehot_[col][1:]]
+        return pd.DataFrame({c: columnas[c] for c in orden}, index=df.index)
+
+    def transformar(self, df, no_vistas=None):
+        """
+        Aplica el pipeline ajustado a un DataFrame nuevo (sin modificarlo)
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame
+            Semestre nuevo con las columnas originales (el target es opcional)
+        no_vistas : dict, optional
+            Si se pasa, se le suman los conteos por columna de categorías no
+            vistas al ajustar (p. ej. para reportarlas al puntuar por bloques)
+
+        Returns:
+        --------
+        pandas.DataFrame : Datos imputados, codificados y escalados con las
+                           mismas columnas que en el ajuste
+
+        Raises:
+        -------
+        ValueError : Si falta alguna columna usada en el ajuste (no se rellena)
+        """
+        if not self.ajustado:
+            raise ValueError("El pipeline no está ajustado: llame a ajustar() primero")
+        df = _normalizar_categorias(df.drop(columns=[c for c in COLUMNAS_ELIMINAR if c in df.columns]))
+        df = self.imputador_.transformar(df)
+
+        conteos = {col: int((~df[col].isna() & (_codigos(df[col], clases) < 0)).sum())
+                   for col, clases in self.clases_label_.items() if col in df.columns}
+        conteos = {col: n for col, n in conteos.items() if n}
+        if conteos:
+            print(f"⚠️ Categorías no vistas al ajustar (codificadas como -1): {conteos}")
+            if no_vistas is not None:
+                for col, n in conteos.items():
+                    no_vistas[col] = no_vistas.get(col, 0) + n
+
+        return self._escalar(self._codificar(df))
+
+    def _escalar(self, codificado):
+        """Power transform y escalado afín de datos ya codificados, en las columnas del ajuste"""
+        faltantes = set(self.columnas_salida_) - set(codificado.columns) - {self.target}
+        if faltantes:
+            raise ValueError(f"Faltan columnas de salida del ajuste: "
+                             f"{[c for c in self.columnas_salida_ if c in faltantes]}")
+        if self.columnas_power_:
+            potencia = self.power_.transform(codificado[self.columnas_power_])
+            codificado[self.columnas_power_] = potencia
+        escaladas = codificado[self.columnas_escaladas_].to_numpy(dtype=np.float64)
+        codificado[self.columnas_escaladas_] = escaladas * self.escala_ + self.desplazamiento_
+
+        columnas = [c for c in self.columnas_salida_ if c != self.target or c in codificado.columns]
+        return codificado[columnas]
+
+    def ajustar_transformar(self, df):
+        """Ajusta el pipeline y devuelve el propio ``df`` transformado"""
+        return self.ajustar(df).transformar(df)
+
+    def guardar(self, ruta=None):
+        """Guarda el pipeline ajustado con pickle (por defecto en models/)"""
+        ruta = Path(ruta) if ruta is not None else DIRECTORIO_MODELOS / "pipeline_preprocesamiento.pkl"
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        with open(ruta, 'wb') as f:
+            pickle.dump(self, f)
+        print(f"💾 Pipeline guardado en {ruta}")
+        return ruta
+
+    @staticmethod
+    def cargar(ruta=None):
+        """Carga un pipeline guardado con ``guardar``"""
+        ruta = Path(ruta) if ruta is not None else DIRECTORIO_MODELOS / "pipeline_preprocesamiento.pkl"
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
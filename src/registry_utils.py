@@ -0,0 +1,261 @@
+"""
+Registro versionado de modelos
+Guarda cada modelo con sus parámetros, huella de los datos, métricas y
+características, y lo carga mapeado en memoria para que varios procesos de
+puntuación compartan una sola copia de los árboles
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import confusion_matrix, f1_score, precision_score, recall_score, roc_auc_score
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from deriva_utils import PerfilDeriva  # noqa: E402
+from forest_utils import BosqueCompilado  # noqa: E402
+from search_utils import _huella_datos, g_mean  # noqa: E402
+
+DIRECTORIO_MODELOS = Path(__file__).resolve().parent.parent / "models"
+ARCHIVO_INDICE = "model_metadata.json"
+
+
+def _escribir_json(ruta, contenido):
+    """Escritura atómica: un lector nunca ve un JSON a medio escribir"""
+    temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+    temporal.write_text(json.dumps(contenido, indent=2, ensure_ascii=False, default=str), encoding='utf-8')
+    os.replace(temporal, ruta)
+
+
+def _leer_indice(directorio):
+    ruta = directorio / ARCHIVO_INDICE
+    if not ruta.exists():
+        return {'modelos': {}}
+    return json.loads(ruta.read_text(encoding='utf-8'))
+
+
+def metricas_modelo(modelo, X_test, y_test):
+    """
+    Métricas de evaluación en el conjunto de prueba
+
+    Parameters:
+    -----------
+    modelo : estimador con predict_proba
+    X_test : pandas.DataFrame
+    y_test : array-like
+
+    Returns:
+    --------
+    dict : roc_auc, g_mean, recall, precision, f1 y matriz_confusion
+    """
+    y_test = np.asarray(y_test)
+    proba = modelo.predict_proba(X_test)[:, 1]
+    y_pred = (proba >= 0.5).astype(y_test.dtype)
+    return {
+        'roc_auc': float(roc_auc_score(y_test, proba)),
+        'g_mean': g_mean(y_test, y_pred),
+        'recall': float(recall_score(y_test, y_pred)),
+        'precision': float(precision_score(y_test, y_pred, zero_division=0)),
+        'f1': float(f1_score(y_test, y_pred)),
+        'matriz_confusion': confusion_matrix(y_test, y_pred).tolist(),
+    }
+
+
+def registrar_modelo(modelo, nombre, X_train, y_train, X_test=None, y_test=None, pipeline=None,
+                     parametros=None, notas=None, directorio=None, deriva=True):
+    """
+    Registrar una nueva versión de un modelo entrenado
+
+    Cada versión vive en ``<directorio>/<nombre>/v<NNN>/`` con:
+    - ``modelo.joblib``: el estimador completo, sin comprimir (para SHAP o reentrenar)
+    - ``bosque/``: los árboles aplanados, un .npy por arreglo (solo bosques)
+    - ``pipeline.pkl``: el preprocesamiento ajustado, si se da
+    - ``deriva.joblib``: histogramas de referencia para vigilar la deriva (ver deriva_utils)
+    - ``metadata.json``: parámetros, huella de datos, métricas y características
+    y se agrega al índice ``model_metadata.json`` del directorio.
+
+    Parameters:
+    -----------
+    modelo : estimador entrenado
+    nombre : str
+        Nombre del modelo en el registro (p. ej. 'random_forest')
+    X_train, y_train : datos de entrenamiento (solo se guarda su huella y tamaño)
+    X_test, y_test : datos de prueba, optional
+        Si se dan, se calculan y guardan las métricas
+    pipeline : PipelinePreprocesamiento, optional
+    parametros : dict, optional
+        Parámetros de entrenamiento (por defecto ``modelo.get_params()``)
+    notas : str, optional
+    directorio : str o Path
+        Raíz del registro (por defecto models/)
+    deriva : bool o PerfilDeriva
+        Guardar el perfil de deriva: True lo construye con X_train (predicción
+        y SHAP sobre X_test si se da; sin SHAP si TreeExplainer no admite el
+        modelo); también acepta un perfil ya ajustado
+
+    Returns:
+    --------
+    dict : Metadatos de la versión registrada
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_MODELOS
+    indice = _leer_indice(directorio)
+    versiones = indice['modelos'].setdefault(nombre, [])
+    version = max((v['version'] for v in versiones), default=0) + 1
+    ruta = directorio / nombre / f"v{version:03d}"
+
+    # Todo lo que puede fallar se calcula antes de crear la carpeta de la versión
+    if deriva is True and isinstance(X_train, pd.DataFrame):
+        with contextlib.redirect_stdout(io.StringIO()):
+            deriva = PerfilDeriva().ajustar(X_train, modelo, X_prediccion=X_test)
+    if parametros is None:
+        parametros = modelo.get_params() if hasattr(modelo, 'get_params') else {}
+    columnas = getattr(modelo, 'feature_names_in_', None)
+    metadata = {
+        'nombre': nombre,
+        'version': version,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'tipo': type(modelo).__name__,
+        'parametros': {k: v if isinstance(v, (int, float, str, bool, type(None))) else repr(v)
+                       for k, v in parametros.items()},
+        'huella_datos': _huella_datos(X_train, y_train),
+        'n_entrenamiento': int(len(X_train)),
+        'caracteristicas': list(columnas) if columnas is not None else list(getattr(X_train, 'columns', [])),
+        'metricas': metricas_modelo(modelo, X_test, y_test) if X_test is not None else None,
+        'archivos': {'modelo': 'modelo.joblib'},
+        'notas': notas,
+    }
+
+    ruta.mkdir(parents=True, exist_ok=False)
+    try:
+        # Sin comprimir: joblib solo puede mapear en memoria arreglos no comprimidos
+        joblib.dump(modelo, ruta / "modelo.joblib", compress=0)
+        if hasattr(modelo, 'estimators_') and hasattr(modelo.estimators_[0], 'tree_'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                BosqueCompilado(modelo).guardar(ruta / "bosque")
+            metadata['archivos']['bosque'] = 'bosque'
+        if pipeline is not None:
+            joblib.dump(pipeline, ruta / "pipeline.pkl", compress=0)
+            metadata['archivos']['pipeline'] = 'pipeline.pkl'
+        if isinstance(deriva, PerfilDeriva):
+            deriva.guardar(ruta / "deriva.joblib")
+            metadata['archivos']['deriva'] = 'deriva.joblib'
+
+        tamano = sum(f.stat().st_size for f in ruta.rglob('*') if f.is_file())
+        metadata['tamano_mb'] = round(tamano / 1024 ** 2, 2)
+        _escribir_json(ruta / "metadata.json", metadata)
+    except BaseException:
+        # Sin esto la carpeta huérfana (fuera del índice) bloquea el siguiente registro
+        shutil.rmtree(ruta, ignore_errors=True)
+        raise
+
+    versiones.append({k: metadata[k] for k in ('version', 'fecha', 'tipo', 'huella_datos', 'metricas', 'tamano_mb')})
+    indice['modelos'][nombre] = versiones
+    _escribir_json(directorio / ARCHIVO_INDICE, indice)
+
+    print(f"📦 {nombre} v{version:03d} registrado en {ruta} ({metadata['tamano_mb']:.1f} MB)")
+    if metadata['metricas'] is not None:
+        m = metadata['metricas']
+        print(f"   ROC-AUC: {m['roc_auc']:.4f} | G-mean: {m['g_mean']:.4f} | Recall: {m['recall']:.4f}")
+    return metadata
+
+
+def listar_modelos(directorio=None):
+    """
+    Todas las versiones registradas, una fila por versión
+
+    Returns:
+    --------
+    pandas.DataFrame : Modelo, Versión, Fecha, Tipo, ROC_AUC, G_mean, Recall, Tamaño_MB
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_MODELOS
+    filas = []
+    for nombre, versiones in _leer_indice(directorio)['modelos'].items():
+        for v in versiones:
+            metricas = v.get('metricas') or {}
+            filas.append({
+                'Modelo': nombre,
+                'Versión': v['version'],
+                'Fecha': v['fecha'],
+                'Tipo': v['tipo'],
+                'ROC_AUC': metricas.get('roc_auc'),
+                'G_mean': metricas.get('g_mean'),
+                'Recall': metricas.get('recall'),
+                'Tamaño_MB': v.get('tamano_mb'),
+            })
+    return pd.DataFrame(filas, columns=['Modelo', 'Versión', 'Fecha', 'Tipo', 'ROC_AUC', 'G_mean',
+                                        'Recall', 'Tamaño_MB'])
+
+
+def cargar_modelo(nombre, version=None, compilado=True, mmap=True, directorio=None):
+    """
+    Cargar una versión registrada
+
+    Con ``compilado=True`` (y si la versión es un bosque) se devuelve el
+    ``BosqueCompilado`` con sus arreglos mapeados en memoria: la carga no lee
+    los árboles, tarda lo mismo sea cual sea el tamaño del modelo, y todos los
+    procesos que lo cargan comparten las mismas páginas del caché del sistema.
+    Con ``compilado=False`` se devuelve el estimador original (joblib con
+    ``mmap_mode='r'``; sklearn copia los nodos de cada árbol al deserializar,
+    así que esta ruta sí depende del tamaño).
+
+    Parameters:
+    -----------
+    nombre : str
+    version : int, optional
+        Por defecto la más reciente
+    compilado : bool
+        Devolver el bosque aplanado en lugar del estimador de sklearn
+    mmap : bool
+        Mapear los arreglos en memoria en lugar de leerlos
+    directorio : str o Path
+
+    Returns:
+    --------
+    tuple : (modelo, metadata); metadata incluye 'segundos_carga'
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_MODELOS
+    versiones = _leer_indice(directorio)['modelos'].get(nombre)
+    if not versiones:
+        raise KeyError(f"No hay versiones registradas de '{nombre}' en {directorio}")
+    version = version if version is not None else max(v['version'] for v in versiones)
+    ruta = directorio / nombre / f"v{version:03d}"
+    metadata = json.loads((ruta / "metadata.json").read_text(encoding='utf-8'))
+
+    mmap_mode = 'r' if mmap else None
+    t0 = time.perf_counter()
+    if compilado and 'bosque' in metadata['archivos']:
+        modelo = BosqueCompilado.cargar(ruta / metadata['archivos']['bosque'], mmap_mode=mmap_mode)
+    else:
+        modelo = joblib.load(ruta / metadata['archivos']['modelo'], mmap_mode=mmap_mode)
+    metadata['segundos_carga'] = time.perf_counter() - t0
+    print(f"📂 {nombre} v{version:03d} cargado en {metadata['segundos_carga'] * 1000:.1f} ms "
+          f"({type(modelo).__name__})")
+    return modelo, metadata
+
+
+def cargar_pipeline(nombre, version=None, directorio=None):
+    """Preprocesamiento ajustado guardado junto a una versión (None si no tiene)"""
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_MODELOS
+    versiones = _leer_indice(directorio)['modelos'].get(nombre) or []
+    version = version if version is not None else max((v['version'] for v in versiones), default=0)
+    ruta = directorio / nombre / f"v{version:03d}" / "pipeline.pkl"
+    return joblib.load(ruta) if ruta.exists() else None
+
+
+def cargar_deriva(nombre, version=None, directorio=None):
+    """Perfil de deriva guardado junto a una versión (None si no tiene)"""
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_MODELOS
+    versiones = _leer_indice(directorio)['modelos'].get(nombre) or []
+    version = version if version is not None else max((v['version'] for v in versiones), default=0)
+    ruta = directorio / nombre / f"v{version:03d}" / "deriva.joblib"
+    return PerfilDeriva.cargar(ruta) if ruta.exists() else None
@@ -0,0 +1,427 @@
+"""
+SMOTE con vecinos aproximados y generación por bloques
+Índice de vecinos con un bosque de árboles de proyecciones aleatorias sobre la
+clase minoritaria y filas sintéticas escritas por bloques en float32, en
+memoria, en un .npy mapeado o como generador para ``partial_fit``
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator
+
+ALGORITMOS = ('aproximado', 'exacto')
+
+
+def _filas(X, posiciones):
+    """Filas de X (DataFrame o arreglo, también memmap) como float32"""
+    if isinstance(X, pd.DataFrame):
+        return X.iloc[posiciones].to_numpy(dtype=np.float32)
+    return np.asarray(X[posiciones], dtype=np.float32)
+
+
+def _bloque(X, inicio, fin):
+    if isinstance(X, pd.DataFrame):
+        return X.iloc[inicio:fin].to_numpy(dtype=np.float32)
+    return np.asarray(X[inicio:fin], dtype=np.float32)
+
+
+def _particion_rp(X, tamano_hoja, rng, tamano_bloque=65536):
+    """
+    Hojas de un árbol de proyecciones aleatorias: cada grupo con más de
+    ``tamano_hoja`` filas se parte por la mediana de su proyección sobre una
+    dirección gaussiana, nivel por nivel para todos los grupos a la vez
+    """
+    n, d = X.shape
+    grupo = np.zeros(n, dtype=np.int64)
+    n_grupos = 1
+    while True:
+        tamanos = np.bincount(grupo, minlength=n_grupos)
+        dividir = tamanos > tamano_hoja
+        if not dividir.any():
+            return grupo, n_grupos
+        filas = np.flatnonzero(dividir[grupo])
+        # Dirección de cada grupo: diferencia entre dos de sus filas al azar (sigue la forma de los datos)
+        por_grupo = filas[np.argsort(grupo[filas], kind='stable')]
+        divididos = np.flatnonzero(dividir)
+        inicios = np.searchsorted(grupo[por_grupo], divididos)
+        tamanos_div = tamanos[divididos]
+        a = rng.integers(0, tamanos_div)
+        b = (a + rng.integers(1, tamanos_div)) % tamanos_div
+        direcciones = np.zeros((n_grupos, d), dtype=np.float32)
+        direcciones[divididos] = X[por_grupo[inicios + a]] - X[por_grupo[inicios + b]]
+        proyeccion = np.empty(len(filas), dtype=np.float32)
+        for i in range(0, len(filas), tamano_bloque):
+            f = filas[i:i + tamano_bloque]
+            proyeccion[i:i + tamano_bloque] = np.einsum('ij,ij->i', X[f], direcciones[grupo[f]])
+        g = grupo[filas]
+        orden = np.lexsort((proyeccion, g))
+        g_ordenado = g[orden]
+        rango = np.arange(len(orden)) - np.searchsorted(g_ordenado, g_ordenado, side='left')
+        a_derecha = orden[rango >= tamanos[g_ordenado] // 2]
+        nuevo = np.cumsum(dividir) - 1 + n_grupos
+        seleccion = filas[a_derecha]
+        grupo[seleccion] = nuevo[grupo[seleccion]]
+        n_grupos += int(dividir.sum())
+
+
+def _vecinos_en_hojas(X, grupo, n_grupos, k, tamano_bloque=65536):
+    """k vecinos más cercanos de cada fila dentro de su propia hoja"""
+    n = len(X)
+    orden = np.argsort(grupo, kind='stable')
+    tamanos = np.bincount(grupo, minlength=n_grupos)
+    inicios = np.concatenate([[0], np.cumsum(tamanos)[:-1]])
+    m = int(tamanos.max())
+    # Matriz (hojas, m) de filas, rellena con -1
+    hojas = np.full((n_grupos, m), -1, dtype=np.int64)
+    g = grupo[orden]
+    hojas[g, np.arange(n) - inicios[g]] = orden
+
+    indices = np.full((n, k), -1, dtype=np.int64)
+    distancias = np.full((n, k), np.inf, dtype=np.float32)
+    kk = min(k, m - 1)
+    if kk <= 0:
+        return indices, distancias
+    paso = max(1, tamano_bloque // m)
+    for i in range(0, n_grupos, paso):
+        h = hojas[i:i + paso]
+        validas = h >= 0
+        P = X[np.where(validas, h, 0)]
+        normas = np.einsum('bmd,bmd->bm', P, P)
+        D = normas[:, :, None] + normas[:, None, :] - 2 * np.matmul(P, P.transpose(0, 2, 1))
+        D[~np.broadcast_to(validas[:, None, :], D.shape)] = np.inf
+        diagonal = np.arange(m)
+        D[:, diagonal, diagonal] = np.inf
+        cercanos = np.argpartition(D, kk - 1, axis=2)[:, :, :kk]
+        d_cercanos = np.take_along_axis(D, cercanos, axis=2)
+        i_cercanos = np.take_along_axis(np.broadcast_to(h[:, None, :], D.shape), cercanos, axis=2)
+        i_cercanos = np.where(np.isfinite(d_cercanos), i_cercanos, -1)
+        filas = h[validas]
+        indices[filas, :kk] = i_cercanos[validas]
+        distancias[filas, :kk] = d_cercanos[validas]
+    return indices, distancias
+
+
+def _combinar(indices, distancias, nuevos, d_nuevos, k):
+    """Los k mejores de dos listas de candidatos por fila, sin repetidos"""
+    candidatos = np.concatenate([indices, nuevos], axis=1)
+    d_candidatos = np.concatenate([distancias, d_nuevos], axis=1)
+    orden = np.argsort(candidatos, axis=1, kind='stable')
+    candidatos = np.take_along_axis(candidatos, orden, axis=1)
+    d_candidatos = np.take_along_axis(d_candidatos, orden, axis=1)
+    repetidos = candidatos[:, 1:] == candidatos[:, :-1]
+    d_candidatos[:, 1:][repetidos] = np.inf
+    d_candidatos[candidatos < 0] = np.inf
+    mejores = np.argpartition(d_candidatos, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(candidatos, mejores, axis=1), np.take_along_axis(d_candidatos, mejores, axis=1)
+
+
+def _refinar(X, indices, distancias, k, tamano_bloque):
+    """Un paso de "vecinos de mis vecinos": candidatos nuevos con distancia exacta"""
+    n = len(X)
+    nuevos = np.empty((n, k * k), dtype=np.int64)
+    d_nuevos = np.empty((n, k * k), dtype=np.float32)
+    paso = max(1, tamano_bloque // (k * k))
+    for i in range(0, n, paso):
+        actuales = indices[i:i + paso]
+        candidatos = np.where(actuales[:, :, None] >= 0, indices[np.maximum(actuales, 0)], -1).reshape(len(actuales), -1)
+        propias = np.arange(i, i + len(actuales))[:, None]
+        diferencia = X[np.maximum(candidatos, 0)] - X[i:i + paso][:, None, :]
+        d = np.einsum('bcd,bcd->bc', diferencia, diferencia)
+        d[(candidatos < 0) | (candidatos == propias)] = np.inf
+        nuevos[i:i + paso], d_nuevos[i:i + paso] = candidatos, d
+    return _combinar(indices, distancias, nuevos, d_nuevos, k)
+
+
+def vecinos_aproximados(X, k=5, n_arboles=8, tamano_hoja=64, refinamientos=1, random_state=None,
+                        tamano_bloque=65536):
+    """
+    k vecinos más cercanos aproximados de cada fila de X (sin incluirse a sí misma)
+
+    Cada árbol de proyecciones aleatorias reparte X en hojas de a lo sumo
+    ``tamano_hoja`` filas; dentro de cada hoja las distancias se calculan
+    exactas y en lote, los candidatos de todos los árboles se combinan y luego
+    se prueban los vecinos de los vecinos. El
+    costo es O(n · n_arboles · (d·log n + tamano_hoja·d)) en lugar del de un
+    árbol de búsqueda exacto, que en muchas dimensiones degenera a fuerza bruta.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        Matriz (filas, características); se usa en float32
+    k : int
+    n_arboles : int
+        Más árboles dan más recall a cambio de tiempo
+    tamano_hoja : int
+        Filas máximas por hoja (debe ser mayor que k)
+    refinamientos : int
+        Pasos de "vecinos de mis vecinos" tras los árboles (suben el recall a bajo costo)
+    random_state : int, optional
+    tamano_bloque : int
+        Filas procesadas a la vez (acota la memoria temporal)
+
+    Returns:
+    --------
+    tuple : (indices, distancias) de forma (filas, k), ordenados por distancia;
+            -1 / inf donde no se encontraron k vecinos (clases con ≤ k filas)
+    """
+    if tamano_hoja <= k:
+        raise ValueError(f"tamano_hoja ({tamano_hoja}) debe ser mayor que k ({k})")
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    rng = np.random.default_rng(random_state)
+    indices = np.full((len(X), k), -1, dtype=np.int64)
+    distancias = np.full((len(X), k), np.inf, dtype=np.float32)
+    for _ in range(n_arboles):
+        grupo, n_grupos = _particion_rp(X, tamano_hoja, rng, tamano_bloque)
+        nuevos, d_nuevos = _vecinos_en_hojas(X, grupo, n_grupos, k, tamano_bloque)
+        indices, distancias = _combinar(indices, distancias, nuevos, d_nuevos, k)
+    for _ in range(refinamientos):
+        indices, distancias = _refinar(X, indices, distancias, k, tamano_bloque)
+    orden = np.argsort(distancias, axis=1)
+    indices = np.take_along_axis(indices, orden, axis=1)
+    distancias = np.take_along_axis(distancias, orden, axis=1)
+    indices[~np.isfinite(distancias)] = -1
+    return indices, distancias
+
+
+def _vecinos_exactos(X, k):
+    from sklearn.neighbors import NearestNeighbors
+    k = min(k, len(X) - 1)
+    indices = np.full((len(X), max(k, 1)), -1, dtype=np.int64)
+    if k <= 0:
+        return indices
+    vecinos = NearestNeighbors(n_neighbors=k + 1).fit(X).kneighbors(X, return_distance=False)
+    return vecinos[:, 1:]
+
+
+class SMOTEAproximado(BaseEstimator):
+    """
+    Sobremuestreo SMOTE para conjuntos de entrenamiento grandes
+
+    Igual que ``imblearn.over_sampling.SMOTE``: cada fila sintética es
+    ``x + u · (vecino - x)`` con x una fila de la clase a sobremuestrear, uno
+    de sus k vecinos de la misma clase y u ~ U(0, 1). Cambia cómo se calcula:
+    - los vecinos salen de ``vecinos_aproximados`` (o de NearestNeighbors con
+      ``algoritmo='exacto'``), y solo se guardan sus índices
+    - las filas sintéticas se generan por bloques de ``tamano_bloque`` en
+      float32 y se escriben directo en el resultado: en memoria, en un .npy
+      mapeado (``fit_resample(..., ruta=...)``) o entregadas una a una por
+      ``generar`` para estimadores con ``partial_fit``
+
+    Compatible con ``clone`` y con ``busqueda_halving(remuestreo=...)``.
+
+    Parameters:
+    -----------
+    sampling_strategy : 'auto', float o dict
+        'auto' lleva cada clase no mayoritaria al tamaño de la mayoritaria; un
+        float es la proporción minoritaria / mayoritaria buscada (binario); un
+        dict da el total deseado por clase
+    k_neighbors : int
+    algoritmo : str
+        'aproximado' (bosque de proyecciones aleatorias) o 'exacto'
+    n_arboles, tamano_hoja, refinamientos : int
+        Parámetros del índice aproximado (ver ``vecinos_aproximados``)
+    tamano_bloque : int
+        Filas sintéticas generadas por bloque
+    random_state : int, optional
+    """
+
+    def __init__(self, sampling_strategy='auto', k_neighbors=5, algoritmo='aproximado', n_arboles=8,
+                 tamano_hoja=64, refinamientos=1, tamano_bloque=65536, random_state=None):
+        self.sampling_strategy = sampling_strategy
+        self.k_neighbors = k_neighbors
+        self.algoritmo = algoritmo
+        self.n_arboles = n_arboles
+        self.tamano_hoja = tamano_hoja
+        self.refinamientos = refinamientos
+        self.tamano_bloque = tamano_bloque
+        self.random_state = random_state
+
+    def _objetivos(self, clases, conteos):
+        """Filas sintéticas a generar por clase"""
+        mayoritaria = conteos.max()
+        if self.sampling_strategy == 'auto':
+            return {c: int(mayoritaria - n) for c, n in zip(clases, conteos) if n < mayoritaria}
+        if isinstance(self.sampling_strategy, float):
+            if len(clases) != 2:
+                raise ValueError("sampling_strategy float solo aplica a problemas binarios")
+            minoritaria = clases[np.argmin(conteos)]
+            deseado = int(self.sampling_strategy * mayoritaria)
+            if deseado < conteos.min():
+                raise ValueError(f"sampling_strategy={self.sampling_strategy} pediría quitar filas")
+            return {minoritaria: deseado - int(conteos.min())}
+        if isinstance(self.sampling_strategy, dict):
+            actuales = dict(zip(clases, conteos))
+            return {c: int(total - actuales[c]) for c, total in self.sampling_strategy.items()
+                    if total > actuales[c]}
+        raise ValueError(f"sampling_strategy no soportado: {self.sampling_strategy!r}")
+
+    def fit(self, X, y):
+        """Calcula los vecinos de cada clase a sobremuestrear (no guarda X)"""
+        if self.algoritmo not in ALGORITMOS:
+            raise ValueError(f"algoritmo debe ser uno de {ALGORITMOS}, se recibió '{self.algoritmo}'")
+        t0 = time.perf_counter()
+        y = np.asarray(y)
+        clases, conteos = np.unique(y, return_counts=True)
+        self.n_sinteticas_ = self._objetivos(clases, conteos)
+        self.posiciones_, self.vecinos_ = {}, {}
+        for clase, n in self.n_sinteticas_.items():
+            posiciones = np.flatnonzero(y == clase)
+            if n == 0 or len(posiciones) == 0:
+                continue
+            Xc = _filas(X, posiciones)
+            if self.algoritmo == 'exacto':
+                vecinos = _vecinos_exactos(Xc, self.k_neighbors)
+            else:
+                vecinos, _ = vecinos_aproximados(Xc, self.k_neighbors, n_arboles=self.n_arboles,
+                                                 tamano_hoja=self.tamano_hoja, refinamientos=self.refinamientos,
+                                                 random_state=self.random_state, tamano_bloque=self.tamano_bloque)
+            # Sin k vecinos (clase muy pequeña): se repite el más cercano, o la propia fila
+            faltantes = vecinos < 0
+            if faltantes.any():
+                cercano = np.where(vecinos[:, 0] >= 0, vecinos[:, 0], np.arange(len(vecinos)))
+                vecinos = np.where(faltantes, cercano[:, None], vecinos)
+            self.posiciones_[clase] = posiciones
+            self.vecinos_[clase] = vecinos
+        self.n_caracteristicas_ = X.shape[1]
+        self.segundos_indice_ = time.perf_counter() - t0
+        return self
+
+    def _sinteticas(self, X, clase, n, rng):
+        """n filas sintéticas de una clase, en float32"""
+        posiciones, vecinos = self.posiciones_[clase], self.vecinos_[clase]
+        elegidas = rng.integers(0, vecinos.size, n)
+        base, columna = np.divmod(elegidas, vecinos.shape[1])
+        # Solo se leen de X las filas usadas en este bloque
+        usadas, inversa = np.unique(np.concatenate([base, vecinos[base, columna]]), return_inverse=True)
+        Xu = _filas(X, posiciones[usadas])
+        x, vecino = Xu[inversa[:n]], Xu[inversa[n:]]
+        paso = rng.random((n, 1), dtype=np.float32)
+        return x + paso * (vecino - x)
+
+    def fit_resample(self, X, y, ruta=None):
+        """
+        X original seguido de las filas sintéticas de cada clase, como imblearn
+
+        Parameters:
+        -----------
+        X : DataFrame, arreglo o memmap (filas, características)
+        y : array-like
+        ruta : str o Path, optional
+            .npy donde escribir X remuestreada con memory map; sin ruta se
+            crea en memoria (float32, la mitad que el float64 de imblearn)
+
+        Returns:
+        --------
+        tuple : (X_res, y_res); DataFrame/Series si X/y lo eran
+        """
+        self.fit(X, y)
+        rng = np.random.default_rng(self.random_state)
+        y_arreglo = np.asarray(y)
+        n = len(y_arreglo)
+        total = n + sum(self.n_sinteticas_.values())
+        forma = (total, X.shape[1])
+        if ruta is not None:
+            Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+            X_res = np.lib.format.open_memmap(ruta, mode='w+', dtype=np.float32, shape=forma)
+        else:
+            X_res = np.empty(forma, dtype=np.float32)
+        y_res = np.empty(total, dtype=y_arreglo.dtype)
+
+        for i in range(0, n, self.tamano_bloque):
+            fin = min(i + self.tamano_bloque, n)
+            X_res[i:fin] = _bloque(X, i, fin)
+        y_res[:n] = y_arreglo
+        fila = n
+        for clase, n_clase in self.n_sinteticas_.items():
+            if clase not in self.vecinos_:
+                continue
+            for i in range(0, n_clase, self.tamano_bloque):
+                m = min(self.tamano_bloque, n_clase - i)
+                X_res[fila:fila + m] = self._sinteticas(X, clase, m, rng)
+                y_res[fila:fila + m] = clase
+                fila += m
+        if ruta is not None:
+            X_res.flush()
+
+        if isinstance(X, pd.DataFrame):
+            X_res = pd.DataFrame(X_res, columns=X.columns, copy=False)
+        if isinstance(y, pd.Series):
+            y_res = pd.Series(y_res, name=y.name)
+        return X_res, y_res
+
+    def generar(self, X, y, tamano_bloque=None, mezclar=True):
+        """
+        Bloques (X_bloque, y_bloque) con filas originales y sintéticas mezcladas
+
+        Cada bloque lleva una porción de las filas originales y la parte
+        proporcional de sintéticas de cada clase, así que todos los bloques
+        tienen la distribución de clases final. Pensado para
+        ``estimador.partial_fit`` (ver ``ajustar_incremental``); nunca existe
+        más de un bloque en memoria. Usa los vecinos de ``fit`` si ya se ajustó
+        con estos datos.
+
+        Parameters:
+        -----------
+        X, y : datos originales
+        tamano_bloque : int, optional
+            Filas originales por bloque (por defecto ``self.tamano_bloque``)
+        mezclar : bool
+            Barajar las filas dentro de cada bloque
+
+        Yields:
+        -------
+        tuple : (numpy.ndarray float32, numpy.ndarray)
+        """
+        if not hasattr(self, 'vecinos_'):
+            self.fit(X, y)
+        rng = np.random.default_rng(self.random_state)
+        y = np.asarray(y)
+        tamano_bloque = tamano_bloque or self.tamano_bloque
+        n_bloques = max(1, -(-len(y) // tamano_bloque))
+        reparto = {clase: np.diff(np.linspace(0, n_clase, n_bloques + 1).astype(np.int64))
+                   for clase, n_clase in self.n_sinteticas_.items() if clase in self.vecinos_}
+        for b in range(n_bloques):
+            inicio = b * tamano_bloque
+            partes_X = [_bloque(X, inicio, inicio + tamano_bloque)]
+            partes_y = [y[inicio:inicio + tamano_bloque]]
+            for clase, cantidades in reparto.items():
+                if cantidades[b]:
+                    partes_X.append(self._sinteticas(X, clase, int(cantidades[b]), rng))
+                    partes_y.append(np.full(cantidades[b], clase, dtype=y.dtype))
+            X_bloque, y_bloque = np.concatenate(partes_X), np.concatenate(partes_y)
+            if mezclar:
+                orden = rng.permutation(len(y_bloque))
+                X_bloque, y_bloque = X_bloque[orden], y_bloque[orden]
+            yield X_bloque, y_bloque
+
+
+def ajustar_incremental(estimador, bloques, clases=None):
+    """
+    Entrenar un estimador con ``partial_fit`` sobre un generador de bloques
+
+    Parameters:
+    -----------
+    estimador : estimador con partial_fit (SGDClassifier, MLPClassifier, ...)
+    bloques : iterable de (X_bloque, y_bloque), p. ej. ``SMOTEAproximado().generar(X, y)``
+    clases : array-like, optional
+        Todas las clases (obligatorio en el primer partial_fit de sklearn);
+        por defecto las del primer bloque
+
+    Returns:
+    --------
+    estimador : ajustado
+    """
+    t0 = time.perf_counter()
+    n_filas = n_bloques = 0
+    for X_bloque, y_bloque in bloques:
+        if clases is None:
+            clases = np.unique(y_bloque)
+        estimador.partial_fit(X_bloque, y_bloque, classes=clases)
+        n_filas += len(y_bloque)
+        n_bloques += 1
+    print(f"✓ {type(estimador).__name__} ajustado con {n_filas:,} filas en {n_bloques} bloques "
+          f"({time.perf_counter() - t0:.2f}s)")
+    return estimador
@@ -0,0 +1,403 @@
+"""
+Búsqueda de hiperparámetros con sucesivas mitades / Hyperband
+Mismos espacios que los GridSearchCV de los notebooks 07 y 08, evaluados en
+paralelo y con caché en disco por (parámetros, índices del fold, datos)
+"""
+
+import hashlib
+import json
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import recall_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+DIRECTORIO_CACHE = Path(__file__).resolve().parent.parent / "results" / "busquedas"
+METRICAS = ('recall', 'g_mean', 'roc_auc')
+
+# Espacios de búsqueda de 07_model_training_smote.ipynb y 08_balanced_random_forest.ipynb
+ESPACIOS = {
+    'rf': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 5, 10, 20],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': ['sqrt', 'log2'],
+    },
+    'brf': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 5, 10, 20],
+        'max_features': ['sqrt', 'log2'],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 4],
+        'sampling_strategy': ['auto', 'not majority'],
+        'replacement': [True, False],
+    },
+    'xgb': {
+        'n_estimators': [20, 50, 100, 150],
+        'max_depth': [3, 5, 7, 9],
+        'learning_rate': [0.01, 0.1, 0.2, 0.4],
+        'subsample': [0.6, 0.8, 1.0],
+        'colsample_bytree': [0.6, 0.8, 1.0],
+    },
+}
+
+
+def modelo_base(nombre, random_state=42):
+    """
+    Estimador base de cada espacio ('rf', 'brf' o 'xgb'), con un solo hilo
+    porque el paralelismo lo pone el pool de la búsqueda
+    """
+    if nombre == 'rf':
+        return RandomForestClassifier(random_state=random_state, n_jobs=1)
+    if nombre == 'brf':
+        from imblearn.ensemble import BalancedRandomForestClassifier
+        return BalancedRandomForestClassifier(random_state=random_state, n_jobs=1)
+    if nombre == 'xgb':
+        from xgboost import XGBClassifier
+        return XGBClassifier(eval_metric='logloss', random_state=random_state, n_jobs=1)
+    raise ValueError(f"Modelo '{nombre}' no reconocido. Opciones: {list(ESPACIOS)}")
+
+
+def g_mean(y_true, y_pred):
+    """Media geométrica de la sensibilidad de cada clase (igual que imblearn en binario)"""
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    sensibilidades = [np.mean(y_pred[y_true == clase] == clase) for clase in np.unique(y_true)]
+    return float(np.prod(sensibilidades) ** (1 / len(sensibilidades)))
+
+
+def _huella_datos(X, y):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(pd.DataFrame(X), index=False).to_numpy().tobytes())
+    h.update(pd.util.hash_pandas_object(pd.Series(np.asarray(y)), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _descripcion(estimador):
+    """Nombre y parámetros de un estimador o remuestreador, para las claves de caché"""
+    if estimador is None:
+        return None
+    return {'tipo': type(estimador).__name__,
+            'params': {k: repr(v) for k, v in sorted(estimador.get_params().items())}}
+
+
+def _clave_evaluacion(estimador, params, entrenamiento, validacion, huella, remuestreador=None):
+    """
+    Clave de una evaluación: configuración, índices de entrenamiento (ya recortados
+    a n_muestras) y de validación del fold, y datos. Los índices cubren n_splits,
+    random_state y el orden estratificado, que el número de fold no distingue
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps({
+        'estimador': _descripcion(estimador),
+        'params': {k: repr(v) for k, v in sorted(params.items())},
+        'datos': huella,
+        'remuestreo': _descripcion(remuestreador),
+    }, sort_keys=True).encode())
+    for indices in (entrenamiento, validacion):
+        h.update(np.ascontiguousarray(indices, dtype=np.int64).tobytes())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+def _clave_remuestreo(remuestreador, indices, huella):
+    """Clave de un fold remuestreado: índices de entrenamiento, remuestreador y datos"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(_descripcion(remuestreador), sort_keys=True).encode())
+    h.update(np.ascontiguousarray(indices, dtype=np.int64).tobytes())
+    h.update(huella.encode())
+    return h.hexdigest()
+
+
+# Estado de cada proceso de la búsqueda: datos y folds se envían una sola vez
+_DATOS_PROCESO = None
+# Folds remuestreados abiertos con memory map (solo lectura) en este proceso
+_FOLDS_CARGADOS = {}
+
+
+def _inicializar_proceso(estimador, X, y, folds, directorio, directorio_folds=None):
+    global _DATOS_PROCESO
+    _DATOS_PROCESO = (estimador, X, y, folds, directorio, directorio_folds)
+    _FOLDS_CARGADOS.clear()
+
+
+def _remuestrear(remuestreador, fold, n_muestras, clave):
+    """Aplica el remuestreador solo al entrenamiento del fold y guarda X/y como .npy"""
+    _, X, y, folds, _, directorio_folds = _DATOS_PROCESO
+    entrenamiento = folds[fold][0][:n_muestras]
+    t0 = time.perf_counter()
+    X_res, y_res = clone(remuestreador).fit_resample(X.iloc[entrenamiento].to_numpy(dtype=np.float64),
+                                                     y[entrenamiento])
+    for sufijo, arreglo in (('X', X_res), ('y', np.asarray(y_res))):
+        temporal = Path(directorio_folds) / f"{clave}_{sufijo}.{os.getpid()}.tmp.npy"
+        np.save(temporal, arreglo)
+        os.replace(temporal, Path(directorio_folds) / f"{clave}_{sufijo}.npy")
+    return time.perf_counter() - t0
+
+
+def _fold_remuestreado(clave):
+    """X/y remuestreados de un fold, compartidos por memory map entre procesos"""
+    if clave not in _FOLDS_CARGADOS:
+        _, X, _, _, _, directorio_folds = _DATOS_PROCESO
+        X_res = np.load(Path(directorio_folds) / f"{clave}_X.npy", mmap_mode='r')
+        y_res = np.load(Path(directorio_folds) / f"{clave}_y.npy", mmap_mode='r')
+        _FOLDS_CARGADOS[clave] = (pd.DataFrame(X_res, columns=X.columns, copy=False), y_res)
+    return _FOLDS_CARGADOS[clave]
+
+
+def _evaluar(params, fold, n_muestras, clave, clave_fold=None):
+    """
+    Ajusta una configuración en un fold con las primeras n_muestras filas de
+    entrenamiento (ya remuestreadas si hay clave_fold) y evalúa en la validación original
+    """
+    estimador, X, y, folds, directorio, _ = _DATOS_PROCESO
+    ruta = Path(directorio) / f"{clave}.pkl" if directorio else None
+    if ruta is not None and ruta.exists():
+        with open(ruta, 'rb') as f:
+            return dict(pickle.load(f), en_cache=True)
+
+    entrenamiento, validacion = folds[fold]
+    if clave_fold is not None:
+        X_fit, y_fit = _fold_remuestreado(clave_fold)
+    else:
+        X_fit, y_fit = X.iloc[entrenamiento[:n_muestras]], y[entrenamiento[:n_muestras]]
+    t0 = time.perf_counter()
+    modelo = clone(estimador).set_params(**params)
+    modelo.fit(X_fit, y_fit)
+    tiempo = time.perf_counter() - t0
+
+    y_val = y[validacion]
+    proba = modelo.predict_proba(X.iloc[validacion])[:, 1]
+    y_pred = modelo.predict(X.iloc[validacion])
+    resultado = {
+        'recall': float(recall_score(y_val, y_pred, zero_division=0)),
+        'g_mean': g_mean(y_val, y_pred),
+        'roc_auc': float(roc_auc_score(y_val, proba)) if len(np.unique(y_val)) > 1 else np.nan,
+        'segundos': tiempo,
+    }
+    if ruta is not None:
+        # Escritura atómica: una búsqueda interrumpida no deja archivos a medias
+        temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporal, 'wb') as f:
+            pickle.dump(resultado, f)
+        os.replace(temporal, ruta)
+    return dict(resultado, en_cache=False)
+
+
+def _orden_estratificado(y, random_state):
+    """
+    Permutación en la que cada prefijo conserva la proporción de clases, para
+    que los recursos pequeños de las primeras rondas sean representativos
+    """
+    rng = np.random.default_rng(random_state)
+    y = np.asarray(y)
+    posiciones = np.arange(len(y))
+    claves = np.empty(len(y))
+    for clase in np.unique(y):
+        miembros = posiciones[y == clase]
+        claves[rng.permutation(miembros)] = (np.arange(len(miembros)) + rng.random()) / len(miembros)
+    return np.argsort(claves, kind='stable')
+
+
+def _configuraciones(espacio, n, rng):
+    """Todas las combinaciones del espacio, o n de ellas al azar sin reemplazo"""
+    nombres = list(espacio)
+    total = math.prod(len(espacio[p]) for p in nombres)
+    indices = range(total) if n is None or n >= total else rng.choice(total, size=n, replace=False)
+    configuraciones = []
+    for indice in indices:
+        params = {}
+        for nombre in reversed(nombres):
+            indice, posicion = divmod(int(indice), len(espacio[nombre]))
+            params[nombre] = espacio[nombre][posicion]
+        configuraciones.append({nombre: params[nombre] for nombre in nombres})
+    return configuraciones
+
+
+def busqueda_halving(modelo, X, y, espacio=None, metrica='recall', factor=3, n_splits=5,
+                     min_muestras=None, n_configuraciones=None, hyperband=False, n_procesos=None,
+                     directorio_cache=None, refit=True, random_state=42, remuestreo=None):
+    """
+    Búsqueda de hiperparámetros por sucesivas mitades (o Hyperband) con CV estratificada
+
+    En cada ronda todas las configuraciones vivas se evalúan en los ``n_splits``
+    folds con un número creciente de filas de entrenamiento; solo el mejor
+    1/``factor`` (según ``metrica``) pasa a la ronda siguiente, con ``factor``
+    veces más filas. Cada evaluación (parámetros, fold, filas, hash de datos)
+    se guarda en disco, así que una búsqueda interrumpida se reanuda sin
+    repetir ajustes.
+
+    Con ``remuestreo`` (p. ej. ``SMOTE(random_state=42)``) el sobremuestreo se
+    aplica solo dentro del entrenamiento de cada fold, sin fuga hacia la
+    validación. Cada fold remuestreado se calcula una vez por ronda (no por
+    candidato), se guarda como .npy por (índices, remuestreador, datos) y los
+    procesos lo abren en solo lectura con memory map.
+
+    Parameters:
+    - modelo: 'rf', 'brf', 'xgb' o un estimador de sklearn
+    - X, y: datos de entrenamiento sin remuestrear si se usa ``remuestreo``
+      (X_train, y_train), o ya balanceados si no
+    - espacio: dict parámetro → valores (por defecto ESPACIOS[modelo])
+    - metrica: 'recall' (como los GridSearchCV originales), 'g_mean' o 'roc_auc'
+    - factor: proporción de configuraciones eliminadas por ronda
+    - n_splits: folds de StratifiedKFold (shuffle, random_state)
+    - min_muestras: filas de entrenamiento por fold en la primera ronda
+    - n_configuraciones: configuraciones a muestrear (por defecto todo el espacio)
+    - hyperband: si True, recorre varios brackets con distintas relaciones
+      configuraciones/recursos en lugar de una sola ronda de mitades
+    - n_procesos: procesos en paralelo (por defecto os.cpu_count(); 1 = en serie)
+    - directorio_cache: carpeta de resultados por fold (por defecto results/busquedas/;
+      False para no usar caché)
+    - refit: reajustar la mejor configuración con todos los datos
+    - random_state: semilla de folds, muestreo y estimador base
+    - remuestreo: remuestreador de imblearn aplicado dentro de cada fold (opcional)
+
+    Returns:
+    - dict con 'mejores_parametros', 'mejor_puntaje', 'mejor_modelo' (si refit),
+      'resultados' (DataFrame por configuración y ronda con recall, g_mean,
+      roc_auc y segundos) y 'evaluaciones' (ajustes realizados / en caché)
+    """
+    if metrica not in METRICAS:
+        raise ValueError(f"metrica debe ser una de {METRICAS}, se recibió '{metrica}'")
+    nombre = modelo if isinstance(modelo, str) else type(modelo).__name__
+    estimador = modelo_base(modelo, random_state) if isinstance(modelo, str) else modelo
+    espacio = espacio if espacio is not None else ESPACIOS[modelo]
+    X = pd.DataFrame(X).reset_index(drop=True)
+    y = np.asarray(y)
+    n_procesos = n_procesos or os.cpu_count() or 1
+    rng = np.random.default_rng(random_state)
+
+    if directorio_cache is False:
+        directorio = None
+    else:
+        directorio = Path(directorio_cache) if directorio_cache is not None else DIRECTORIO_CACHE
+        directorio.mkdir(parents=True, exist_ok=True)
+    huella = _huella_datos(X, y)
+    directorio_folds = None
+    if remuestreo is not None:
+        if directorio is not None:
+            directorio_folds = directorio / "folds"
+            directorio_folds.mkdir(exist_ok=True)
+        else:
+            directorio_folds = Path(tempfile.mkdtemp(prefix="folds_"))
+
+    # Folds fijos; dentro de cada fold el entrenamiento va en orden estratificado
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    folds = []
+    for entrenamiento, validacion in cv.split(X, y):
+        folds.append((entrenamiento[_orden_estratificado(y[entrenamiento], random_state)], validacion))
+    max_muestras = min(len(f[0]) for f in folds)
+
+    rondas_max = max(int(math.log(max_muestras / (min_muestras or max_muestras / factor ** 3), factor) + 1e-9), 0)
+    if hyperband:
+        # Brackets de Hyperband: de muchas configuraciones con pocas filas a pocas con todas
+        brackets = [(math.ceil((rondas_max + 1) / (s + 1) * factor ** s), s) for s in range(rondas_max, -1, -1)]
+    else:
+        total = math.prod(len(v) for v in espacio.values())
+        brackets = [(n_configuraciones or total, rondas_max)]
+
+    print(f"=== BÚSQUEDA {'HYPERBAND' if hyperband else 'POR SUCESIVAS MITADES'}: {nombre} "
+          f"({n_splits} folds, factor {factor}, {n_procesos} procesos) ===")
+    t0 = time.perf_counter()
+    registros = []
+    evaluaciones = {'ajustes': 0, 'en_cache': 0}
+
+    def _mapear(funcion, argumentos, pool):
+        if pool is None:
+            return [funcion(*a) for a in argumentos]
+        return list(pool.map(funcion, *zip(*argumentos)))
+
+    def _preparar_folds(n_muestras, pool):
+        """Remuestrea (una vez) el entrenamiento de cada fold para esta cantidad de filas"""
+        claves = [_clave_remuestreo(remuestreo, folds[fold][0][:n_muestras], huella)
+                  for fold in range(n_splits)]
+        pendientes = [(remuestreo, fold, n_muestras, clave) for fold, clave in enumerate(claves)
+                      if not (directorio_folds / f"{clave}_y.npy").exists()]
+        if pendientes:
+            segundos = _mapear(_remuestrear, pendientes, pool)
+            print(f"   🔁 {type(remuestreo).__name__} en {len(pendientes)} folds con {n_muestras:,} filas "
+                  f"({sum(segundos):.1f}s)")
+        return claves
+
+    def _ejecutar(tareas, pool):
+        claves_folds = {}
+        if remuestreo is not None:
+            for n in {n for _, _, n in tareas}:
+                claves_folds[n] = _preparar_folds(n, pool)
+        argumentos = [(params, fold, n, _clave_evaluacion(estimador, params, folds[fold][0][:n], folds[fold][1],
+                                                          huella, remuestreo),
+                       claves_folds[n][fold] if remuestreo is not None else None)
+                      for params, fold, n in tareas]
+        return _mapear(_evaluar, argumentos, pool)
+
+    pool = None
+    if n_procesos > 1:
+        pool = ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_proceso,
+                                   initargs=(estimador, X, y, folds, directorio, directorio_folds))
+    else:
+        _inicializar_proceso(estimador, X, y, folds, directorio, directorio_folds)
+    try:
+        for bracket, (n_inicial, s) in enumerate(brackets):
+            vivas = _configuraciones(espacio, n_inicial, rng)
+            for ronda in range(s + 1):
+                n_muestras = int(max_muestras * factor ** (ronda - s))
+                tareas = [(params, fold, n_muestras) for params in vivas for fold in range(n_splits)]
+                resultados = _ejecutar(tareas, pool)
+                for r in resultados:
+                    evaluaciones['en_cache' if r['en_cache'] else 'ajustes'] += 1
+
+                puntajes = []
+                for i, params in enumerate(vivas):
+                    por_fold = pd.DataFrame(resultados[i * n_splits:(i + 1) * n_splits])
+                    registro = {'bracket': bracket, 'ronda': ronda, 'n_muestras': n_muestras,
+                                'params': params, **{m: por_fold[m].mean() for m in METRICAS},
+                                f'{metrica}_std': por_fold[metrica].std(),
+                                'segundos': por_fold['segundos'].sum()}
+                    registros.append(registro)
+                    puntajes.append(registro[metrica])
+
+                print(f"   Bracket {bracket} ronda {ronda}: {len(vivas)} configuraciones × {n_splits} folds "
+                      f"con {n_muestras:,} filas | mejor {metrica}: {np.nanmax(puntajes):.4f}")
+                if ronda < s:
+                    mantener = max(len(vivas) // factor, 1)
+                    orden = np.argsort(-np.nan_to_num(puntajes, nan=-np.inf), kind='stable')
+                    vivas = [vivas[i] for i in orden[:mantener]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _FOLDS_CARGADOS.clear()
+        if directorio_folds is not None and directorio is None:
+            shutil.rmtree(directorio_folds, ignore_errors=True)
+
+    resultados = pd.DataFrame(registros)
+    # Solo compiten las configuraciones evaluadas con todos los recursos
+    finales = resultados[resultados['n_muestras'] == resultados['n_muestras'].max()]
+    mejor = finales.loc[finales[metrica].idxmax()]
+    print(f"✓ {evaluaciones['ajustes']} ajustes nuevos, {evaluaciones['en_cache']} desde caché, "
+          f"{time.perf_counter() - t0:.1f}s")
+    print(f"🏆 Mejores hiperparámetros: {mejor['params']}")
+    print(f"   {metrica}: {mejor[metrica]:.4f} | G-mean: {mejor['g_mean']:.4f} | ROC-AUC: {mejor['roc_auc']:.4f}")
+
+    mejor_modelo = None
+    if refit:
+        X_fit, y_fit = (X, y) if remuestreo is None else clone(remuestreo).fit_resample(X, y)
+        mejor_modelo = clone(estimador).set_params(**mejor['params']).fit(X_fit, y_fit)
+
+    return {
+        'mejores_parametros': mejor['params'],
+        'mejor_puntaje': float(mejor[metrica]),
+        'mejor_modelo': mejor_modelo,
+        'resultados': resultados.sort_values(['n_muestras', metrica], ascending=False, ignore_index=True),
+        'evaluaciones': evaluaciones,
+    }
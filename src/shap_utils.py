@@ -1,9 +1,802 @@
+import contextlib
+import hashlib
+import io
+import os
+import pickle
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from pathlib import Path
+
 import shap
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-def crear_shap_plot(rf_model, X_train, X_test, plot_type="bar", max_samples=100, clase=1):
+from instrumentacion_utils import instrumentar, tramo
+
+
+# =================================================================
+# CACHÉ DE EXPLICACIONES SHAP
+# =================================================================
+
+_HUELLAS_MODELO = weakref.WeakKeyDictionary()
+
+
+def huella_modelo(modelo):
+    """
+    Huella (hash BLAKE2b) del modelo serializado: cambia si el modelo se reentrena
+
+    Se memoriza por objeto junto con la identidad de sus atributos, que cambian
+    al reentrenar (``estimators_``, ``_Booster``...), para no re-serializar
+    el bosque en cada llamada.
+    """
+    estado = tuple((k, id(v)) for k, v in sorted(vars(modelo).items()))
+    try:
+        guardado = _HUELLAS_MODELO.get(modelo)
+    except TypeError:
+        guardado = None
+    if guardado is not None and guardado[0] == estado:
+        return guardado[1]
+
+    huella = hashlib.blake2b(pickle.dumps(modelo, protocol=pickle.HIGHEST_PROTOCOL),
+                             digest_size=16).hexdigest()
+    try:
+        _HUELLAS_MODELO[modelo] = (estado, huella)
+    except TypeError:
+        pass
+    return huella
+
+
+def huella_datos(X):
+    """
+    Huella de un DataFrame: contenido por fila, nombres de columnas y orden
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(list(X.columns)).encode())
+    h.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _normalizar_shap(shap_values):
+    """
+    Lleva la salida de TreeExplainer a un arreglo (muestras, características[, clases])
+    sin importar la versión de shap (lista por clase o arreglo 3D)
+    """
+    if isinstance(shap_values, list):
+        return np.stack(shap_values, axis=-1)
+    return np.asarray(shap_values)
+
+
+class CacheSHAP:
+    """
+    Caché LRU de matrices SHAP con límite de memoria y volcado opcional a disco.
+    Las matrices guardadas quedan de solo lectura
+
+    Parameters:
+    - memoria_max_mb: memoria máxima ocupada por las matrices en RAM
+    - directorio_spill: si se indica, las matrices desalojadas se guardan como .npy
+      y se vuelven a leer con memory map cuando se piden de nuevo
+    """
+
+    def __init__(self, memoria_max_mb=512, directorio_spill=None):
+        self.memoria_max = int(memoria_max_mb * 1024 ** 2)
+        self.directorio_spill = Path(directorio_spill) if directorio_spill else None
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _ruta_spill(self, clave):
+        return self.directorio_spill / f"shap_{clave[0]}_{clave[1]}.npy"
+
+    def obtener(self, clave):
+        if clave in self._entradas:
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return self._entradas[clave]
+        if self.directorio_spill and self._ruta_spill(clave).exists():
+            self.aciertos += 1
+            return np.load(self._ruta_spill(clave), mmap_mode='r')
+        self.fallos += 1
+        return None
+
+    def guardar(self, clave, valores):
+        if clave in self._entradas:
+            return
+        # Solo lectura: todos los aciertos comparten este arreglo (o vistas de él), así
+        # que modificarlo en sitio corrompería la caché; quien lo necesite, que copie
+        valores.setflags(write=False)
+        self._entradas[clave] = valores
+        self._bytes += valores.nbytes
+        while self._bytes > self.memoria_max and len(self._entradas) > 1:
+            clave_vieja, valores_viejos = self._entradas.popitem(last=False)
+            self._bytes -= valores_viejos.nbytes
+            if self.directorio_spill:
+                self.directorio_spill.mkdir(parents=True, exist_ok=True)
+                np.save(self._ruta_spill(clave_vieja), valores_viejos)
+
+    def limpiar(self):
+        self._entradas.clear()
+        self._bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+
+_CACHE_SHAP = CacheSHAP()
+_EXPLAINERS = OrderedDict()
+
+
+def configurar_cache_shap(memoria_max_mb=512, directorio_spill=None):
+    """
+    Reemplaza la caché global de valores SHAP
+
+    Parameters:
+    - memoria_max_mb: límite de memoria para las matrices SHAP en RAM
+    - directorio_spill: carpeta donde volcar las matrices desalojadas (opcional)
+    """
+    global _CACHE_SHAP
+    _CACHE_SHAP = CacheSHAP(memoria_max_mb, directorio_spill)
+    return _CACHE_SHAP
+
+
+def limpiar_cache_shap():
+    """Vacía la caché de valores SHAP y de explainers"""
+    _CACHE_SHAP.limpiar()
+    _EXPLAINERS.clear()
+
+
+class ExplicadorSHAP:
+    """
+    Explainer reutilizable: calcula los valores SHAP de un modelo una sola vez
+    por conjunto de datos (en lotes y para todas las clases) y los guarda en la
+    caché global, de modo que todas las vistas (bar, beeswarm, violin,
+    comparativos, top-N) reutilicen el mismo cálculo
+
+    Parameters:
+    - modelo: modelo de árboles entrenado (RandomForest, BalancedRandomForest, XGBoost...)
+    - tamano_lote: filas por lote al llamar a TreeExplainer
+    """
+
+    def __init__(self, modelo, tamano_lote=500):
+        self.modelo = modelo
+        self.tamano_lote = tamano_lote
+        self.huella = huella_modelo(modelo)
+
+    @property
+    def explainer(self):
+        # Un TreeExplainer por huella de modelo (LRU pequeño)
+        if self.huella not in _EXPLAINERS:
+            with tramo('TreeExplainer'):
+                _EXPLAINERS[self.huella] = shap.TreeExplainer(self.modelo)
+            while len(_EXPLAINERS) > 8:
+                _EXPLAINERS.popitem(last=False)
+        _EXPLAINERS.move_to_end(self.huella)
+        return _EXPLAINERS[self.huella]
+
+    def shap_values(self, X):
+        """
+        Valores SHAP de X con forma (muestras, características[, clases])
+        """
+        with tramo('huella_datos', filas=len(X)):
+            clave = (self.huella, huella_datos(X))
+        valores = _CACHE_SHAP.obtener(clave)
+        if valores is not None:
+            print("Usando valores SHAP en caché")
+            return valores
+
+        print("Calculando valores SHAP...")
+        explainer = self.explainer
+        with tramo('shap_values', filas=len(X)):
+            lotes = [_normalizar_shap(explainer.shap_values(X.iloc[i:i + self.tamano_lote]))
+                     for i in range(0, len(X), self.tamano_lote)]
+            valores = np.concatenate(lotes, axis=0)
+        _CACHE_SHAP.guardar(clave, valores)
+        return valores
+
+    def shap_values_paralelo(self, X, n_procesos=None, tamano_bloque=1000, ruta_memmap=None):
+        """
+        Valores SHAP de todo X repartido en bloques entre varios procesos
+
+        Parameters:
+        - X: DataFrame completo a explicar (sin recortar a max_samples)
+        - n_procesos: número de procesos (por defecto todos los núcleos)
+        - tamano_bloque: filas por tarea enviada a cada proceso
+        - ruta_memmap: si se indica, el resultado se escribe en un .npy con memory map
+        """
+        clave = (self.huella, huella_datos(X))
+        valores = _CACHE_SHAP.obtener(clave)
+        if valores is not None:
+            print("Usando valores SHAP en caché")
+            return valores
+
+        valores = calcular_shap_paralelo(self.modelo, X, n_procesos=n_procesos,
+                                         tamano_bloque=tamano_bloque, ruta_memmap=ruta_memmap)
+        _CACHE_SHAP.guardar(clave, valores)
+        return valores
+
+    def valores_clase(self, X, clase=1):
+        """Valores SHAP de una sola clase, forma (muestras, características)"""
+        valores = self.shap_values(X)
+        return valores[:, :, clase] if valores.ndim == 3 else valores
+
+
+# =================================================================
+# CÁLCULO PARALELO POR BLOQUES
+# =================================================================
+
+_EXPLAINER_PROCESO = None
+
+
+def _inicializar_proceso(modelo):
+    # Cada proceso construye su TreeExplainer una sola vez
+    global _EXPLAINER_PROCESO
+    _EXPLAINER_PROCESO = shap.TreeExplainer(modelo)
+
+
+def _shap_bloque(inicio, bloque):
+    return inicio, _normalizar_shap(_EXPLAINER_PROCESO.shap_values(bloque))
+
+
+@instrumentar(filas='X')
+def calcular_shap_paralelo(modelo, X, n_procesos=None, tamano_bloque=1000, ruta_memmap=None):
+    """
+    Calcular valores SHAP de todo X dividiéndolo en bloques sobre un pool de procesos
+
+    Los bloques se escriben a medida que terminan en un arreglo preasignado
+    (o en un .npy con memory map si se indica ruta_memmap), y se informa el
+    progreso y el rendimiento en filas por segundo. Nunca hay más de
+    2 × n_procesos bloques enviados sin escribir.
+
+    Parameters:
+    - modelo: modelo de árboles entrenado
+    - X: DataFrame a explicar
+    - n_procesos: número de procesos (por defecto os.cpu_count())
+    - tamano_bloque: filas por bloque
+    - ruta_memmap: ruta .npy donde escribir el resultado (opcional)
+
+    Returns:
+    - Arreglo (muestras, características[, clases]) con los valores SHAP
+    """
+    n_procesos = n_procesos or os.cpu_count() or 1
+    n_filas = len(X)
+    inicios = list(range(0, n_filas, tamano_bloque))
+    print(f"=== SHAP PARALELO: {n_filas:,} filas, {len(inicios)} bloques, {n_procesos} procesos ===")
+
+    resultado = None
+    filas_hechas = 0
+    t0 = time.perf_counter()
+
+    def _escribir(inicio, valores):
+        nonlocal resultado, filas_hechas
+        if resultado is None:
+            forma = (n_filas,) + valores.shape[1:]
+            if ruta_memmap:
+                resultado = np.lib.format.open_memmap(ruta_memmap, mode='w+',
+                                                      dtype=valores.dtype, shape=forma)
+            else:
+                resultado = np.empty(forma, dtype=valores.dtype)
+        resultado[inicio:inicio + len(valores)] = valores
+        filas_hechas += len(valores)
+        transcurrido = time.perf_counter() - t0
+        print(f"   {filas_hechas:,}/{n_filas:,} filas ({filas_hechas / n_filas:.0%}) | "
+              f"{filas_hechas / transcurrido:,.0f} filas/s")
+
+    if n_procesos == 1:
+        _inicializar_proceso(modelo)
+        for inicio in inicios:
+            _escribir(*_shap_bloque(inicio, X.iloc[inicio:inicio + tamano_bloque]))
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_proceso,
+                                 initargs=(modelo,)) as pool:
+            # Memoria acotada: como mucho 2 × n_procesos bloques en vuelo, y cada
+            # futuro se descarta al escribirse para liberar su arreglo
+            pendientes = set()
+            for inicio in inicios:
+                if len(pendientes) >= 2 * n_procesos:
+                    hechas, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for tarea in hechas:
+                        _escribir(*tarea.result())
+                pendientes.add(pool.submit(_shap_bloque, inicio, X.iloc[inicio:inicio + tamano_bloque]))
+            for tarea in as_completed(pendientes):
+                pendientes.discard(tarea)
+                _escribir(*tarea.result())
+
+    if resultado is None:
+        resultado = np.empty((0, X.shape[1]))
+    if ruta_memmap and isinstance(resultado, np.memmap):
+        resultado.flush()
+
+    transcurrido = time.perf_counter() - t0
+    print(f"✓ SHAP calculado en {transcurrido:.2f}s ({n_filas / max(transcurrido, 1e-9):,.0f} filas/s)")
+    return resultado
+
+
+def _valores_muestra(rf_model, X_test_sample, n_procesos):
+    """Valores SHAP de la muestra, en serie o en paralelo según n_procesos"""
+    explicador = ExplicadorSHAP(rf_model)
+    if n_procesos and n_procesos > 1:
+        return explicador.shap_values_paralelo(X_test_sample, n_procesos=n_procesos)
+    return explicador.shap_values(X_test_sample)
+
+
+# =================================================================
+# MUESTREO REPRESENTATIVO PARA EXPLICACIONES
+# =================================================================
+
+MUESTREOS = ('estratificado', 'kmeans', 'primeras')
+
+
+def _asignar_por_estrato(tamanos, total):
+    """
+    Reparto proporcional de ``total`` muestras entre estratos (restos mayores),
+    garantizando al menos una muestra por estrato mientras alcance
+    """
+    tamanos = np.asarray(tamanos)
+    cuota = tamanos / tamanos.sum() * total
+    asignado = np.minimum(np.floor(cuota).astype(int), tamanos)
+    asignado[(asignado == 0) & (tamanos > 0)] = 1
+    faltan = total - asignado.sum()
+    if faltan > 0:
+        orden = np.argsort(-(cuota - np.floor(cuota)))
+        for i in orden:
+            if faltan == 0:
+                break
+            if asignado[i] < tamanos[i]:
+                asignado[i] += 1
+                faltan -= 1
+    while asignado.sum() > total:
+        asignado[np.argmax(asignado)] -= 1
+    return asignado
+
+
+def muestra_estratificada(X, max_samples, estratos, random_state=42):
+    """
+    Posiciones de una muestra estratificada proporcional de X
+
+    Parameters:
+    - X: DataFrame completo
+    - max_samples: tamaño de la muestra
+    - estratos: etiqueta de estrato por fila (p. ej. clase predicha + RIESGO_DESERCION)
+    - random_state: semilla
+
+    Returns:
+    - Arreglo ordenado con las posiciones seleccionadas
+    """
+    rng = np.random.default_rng(random_state)
+    codigos, _ = pd.factorize(pd.Series(np.asarray(estratos)).astype(str))
+    orden = np.argsort(codigos, kind='stable')
+    tamanos = np.bincount(codigos)
+    asignado = _asignar_por_estrato(tamanos, min(max_samples, len(X)))
+    limites = np.concatenate(([0], np.cumsum(tamanos)))
+    seleccion = [rng.choice(orden[limites[h]:limites[h + 1]], size=k, replace=False)
+                 for h, k in enumerate(asignado) if k > 0]
+    return np.sort(np.concatenate(seleccion)) if seleccion else np.empty(0, dtype=int)
+
+
+def muestra_kmeans(X, max_samples, random_state=42):
+    """
+    Resumen de X por k-means: la fila real más cercana a cada centroide,
+    con peso igual al tamaño de su cluster
+
+    Returns:
+    - (posiciones, pesos)
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import pairwise_distances_argmin
+
+    valores = np.asarray(X, dtype=np.float64)
+    km = MiniBatchKMeans(n_clusters=min(max_samples, len(X)), random_state=random_state,
+                         n_init=3, batch_size=min(len(X), 4096)).fit(valores)
+    posiciones = pairwise_distances_argmin(km.cluster_centers_, valores)
+    pesos = np.bincount(km.labels_, minlength=len(posiciones)).astype(np.float64)
+    # Dos centroides pueden compartir la misma fila más cercana: se suman sus pesos
+    posiciones, inversa = np.unique(posiciones, return_inverse=True)
+    return posiciones, np.bincount(inversa, weights=pesos)
+
+
+@instrumentar('muestra', filas='X_test')
+def seleccionar_muestra(rf_model, X_test, max_samples, muestreo='estratificado', y_test=None,
+                        random_state=42):
+    """
+    Elegir el subconjunto de X_test a explicar
+
+    Parameters:
+    - rf_model: modelo entrenado (se usa su predicción para estratificar)
+    - X_test: datos a explicar
+    - max_samples: tamaño de la muestra (None = todo X_test)
+    - muestreo: "estratificado" (clase predicha × RIESGO_DESERCION), "kmeans"
+      (filas representativas con pesos) o "primeras" (las primeras max_samples)
+    - y_test: valores reales de RIESGO_DESERCION para estratificar (opcional)
+    - random_state: semilla
+
+    Returns:
+    - (X_muestra, pesos) donde pesos es None salvo en muestreo "kmeans"
+    """
+    if muestreo not in MUESTREOS:
+        raise ValueError(f"muestreo debe ser uno de {MUESTREOS}, se recibió '{muestreo}'")
+    if max_samples is None or len(X_test) <= max_samples:
+        return X_test.copy(), None
+
+    if muestreo == 'primeras':
+        return X_test.iloc[:max_samples].copy(), None
+
+    if muestreo == 'kmeans':
+        posiciones, pesos = muestra_kmeans(X_test, max_samples, random_state)
+        return X_test.iloc[posiciones].copy(), pesos
+
+    estratos = pd.Series(rf_model.predict(X_test)).astype(str).to_numpy()
+    if y_test is not None:
+        estratos = np.char.add(np.char.add(estratos, '_'), np.asarray(y_test).astype(str))
+    posiciones = muestra_estratificada(X_test, max_samples, estratos, random_state)
+    return X_test.iloc[posiciones].copy(), None
+
+
+@instrumentar(filas='X_test')
+def ranking_convergente(rf_model, X_test, top_n=10, clase=1, tamano_lote=50, max_samples=2000,
+                        paciencia=3, y_test=None, random_state=42):
+    """
+    Agregar muestras por lotes hasta que el ranking top-N de |SHAP| medio se estabilice
+
+    El orden de incorporación es una permutación estratificada de X_test, de modo
+    que cada prefijo es representativo. Tras cada lote se recalcula el ranking y
+    el error estándar de cada importancia; se detiene cuando el top-N no cambia
+    durante ``paciencia`` lotes seguidos o al llegar a ``max_samples``.
+
+    Parameters:
+    - rf_model: modelo de árboles entrenado
+    - X_test: datos candidatos a explicar
+    - top_n: tamaño del ranking que debe estabilizarse
+    - clase: clase cuyos valores SHAP se usan
+    - tamano_lote: filas añadidas por iteración
+    - max_samples: máximo de filas a explicar
+    - paciencia: lotes seguidos con el mismo top-N para declarar convergencia
+    - y_test: RIESGO_DESERCION real para estratificar (opcional)
+    - random_state: semilla
+
+    Returns:
+    - dict con 'importancias' (DataFrame con media y error estándar), 'n_muestras',
+      'convergio', 'posiciones' e 'historial' (top-N por iteración)
+    """
+    limite = min(max_samples, len(X_test))
+    estratos = pd.Series(rf_model.predict(X_test)).astype(str).to_numpy()
+    if y_test is not None:
+        estratos = np.char.add(np.char.add(estratos, '_'), np.asarray(y_test).astype(str))
+
+    # Permutación estratificada: una muestra estratificada de tamaño límite, barajada
+    posiciones = muestra_estratificada(X_test, limite, estratos, random_state)
+    posiciones = np.random.default_rng(random_state).permutation(posiciones)
+
+    explainer = ExplicadorSHAP(rf_model).explainer
+    n_features = X_test.shape[1]
+    suma = np.zeros(n_features)
+    suma_cuadrados = np.zeros(n_features)
+    n = 0
+    historial = []
+    estables = 0
+    convergio = False
+
+    print(f"=== RANKING CONVERGENTE (top {top_n}, lotes de {tamano_lote}) ===")
+    for inicio in range(0, limite, tamano_lote):
+        lote = X_test.iloc[posiciones[inicio:inicio + tamano_lote]]
+        valores = _normalizar_shap(explainer.shap_values(lote))
+        valores = np.abs(valores[:, :, clase] if valores.ndim == 3 else valores)
+        suma += valores.sum(axis=0)
+        suma_cuadrados += (valores ** 2).sum(axis=0)
+        n += len(valores)
+
+        top = tuple(np.argsort(-suma)[:top_n])
+        estables = estables + 1 if historial and top == historial[-1] else 0
+        historial.append(top)
+        print(f"   {n:5d} muestras | top-{top_n} estable hace {estables} lotes")
+        if estables >= paciencia:
+            convergio = True
+            break
+
+    media = suma / n
+    varianza = np.maximum(suma_cuadrados / n - media ** 2, 0) * n / max(n - 1, 1)
+    importancias = pd.DataFrame({
+        'Característica': X_test.columns,
+        'Importancia_SHAP': media,
+        'Error_estandar': np.sqrt(varianza / n),
+    }).sort_values('Importancia_SHAP', ascending=False)
+
+    estado = "✓ Ranking estable" if convergio else "⚠️ Sin convergencia"
+    print(f"{estado} con {n} muestras de {len(X_test)}")
+    return {
+        'importancias': importancias,
+        'n_muestras': n,
+        'convergio': convergio,
+        'posiciones': np.sort(posiciones[:n]),
+        'historial': [[X_test.columns[i] for i in top] for top in historial],
+    }
+
+
+# =================================================================
+# IMPORTANCIA POR COHORTE
+# =================================================================
+
+COHORTES = ('SEDE', 'FACULTAD', 'PLAN', 'NODO_INICIO', 'ESTRATO')
+
+
+def _sumas_por_grupo(valores, codigos, n_grupos):
+    """Suma por grupo de las filas de ``valores`` con un único ordenamiento y reduceat"""
+    orden = np.argsort(codigos, kind='stable')
+    codigos_ordenados = codigos[orden]
+    inicios = np.flatnonzero(np.r_[True, codigos_ordenados[1:] != codigos_ordenados[:-1]])
+    sumas = np.zeros((n_grupos,) + valores.shape[1:])
+    sumas[codigos_ordenados[inicios]] = np.add.reduceat(valores[orden], inicios, axis=0)
+    return sumas
+
+
+@instrumentar(filas='X')
+def importancia_por_cohorte(shap_values, X, cohortes=COHORTES, clase=1, top_k=10, grupos=None,
+                            pesos=None, incluir_global=True):
+    """
+    Importancia SHAP agregada por cohorte a partir de una matriz SHAP ya calculada
+
+    Para cada columna de cohorte y cada uno de sus valores calcula, sin volver a
+    ejecutar el explainer, el |SHAP| medio y el SHAP medio con signo de cada
+    característica, y devuelve las top_k características de cada grupo.
+
+    Parameters:
+    - shap_values: matriz SHAP (n, features) o (n, features, clases), o ruta a un .npy
+    - X: datos explicados, en el mismo orden de filas que shap_values
+    - cohortes: columnas que definen las cohortes; se ignoran las que no existan
+    - clase: clase a usar si shap_values trae varias
+    - top_k: características por grupo (None = todas)
+    - grupos: DataFrame con las columnas de cohorte alineado por fila con X, para
+      cuando X está codificado/escalado y ya no contiene los valores originales
+    - pesos: peso por fila (p. ej. los de muestra_kmeans)
+    - incluir_global: añadir la cohorte 'GLOBAL' con todas las filas
+
+    Returns:
+    - DataFrame ordenado con columnas Cohorte, Grupo, N, Rango, Característica,
+      Importancia_SHAP (|SHAP| medio) y SHAP_medio (con signo)
+    """
+    valores = np.asarray(_cargar_arreglo(shap_values), dtype=float)
+    if valores.ndim == 3:
+        valores = valores[:, :, clase]
+    if len(valores) != len(X):
+        raise ValueError(f"shap_values tiene {len(valores)} filas y X tiene {len(X)}")
+
+    fuente = grupos if grupos is not None else X
+    faltantes = [c for c in cohortes if c not in fuente.columns]
+    if faltantes:
+        print(f"⚠️ Cohortes no encontradas en los datos: {faltantes}")
+    cohortes = [c for c in cohortes if c in fuente.columns]
+
+    n_features = valores.shape[1]
+    pesos = np.ones(len(valores)) if pesos is None else np.asarray(pesos, dtype=float)
+    # Una sola matriz [|SHAP|·w, SHAP·w, w] para acumular todo en cada reduceat
+    acumulables = np.column_stack([np.abs(valores) * pesos[:, None], valores * pesos[:, None], pesos])
+
+    definiciones = [('GLOBAL', np.zeros(len(valores), dtype=np.intp), np.array(['Todos'], dtype=object))] \
+        if incluir_global else []
+    for cohorte in cohortes:
+        codigos, etiquetas = pd.factorize(fuente[cohorte].to_numpy(), sort=True, use_na_sentinel=False)
+        definiciones.append((cohorte, codigos, np.asarray(etiquetas, dtype=object)))
+
+    partes = []
+    for cohorte, codigos, etiquetas in definiciones:
+        sumas = _sumas_por_grupo(acumulables, codigos, len(etiquetas))
+        peso_grupo = sumas[:, -1:]
+        media_abs = sumas[:, :n_features] / peso_grupo
+        media_signo = sumas[:, n_features:2 * n_features] / peso_grupo
+        n_grupo = np.bincount(codigos, minlength=len(etiquetas))
+
+        # Rango de cada característica dentro de su grupo
+        orden = np.argsort(-media_abs, axis=1, kind='stable')
+        k = n_features if top_k is None else min(top_k, n_features)
+        orden = orden[:, :k]
+        filas = np.repeat(np.arange(len(etiquetas)), k)
+        columnas = orden.ravel()
+        partes.append(pd.DataFrame({
+            'Cohorte': cohorte,
+            'Grupo': etiquetas[filas],
+            'N': n_grupo[filas],
+            'Rango': np.tile(np.arange(1, k + 1), len(etiquetas)),
+            'Característica': X.columns.to_numpy()[columnas],
+            'Importancia_SHAP': media_abs[filas, columnas],
+            'SHAP_medio': media_signo[filas, columnas],
+        }))
+
+    resultado = pd.concat(partes, ignore_index=True)
+    print(f"✓ Importancia SHAP para {sum(len(d[2]) for d in definiciones)} grupos en {len(definiciones)} cohortes")
+    return resultado
+
+
+# =================================================================
+# DIBUJO Y RENDERIZADO SIN INTERFAZ
+# =================================================================
+
+DIRECTORIO_VISUALIZACIONES = Path(__file__).resolve().parent.parent / "results" / "visualizations"
+
+
+def _titulo_clase(clase):
+    return f'Clase {clase} {"(Positiva)" if clase == 1 else "(Negativa)"}'
+
+
+@instrumentar('dibujo')
+def _dibujar_resumen(shap_values_clase, X, plot_type="bar", clase=1, titulo=None):
+    """Summary plot de SHAP (bar, beeswarm o violin) en una figura nueva"""
+    fig = plt.figure(figsize=(10, 8))
+    feature_names = X.columns.tolist()
+    
+    if plot_type == "bar":
+        print("Creando summary plot tipo barra (importancia promedio)...")
+        shap.summary_plot(shap_values_clase, X, 
+                         feature_names=feature_names, 
+                         plot_type="bar",
+                         show=False)
+        plt.title(titulo or f'Importancia SHAP - {_titulo_clase(clase)}')
+        
+    elif plot_type == "beeswarm":
+        print("Creando summary plot tipo beeswarm (distribución de valores)...")
+        shap.summary_plot(shap_values_clase, X, 
+                         feature_names=feature_names,
+                         show=False)
+        plt.title(titulo or ' ')
+    
+    elif plot_type == "violin":
+        print("Creando summary plot tipo violin...")
+        shap.summary_plot(shap_values_clase, X, 
+                         feature_names=feature_names,
+                         plot_type="violin",
+                         show=False)
+        plt.title(titulo or f'Distribución Violin SHAP - {_titulo_clase(clase)}')
+    
+    else:
+        plt.close(fig)
+        raise ValueError(f"plot_type debe ser 'bar', 'beeswarm' o 'violin', se recibió '{plot_type}'")
+    
+    return plt.gcf()
+
+
+@instrumentar('dibujo')
+def _dibujar_comparativo(shap_clase_0, shap_clase_1, X, top_features=10):
+    """Importancia SHAP de ambas clases lado a lado"""
+    feature_names = X.columns.tolist()
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 8))
+    
+    # Plot para clase 0 (negativa)
+    plt.sca(ax1)
+    shap.summary_plot(shap_clase_0, X, 
+                     feature_names=feature_names, 
+                     plot_type="bar",
+                     max_display=top_features,
+                     show=False)
+    ax1.set_title('Importancia SHAP - Clase 0 (Negativa)')
+    
+    # Plot para clase 1 (positiva)
+    plt.sca(ax2)
+    shap.summary_plot(shap_clase_1, X, 
+                     feature_names=feature_names, 
+                     plot_type="bar",
+                     max_display=top_features,
+                     show=False)
+    ax2.set_title('Importancia SHAP - Clase 1 (Positiva)')
+    return fig
+
+
+@instrumentar('dibujo')
+def _dibujar_importancias(importancias, top_n=10, titulo=" "):
+    """Barras horizontales de importancias (p. ej. feature_importances_ de un bosque)"""
+    importancias = pd.Series(importancias).sort_values(ascending=False).head(top_n)[::-1]
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.barh(importancias.index.astype(str), importancias.values, color="#1976D2")
+    ax.set_xlabel("Importancia")
+    ax.set_title(titulo)
+    return fig
+
+
+@instrumentar('guardar_figura')
+def _finalizar_figura(fig, guardar_en=None, mostrar=True, dpi=150):
+    """Guarda la figura si se pide y la muestra o la cierra para liberar memoria"""
+    plt.tight_layout()
+    if guardar_en:
+        Path(guardar_en).parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(guardar_en, dpi=dpi, bbox_inches='tight')
+    if mostrar:
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+def _inicializar_renderizado():
+    # Backend sin interfaz en cada proceso de renderizado
+    plt.switch_backend('Agg')
+
+
+def _cargar_arreglo(valor):
+    """Acepta un arreglo o la ruta de un .npy (se abre con memory map)"""
+    if isinstance(valor, (str, Path)):
+        return np.load(valor, mmap_mode='r')
+    return valor
+
+
+def _renderizar_tarea(tarea, directorio, dpi):
+    t0 = time.perf_counter()
+    tipo = tarea['tipo']
+    ruta = Path(directorio) / tarea['archivo']
+    previas = set(plt.get_fignums())
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if tipo == 'importancias':
+                fig = _dibujar_importancias(tarea['importancias'], tarea.get('top_n', 10),
+                                            tarea.get('titulo', " "))
+            else:
+                valores = _cargar_arreglo(tarea['shap_values'])
+                X = tarea['X']
+                if tipo == 'comparativo':
+                    fig = _dibujar_comparativo(np.asarray(valores[:, :, 0]), np.asarray(valores[:, :, 1]),
+                                               X, tarea.get('top_features', 10))
+                else:
+                    clase = tarea.get('clase', 1)
+                    valores_clase = valores[:, :, clase] if valores.ndim == 3 else valores
+                    fig = _dibujar_resumen(np.asarray(valores_clase), X, tipo, clase, tarea.get('titulo'))
+            _finalizar_figura(fig, ruta, mostrar=False, dpi=dpi)
+    finally:
+        # Cierre determinista aunque falle el dibujo, solo de las figuras de esta
+        # tarea: en serie las demás son del usuario (p. ej. un notebook)
+        for numero in set(plt.get_fignums()) - previas:
+            plt.close(numero)
+    return {'archivo': tarea['archivo'], 'ruta': str(ruta), 'segundos': time.perf_counter() - t0}
+
+
+@instrumentar()
+def renderizar_plots(tareas, directorio=None, n_procesos=None, dpi=150):
+    """
+    Renderizar muchos plots de SHAP e importancias directo a archivos, sin interfaz
+
+    Cada tarea es un dict con 'tipo' ("bar", "beeswarm", "violin", "comparativo"
+    o "importancias") y 'archivo' (nombre del .png), más:
+    - 'shap_values' (arreglo o ruta .npy) y 'X' para los plots SHAP, y
+      opcionalmente 'clase', 'titulo' y 'top_features'
+    - 'importancias' (Series o dict característica → importancia) y
+      opcionalmente 'top_n' y 'titulo' para el tipo "importancias"
+
+    Parameters:
+    - tareas: lista de tareas
+    - directorio: carpeta de salida (por defecto results/visualizations/)
+    - n_procesos: procesos en paralelo (por defecto os.cpu_count(); 1 = en serie)
+    - dpi: resolución de las imágenes
+
+    Returns:
+    - Lista de dicts con 'archivo', 'ruta' y 'segundos' en el orden de las tareas
+    """
+    directorio = Path(directorio) if directorio is not None else DIRECTORIO_VISUALIZACIONES
+    directorio.mkdir(parents=True, exist_ok=True)
+    n_procesos = min(n_procesos or os.cpu_count() or 1, max(len(tareas), 1))
+
+    print(f"=== RENDERIZANDO {len(tareas)} PLOTS EN {directorio} ({n_procesos} procesos) ===")
+    t0 = time.perf_counter()
+    if n_procesos == 1:
+        # Sin cambiar el backend del llamador: las figuras se guardan y se cierran sin mostrarse
+        resultados = [_renderizar_tarea(tarea, directorio, dpi) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_renderizado) as pool:
+            resultados = list(pool.map(_renderizar_tarea, tareas,
+                                       [directorio] * len(tareas), [dpi] * len(tareas)))
+
+    for r in resultados:
+        print(f"   ✓ {r['archivo']} ({r['segundos']:.2f}s)")
+    print(f"✓ {len(resultados)} plots en {time.perf_counter() - t0:.2f}s")
+    return resultados
+
+
+def _rechazar_kmeans(muestreo):
+    # Los centroides k-means representan clusters de tamaño distinto: dibujarlos
+    # como filas equivalentes sesgaría barras y beeswarm
+    if muestreo == 'kmeans':
+        raise ValueError("muestreo='kmeans' no se admite en los plots SHAP: usar mostrar_top_features "
+                         "o importancia_por_cohorte(pesos=...), que ponderan por cluster")
+
+
+@instrumentar(filas='X_test')
+def crear_shap_plot(rf_model, X_train, X_test, plot_type="bar", max_samples=100, clase=1,
+                    n_procesos=1, muestreo='estratificado', y_test=None, guardar_en=None, mostrar=True):
     """
     Crear UN SOLO plot de SHAP para tu caso específico
     
@@ -12,24 +805,28 @@ def crear_shap_plot(rf_model, X_train, X_test, plot_type="bar", max_samples=100,
     - X_train: datos de entrenamiento (DataFrame)
     - X_test: datos de prueba (DataFrame) 
     - plot_type: "bar" para importancia, "beeswarm" para distribución
-    - max_samples: número máximo de muestras a analizar
+    - max_samples: número máximo de muestras a analizar (None = todo X_test)
     - clase: 0 para clase negativa, 1 para clase positiva (default=1)
+    - n_procesos: si es mayor que 1, calcula SHAP por bloques en paralelo
+    - muestreo: "estratificado" o "primeras" (ver seleccionar_muestra); "kmeans"
+      no se admite porque summary_plot no puede ponderar las filas
+    - y_test: RIESGO_DESERCION real, para estratificar también por la clase real
+    - guardar_en: ruta donde guardar la figura (opcional)
+    - mostrar: si False, la figura se cierra sin llamar a plt.show()
     """
+    _rechazar_kmeans(muestreo)
     
     print(f"=== CREANDO PLOT SHAP PARA CLASE {clase} ===")
     
     # Limitar muestras si es necesario
-    if len(X_test) > max_samples:
-        X_test_sample = X_test.iloc[:max_samples].copy()
-        print(f"Usando {max_samples} muestras de {len(X_test)} disponibles")
+    X_test_sample, _ = seleccionar_muestra(rf_model, X_test, max_samples, muestreo, y_test)
+    if len(X_test_sample) < len(X_test):
+        print(f"Usando {max_samples} muestras de {len(X_test)} disponibles (muestreo {muestreo})")
     else:
-        X_test_sample = X_test.copy()
         print(f"Usando todas las {len(X_test)} muestras")
     
-    # Crear explainer y calcular valores SHAP
-    print("Calculando valores SHAP...")
-    explainer = shap.TreeExplainer(rf_model)
-    shap_values = explainer.shap_values(X_test_sample)
+    # Calcular valores SHAP (o reutilizarlos de la caché)
+    shap_values = _valores_muestra(rf_model, X_test_sample, n_procesos)
     
     print(f"Forma original de shap_values: {shap_values.shape}")
     
@@ -54,104 +851,63 @@ def crear_shap_plot(rf_model, X_train, X_test, plot_type="bar", max_samples=100,
         raise ValueError(f"Error de dimensiones: SHAP tiene {shap_values_clase.shape[1]} características, X_test tiene {X_test_sample.shape[1]}")
     
     # Crear el plot
-    plt.figure(figsize=(10, 8))
-    
-    if plot_type == "bar":
-        print("Creando summary plot tipo barra (importancia promedio)...")
-        shap.summary_plot(shap_values_clase, X_test_sample, 
-                         feature_names=feature_names, 
-                         plot_type="bar",
-                         show=False)
-        plt.title(f'Importancia SHAP - Clase {clase} {"(Positiva)" if clase == 1 else "(Negativa)"}')
-        
-    elif plot_type == "beeswarm":
-        print("Creando summary plot tipo beeswarm (distribución de valores)...")
-        shap.summary_plot(shap_values_clase, X_test_sample, 
-                         feature_names=feature_names,
-                         show=False)
-        # plt.title(f'Distribución Valores SHAP - Clase {clase} {"(Positiva)" if clase == 1 else "(Negativa)"}')
-        plt.title(f' ')
-    
-    elif plot_type == "violin":
-        print("Creando summary plot tipo violin...")
-        shap.summary_plot(shap_values_clase, X_test_sample, 
-                         feature_names=feature_names,
-                         plot_type="violin",
-                         show=False)
-        plt.title(f'Distribución Violin SHAP - Clase {clase} {"(Positiva)" if clase == 1 else "(Negativa)"}')
-    
-    plt.tight_layout()
-    plt.show()
+    fig = _dibujar_resumen(shap_values_clase, X_test_sample, plot_type, clase)
+    _finalizar_figura(fig, guardar_en, mostrar)
     
     print(f"✓ Plot creado exitosamente para clase {clase}")
     
     return shap_values_clase
 
-def crear_plots_comparativos(rf_model, X_train, X_test, max_samples=50, top_features=10):
+@instrumentar(filas='X_test')
+def crear_plots_comparativos(rf_model, X_train, X_test, max_samples=50, top_features=10,
+                             n_procesos=1, muestreo='estratificado', y_test=None,
+                             guardar_en=None, mostrar=True):
     """
     Crear plots comparativos para ambas clases (lado a lado)
+
+    muestreo: "estratificado" o "primeras"; "kmeans" no se admite porque
+    summary_plot no puede ponderar las filas (ver mostrar_top_features)
     """
+    _rechazar_kmeans(muestreo)
     
     print("=== CREANDO PLOTS COMPARATIVOS ===")
     
     # Limitar muestras
-    X_test_sample = X_test.iloc[:max_samples] if len(X_test) > max_samples else X_test
+    X_test_sample, _ = seleccionar_muestra(rf_model, X_test, max_samples, muestreo, y_test)
     
-    # Calcular SHAP values
-    explainer = shap.TreeExplainer(rf_model)
-    shap_values = explainer.shap_values(X_test_sample)
+    # Calcular SHAP values (o reutilizarlos de la caché)
+    shap_values = _valores_muestra(rf_model, X_test_sample, n_procesos)
     
     # Extraer valores para ambas clases
     shap_clase_0 = shap_values[:, :, 0]  # Clase negativa
     shap_clase_1 = shap_values[:, :, 1]  # Clase positiva
     
-    feature_names = X_test_sample.columns.tolist()
-    
     # Crear figura con subplots
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 8))
-    
-    # Plot para clase 0 (negativa)
-    plt.sca(ax1)
-    shap.summary_plot(shap_clase_0, X_test_sample, 
-                     feature_names=feature_names, 
-                     plot_type="bar",
-                     max_display=top_features,
-                     show=False)
-    ax1.set_title('Importancia SHAP - Clase 0 (Negativa)')
-    
-    # Plot para clase 1 (positiva)
-    plt.sca(ax2)
-    shap.summary_plot(shap_clase_1, X_test_sample, 
-                     feature_names=feature_names, 
-                     plot_type="bar",
-                     max_display=top_features,
-                     show=False)
-    ax2.set_title('Importancia SHAP - Clase 1 (Positiva)')
-    
-    plt.tight_layout()
-    plt.show()
+    fig = _dibujar_comparativo(shap_clase_0, shap_clase_1, X_test_sample, top_features)
+    _finalizar_figura(fig, guardar_en, mostrar)
     
     print("✓ Plots comparativos creados")
     
     return shap_clase_0, shap_clase_1
 
-def mostrar_top_features(rf_model, X_train, X_test, max_samples=100, top_n=10):
+@instrumentar(filas='X_test')
+def mostrar_top_features(rf_model, X_train, X_test, max_samples=100, top_n=10, n_procesos=1,
+                         muestreo='estratificado', y_test=None):
     """
     Mostrar las características más importantes según SHAP
     """
     
     print(f"=== TOP {top_n} CARACTERÍSTICAS MÁS IMPORTANTES ===")
     
-    X_test_sample = X_test.iloc[:max_samples] if len(X_test) > max_samples else X_test
+    X_test_sample, pesos = seleccionar_muestra(rf_model, X_test, max_samples, muestreo, y_test)
     
-    explainer = shap.TreeExplainer(rf_model)
-    shap_values = explainer.shap_values(X_test_sample)
+    shap_values = _valores_muestra(rf_model, X_test_sample, n_procesos)
     
     # Para clase positiva (1)
     shap_clase_1 = shap_values[:, :, 1]
     
-    # Calcular importancia promedio (valor absoluto)
-    importancia_promedio = np.abs(shap_clase_1).mean(axis=0)
+    # Calcular importancia promedio (valor absoluto), ponderada si la muestra es un resumen k-means
+    importancia_promedio = np.average(np.abs(shap_clase_1), axis=0, weights=pesos)
     
     # Crear DataFrame con resultados
     feature_names = X_test_sample.columns.tolist()
@@ -162,8 +918,9 @@ def mostrar_top_features(rf_model, X_train, X_test, max_samples=100, top_n=10):
     
     print(f"\nTop {top_n} características para la clase POSITIVA:")
     print("-" * 60)
-    for i, (idx, row) in enumerate(df_importancia.head(top_n).iterrows()):
-        print(f"{i+1:2d}. {row['Característica']:35s} | {row['Importancia_SHAP']:.4f}")
+    top = df_importancia.head(top_n)
+    for i, (caracteristica, importancia) in enumerate(zip(top['Característica'], top['Importancia_SHAP'])):
+        print(f"{i+1:2d}. {caracteristica:35s} | {importancia:.4f}")
     
     return df_importancia
 
@@ -0,0 +1,464 @@
+"""
+Sketches fusionables para perfilar datasets muy grandes con memoria acotada
+HyperLogLog (valores únicos), Misra-Gries (categorías frecuentes),
+compactador tipo KLL (cuantiles) y momentos en streaming
+"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+def _normalizar_numericos(serie):
+    """
+    Lleva las columnas numéricas a float64 antes de hashear, para que un mismo
+    valor dé el mismo hash aunque un bloque se lea como int64 y otro como float64
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(np.float64)
+    return serie
+
+
+def hashear_valores(valores):
+    """
+    Hash determinista de 64 bits para una serie de valores (sin nulos)
+
+    Usa el mismo hash_key de pandas en todas las llamadas, de modo que
+    los sketches construidos sobre archivos distintos sean fusionables.
+    """
+    serie = _normalizar_numericos(pd.Series(valores).dropna())
+    return pd.util.hash_pandas_object(serie, index=False).to_numpy(dtype=np.uint64)
+
+
+def hashear_filas(df):
+    """
+    Hash de 64 bits por fila completa (los nulos se hashean como un valor más,
+    igual que en ``df.duplicated()``)
+    """
+    df = df.apply(_normalizar_numericos) if len(df.columns) else df
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+
+def combinar_dtypes(a, b):
+    """
+    Tipo común de una columna leída en varios bloques (por ejemplo int64 en un
+    bloque y float64 en otro cuando aparecen nulos)
+    """
+    a, b = np.dtype(a) if isinstance(a, str) else a, np.dtype(b) if isinstance(b, str) else b
+    if a == b:
+        return a
+    if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+        try:
+            return np.result_type(a, b)
+        except TypeError:
+            pass
+    return np.dtype(object)
+
+
+def _longitud_bits(valores):
+    """Número de bits significativos de cada entero uint64 (0 para el valor 0)"""
+    alto = (valores >> np.uint64(32)).astype(np.float64)
+    bajo = (valores & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp es exacto para enteros de 32 bits
+    return np.where(alto > 0, 32 + np.frexp(alto)[1], np.frexp(bajo)[1])
+
+
+class HyperLogLog:
+    """
+    Estimador HyperLogLog de valores únicos
+
+    Parameters:
+    -----------
+    precision : int
+        Bits usados para el índice de registro (4-18). Usa 2**precision bytes
+        de memoria y tiene un error relativo típico de 1.04 / sqrt(2**precision)
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision debe estar entre 4 y 18, se recibió {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registros = np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def error_relativo(self):
+        """Error estándar relativo teórico de la estimación"""
+        return 1.04 / np.sqrt(self.m)
+
+    def agregar(self, valores):
+        """Agrega valores (se ignoran los nulos)"""
+        return self.agregar_hashes(hashear_valores(valores))
+
+    def agregar_hashes(self, hashes):
+        """Agrega hashes uint64 ya calculados"""
+        if len(hashes) == 0:
+            return self
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        bits_resto = 64 - self.precision
+        indices = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+        resto = hashes & np.uint64((1 << bits_resto) - 1)
+        rangos = (bits_resto - _longitud_bits(resto) + 1).astype(np.uint8)
+        np.maximum.at(self.registros, indices, rangos)
+        return self
+
+    def fusionar(self, otro):
+        """Fusiona otro HyperLogLog de la misma precisión (máximo por registro)"""
+        if otro.precision != self.precision:
+            raise ValueError("Solo se pueden fusionar HyperLogLog con la misma precisión")
+        np.maximum(self.registros, otro.registros, out=self.registros)
+        return self
+
+    def estimar(self):
+        """Estimación del número de valores únicos"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimacion = alpha * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        ceros = int(np.count_nonzero(self.registros == 0))
+        if estimacion <= 2.5 * m and ceros > 0:
+            # Corrección para rango pequeño (linear counting)
+            estimacion = m * np.log(m / ceros)
+        return float(estimacion)
+
+
+def _unicos_ordenados(hashes):
+    """Valores únicos ordenados de un arreglo uint64 (ordenar + descartar repetidos)"""
+    hashes = np.sort(hashes)
+    if len(hashes) < 2:
+        return hashes
+    return hashes[np.concatenate(([True], hashes[1:] != hashes[:-1]))]
+
+
+class ConjuntoHashes:
+    """
+    Conjunto exacto de hashes de 64 bits con la misma interfaz que HyperLogLog
+
+    Ocupa 8 bytes por valor distinto (en lugar del valor completo); se usa en
+    los modos exactos de streaming, donde el resultado debe coincidir con
+    ``nunique()`` y ``duplicated()``.
+    """
+
+    error_relativo = 0.0
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self._pendientes = []
+        self._n_pendientes = 0
+
+    def agregar(self, valores):
+        """Agrega valores (se ignoran los nulos)"""
+        return self.agregar_hashes(hashear_valores(valores))
+
+    def agregar_hashes(self, hashes):
+        """Agrega hashes uint64 ya calculados"""
+        if len(hashes):
+            unicos = _unicos_ordenados(np.asarray(hashes, dtype=np.uint64))
+            self._pendientes.append(unicos)
+            self._n_pendientes += len(unicos)
+            # Consolidar solo cuando lo pendiente supera lo ya ordenado (costo amortizado)
+            if self._n_pendientes > max(len(self.hashes), 1 << 16):
+                self._consolidar()
+        return self
+
+    def contiene(self, hashes):
+        """Máscara de los hashes uint64 que ya están en el conjunto (búsqueda binaria)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        presentes = np.zeros(len(hashes), dtype=bool)
+        for ordenados in [self.hashes] + self._pendientes:
+            if len(ordenados):
+                posiciones = np.minimum(np.searchsorted(ordenados, hashes), len(ordenados) - 1)
+                presentes |= ordenados[posiciones] == hashes
+        return presentes
+
+    def _consolidar(self):
+        if self._pendientes:
+            self.hashes = _unicos_ordenados(np.concatenate([self.hashes] + self._pendientes))
+            self._pendientes = []
+            self._n_pendientes = 0
+
+    def fusionar(self, otro):
+        """Fusiona otro conjunto de hashes"""
+        otro._consolidar()
+        return self.agregar_hashes(otro.hashes)
+
+    def estimar(self):
+        """Número exacto de valores distintos"""
+        self._consolidar()
+        return float(len(self.hashes))
+
+
+class HeavyHitters:
+    """
+    Resumen Misra-Gries de las categorías más frecuentes
+
+    Cada conteo subestima el real en como máximo ``error_maximo``, que nunca
+    supera N / (k + 1). Mientras no haya desalojos el resumen es exacto.
+
+    Parameters:
+    -----------
+    k : int
+        Número máximo de contadores que se mantienen
+    """
+
+    def __init__(self, k=64):
+        self.k = k
+        self.contadores = {}
+        self.total = 0
+        self.error_maximo = 0
+
+    @property
+    def exacto(self):
+        """True si ningún contador ha sido recortado"""
+        return self.error_maximo == 0
+
+    def agregar(self, valores):
+        """Agrega una serie de valores (se ignoran los nulos)"""
+        conteos = pd.Series(valores).value_counts(dropna=True, sort=False)
+        return self._combinar(conteos, int(conteos.sum()), 0)
+
+    def fusionar(self, otro):
+        """Fusiona otro resumen Misra-Gries"""
+        conteos = pd.Series(otro.contadores, dtype=np.int64)
+        return self._combinar(conteos, otro.total, otro.error_maximo)
+
+    def _combinar(self, conteos, total, error):
+        if self.contadores:
+            conteos = pd.concat([pd.Series(self.contadores, dtype=np.int64), conteos])
+            conteos = conteos.groupby(level=0, sort=False).sum()
+        if len(conteos) > self.k:
+            # Restar el (k+1)-ésimo conteo y descartar los que quedan en cero
+            umbral = int(conteos.nlargest(self.k + 1).iloc[-1])
+            conteos = conteos[conteos > umbral] - umbral
+            error += umbral
+        self.contadores = {valor: int(conteo) for valor, conteo in conteos.items()}
+        self.total += total
+        self.error_maximo += error
+        return self
+
+    def top(self, n=10):
+        """Lista [(valor, conteo_estimado)] de las n categorías más frecuentes"""
+        return sorted(self.contadores.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+class CuantilesKLL:
+    """
+    Sketch de cuantiles por compactación (esquema tipo KLL simplificado)
+
+    Cada nivel guarda hasta ``k`` valores de peso 2**nivel. Compactar un nivel
+    introduce un error de rango de a lo sumo su peso; ``error_rango`` acumula
+    esa cota determinista (como fracción de n).
+    """
+
+    def __init__(self, k=512, semilla=42):
+        self.k = k
+        self.niveles = [np.empty(0)]
+        self.n = 0
+        self._error_abs = 0
+        self._rng = np.random.default_rng(semilla)
+
+    @property
+    def error_rango(self):
+        """Cota del error de rango de cualquier cuantil (fracción de n)"""
+        return self._error_abs / self.n if self.n else 0.0
+
+    def agregar(self, valores):
+        """Agrega valores numéricos (se ignoran los nulos)"""
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores):
+            self.niveles[0] = np.concatenate([self.niveles[0], valores])
+            self.n += len(valores)
+            self._compactar()
+        return self
+
+    def fusionar(self, otro):
+        """Fusiona otro sketch de cuantiles"""
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(np.empty(0))
+        for h, nivel in enumerate(otro.niveles):
+            self.niveles[h] = np.concatenate([self.niveles[h], nivel])
+        self.n += otro.n
+        self._error_abs += otro._error_abs
+        self._compactar()
+        return self
+
+    def _compactar(self):
+        h = 0
+        while h < len(self.niveles):
+            nivel = self.niveles[h]
+            if len(nivel) > self.k:
+                nivel = np.sort(nivel)
+                # Con longitud impar, un elemento se queda en el nivel actual
+                sobrante = nivel[-1:] if len(nivel) % 2 else np.empty(0)
+                pares = nivel[:len(nivel) - len(sobrante)]
+                promovidos = pares[self._rng.integers(2)::2]
+                self.niveles[h] = sobrante
+                if h + 1 == len(self.niveles):
+                    self.niveles.append(np.empty(0))
+                self.niveles[h + 1] = np.concatenate([self.niveles[h + 1], promovidos])
+                self._error_abs += 1 << h
+            h += 1
+
+    def cuantiles(self, qs):
+        """Cuantiles aproximados para la lista de probabilidades qs"""
+        if self.n == 0:
+            return [np.nan for _ in qs]
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(nivel), 1 << h, dtype=np.int64)
+                                for h, nivel in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind='mergesort')
+        valores = valores[orden]
+        acumulado = np.cumsum(pesos[orden])
+        posiciones = np.searchsorted(acumulado, np.asarray(qs) * acumulado[-1], side='left')
+        return valores[np.minimum(posiciones, len(valores) - 1)].tolist()
+
+
+class MomentosColumna:
+    """Conteo, media, desviación, mínimo y máximo fusionables (Chan et al.)"""
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def agregar(self, valores):
+        """Agrega valores numéricos (se ignoran los nulos)"""
+        serie = pd.Series(valores).dropna()
+        if len(serie):
+            otro = MomentosColumna()
+            otro.n = len(serie)
+            otro.media = float(serie.mean())
+            otro.m2 = float(((serie - otro.media) ** 2).sum())
+            otro.minimo = serie.min()
+            otro.maximo = serie.max()
+            self.fusionar(otro)
+        return self
+
+    def fusionar(self, otro):
+        """Fusiona otros momentos"""
+        if otro.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.media, self.m2 = otro.n, otro.media, otro.m2
+            self.minimo, self.maximo = otro.minimo, otro.maximo
+            return self
+        n = self.n + otro.n
+        delta = otro.media - self.media
+        self.media += delta * otro.n / n
+        self.m2 += otro.m2 + delta * delta * self.n * otro.n / n
+        self.n = n
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        return self
+
+    @property
+    def desviacion(self):
+        """Desviación estándar muestral (ddof=1, como describe())"""
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else np.nan
+
+
+class SketchDataset:
+    """
+    Perfil fusionable de un dataset construido con sketches de memoria acotada
+
+    Se alimenta con uno o varios DataFrames (por ejemplo, un archivo por
+    semestre) mediante ``agregar`` y se combina con otros perfiles mediante
+    ``fusionar``. La memoria depende del número de columnas y de los
+    parámetros de los sketches, no del número de filas.
+
+    Parameters:
+    -----------
+    precision : int
+        Precisión de los HyperLogLog (ver ``HyperLogLog``)
+    k_frecuentes : int
+        Contadores del resumen Misra-Gries por columna
+    k_cuantiles : int
+        Capacidad por nivel del sketch de cuantiles
+    exacto : bool
+        Si usar ``ConjuntoHashes`` en lugar de HyperLogLog, de modo que
+        únicos y duplicados sean exactos (memoria de 8 bytes por valor distinto)
+    """
+
+    def __init__(self, precision=14, k_frecuentes=64, k_cuantiles=512, exacto=False):
+        self.precision = precision
+        self.k_frecuentes = k_frecuentes
+        self.k_cuantiles = k_cuantiles
+        self.exacto = exacto
+        self.n_filas = 0
+        self.memoria_kb = 0.0
+        self.columnas = {}
+        self.filas_hll = self._nuevo_distintos()
+
+    def _nuevo_distintos(self):
+        return ConjuntoHashes() if self.exacto else HyperLogLog(self.precision)
+
+    def _nueva_columna(self, dtype):
+        return {
+            'dtype': dtype,
+            'nulos': 0,
+            'hll': self._nuevo_distintos(),
+            'frecuentes': HeavyHitters(self.k_frecuentes),
+            'momentos': MomentosColumna(),
+            'cuantiles': CuantilesKLL(self.k_cuantiles),
+        }
+
+    def agregar(self, df):
+        """Agrega las filas de un DataFrame al perfil"""
+        self.n_filas += len(df)
+        self.memoria_kb += df.memory_usage(deep=True).sum() / 1024
+        self.filas_hll.agregar_hashes(hashear_filas(df))
+
+        for col in df.columns:
+            serie = df[col]
+            estado = self.columnas.setdefault(col, self._nueva_columna(serie.dtype))
+            estado['dtype'] = combinar_dtypes(estado['dtype'], serie.dtype)
+            estado['nulos'] += int(serie.isna().sum())
+            estado['hll'].agregar(serie)
+            estado['frecuentes'].agregar(serie)
+            if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+                estado['momentos'].agregar(serie)
+                estado['cuantiles'].agregar(serie.to_numpy(dtype=np.float64, na_value=np.nan))
+        return self
+
+    def fusionar(self, otro):
+        """Fusiona otro SketchDataset construido con los mismos parámetros"""
+        if otro.exacto != self.exacto:
+            raise ValueError("No se puede fusionar un sketch exacto con uno aproximado")
+        self.n_filas += otro.n_filas
+        self.memoria_kb += otro.memoria_kb
+        self.filas_hll.fusionar(otro.filas_hll)
+        for col, estado_otro in otro.columnas.items():
+            if col not in self.columnas:
+                self.columnas[col] = self._nueva_columna(estado_otro['dtype'])
+            estado = self.columnas[col]
+            estado['dtype'] = combinar_dtypes(estado['dtype'], estado_otro['dtype'])
+            estado['nulos'] += estado_otro['nulos']
+            for clave in ('hll', 'frecuentes', 'momentos', 'cuantiles'):
+                estado[clave].fusionar(estado_otro[clave])
+        return self
+
+    def unicos(self, col):
+        """Valores únicos estimados de una columna (exactos si el resumen no desalojó)"""
+        estado = self.columnas[col]
+        if estado['frecuentes'].exacto:
+            return len(estado['frecuentes'].contadores)
+        no_nulos = self.n_filas - estado['nulos']
+        return int(min(round(estado['hll'].estimar()), no_nulos))
+
+    def duplicados(self):
+        """Filas duplicadas estimadas: n - filas distintas (HLL sobre hashes de fila)"""
+        return int(max(0, self.n_filas - round(self.filas_hll.estimar())))
+
+    def guardar(self, ruta):
+        """Guarda el sketch con pickle para fusionarlo después"""
+        with open(ruta, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def cargar(ruta):
+        """Carga un sketch guardado con ``guardar``"""
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,379 @@
+"""
+Contrato de calidad de datos para los archivos de semestre
+Tipos, nulos, rangos, DOCUMENTO único y códigos de PLAN conocidos verificados
+en una sola pasada vectorizada por bloque mientras el archivo se lee, de modo
+que un archivo defectuoso se rechaza antes de imputar, entrenar o calcular SHAP
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from eda_utils import _iterar_bloques, leer_por_bloques  # noqa: E402
+from sketch_utils import ConjuntoHashes, hashear_valores  # noqa: E402
+
+# Reglas por columna:
+#   tipo       'numero', 'entero' o 'texto' (los valores no numéricos cuentan como violación)
+#   minimo     límite inferior incluido
+#   maximo     límite superior incluido
+#   nulos      False si la columna no admite faltantes
+#   unico      True si ningún valor puede repetirse en el archivo; también acepta una
+#              severidad propia para los repetidos ('error' o 'advertencia')
+#   valores    valores permitidos (en PLAN se toman de ``planes_conocidos``)
+#   requerida  True si el archivo debe traer la columna
+#   severidad  'error' (detiene la lectura) o 'advertencia' (solo se reporta)
+REGLAS_COLUMNAS = {
+    # Los repetidos se reportan sin detener: el etiquetado deja una fila por DOCUMENTO
+    # (el 2024-2 real trae 11 repetidos). Con 'unico': 'error' la lectura se detiene
+    'DOCUMENTO': {'tipo': 'texto', 'nulos': False, 'unico': 'advertencia'},
+    'PAPA': {'tipo': 'numero', 'minimo': 0, 'maximo': 5, 'requerida': True},
+    'PROME_ACADE': {'tipo': 'numero', 'minimo': 0, 'maximo': 5},
+    'ESTRATO': {'tipo': 'entero', 'minimo': 0, 'maximo': 6, 'requerida': True},
+    'AVANCE_CARRERA': {'tipo': 'numero', 'minimo': 0, 'maximo': 100, 'requerida': True},
+    'NUMERO_MATRICULAS': {'tipo': 'entero', 'minimo': 1, 'nulos': False, 'requerida': True},
+    'PBM_CALCULADO': {'tipo': 'numero', 'minimo': 0, 'maximo': 100},
+    'EDAD': {'tipo': 'entero', 'minimo': 14, 'maximo': 90, 'severidad': 'advertencia'},
+    'RIESGO_DESERCION': {'tipo': 'entero', 'minimo': 0, 'maximo': 1},
+    # Un PLAN nuevo puede ser legítimo en un semestre nuevo: se reporta sin detener
+    'PLAN': {'tipo': 'texto', 'severidad': 'advertencia'},
+}
+
+SEVERIDADES = ('error', 'advertencia')
+TIPOS = ('numero', 'entero', 'texto')
+
+
+def _como_numero(serie):
+    """Valores como float64; lo no convertible queda en NaN"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(object)
+    if pd.api.types.is_bool_dtype(serie.dtype) or not pd.api.types.is_numeric_dtype(serie.dtype):
+        serie = pd.to_numeric(serie, errors='coerce')
+    return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _normalizar_codigos(valores):
+    """
+    Códigos como texto comparable: 2505, 2505.0 y ' 2505 ' son el mismo PLAN
+    sin importar si el archivo los trae como número o como texto
+    """
+    serie = pd.Series(valores).astype(object)
+    numeros = pd.to_numeric(serie, errors='coerce')
+    enteros = (numeros.notna() & (numeros == np.floor(numeros))).to_numpy()
+    texto = serie.astype(str).str.strip()
+    texto[enteros] = numeros[enteros].astype(np.int64).astype(str)
+    return texto
+
+
+def _esperado(nombre, regla):
+    """Descripción legible de la regla para el reporte"""
+    if nombre == 'rango':
+        minimo = regla.get('minimo', '-inf')
+        maximo = regla.get('maximo', 'inf')
+        return f"[{minimo}, {maximo}]"
+    return {
+        'ausente': 'columna presente',
+        'nulo': 'sin nulos',
+        'tipo': 'numérico',
+        'entero': 'entero',
+        'unico': 'sin repetidos',
+        'conocido': f"{len(regla.get('valores') or ())} códigos conocidos",
+    }.get(nombre, '')
+
+
+class Contrato:
+    """
+    Reglas de calidad de un archivo de estudiantes evaluadas bloque a bloque
+
+    Acumula el conteo de violaciones por columna y regla y las primeras
+    ``max_muestras`` filas de cada una (posición en el archivo contando desde
+    0 sin el encabezado, y el valor encontrado). La unicidad de DOCUMENTO entre
+    bloques usa un conjunto de hashes de 64 bits (8 bytes por documento).
+
+    Parameters:
+    -----------
+    reglas : dict, optional
+        Columna → regla; reemplaza la regla de ``REGLAS_COLUMNAS`` de esa
+        columna (una regla None quita la columna del contrato)
+    planes_conocidos : list, optional
+        Códigos de PLAN válidos; sin ellos no se verifica la pertenencia
+    max_muestras : int
+        Filas de ejemplo guardadas por columna y regla
+    """
+
+    def __init__(self, reglas=None, planes_conocidos=None, max_muestras=5):
+        reglas = {**REGLAS_COLUMNAS, **(reglas or {})}
+        self.reglas = {columna: dict(regla) for columna, regla in reglas.items() if regla is not None}
+        for columna, regla in self.reglas.items():
+            if regla.get('severidad', 'error') not in SEVERIDADES:
+                raise ValueError(f"severidad de '{columna}' debe ser una de {SEVERIDADES}")
+            if isinstance(regla.get('unico'), str) and regla['unico'] not in SEVERIDADES:
+                raise ValueError(f"unico de '{columna}' debe ser True o una de {SEVERIDADES}")
+            if regla.get('tipo', 'texto') not in TIPOS:
+                raise ValueError(f"tipo de '{columna}' debe ser uno de {TIPOS}")
+        if planes_conocidos is not None and 'PLAN' in self.reglas:
+            self.reglas['PLAN']['valores'] = list(planes_conocidos)
+        self.max_muestras = max_muestras
+        self._permitidos = {columna: pd.Index(pd.unique(_normalizar_codigos(regla['valores'])))
+                            for columna, regla in self.reglas.items() if regla.get('valores') is not None}
+        self._vistos = {columna: ConjuntoHashes() for columna, regla in self.reglas.items() if regla.get('unico')}
+        self.filas_ = 0
+        self.bloques_ = 0
+        self.violaciones_ = {}
+        self.muestras_ = []
+
+    @classmethod
+    def desde_referencia(cls, df, **opciones):
+        """Contrato con los códigos de PLAN de un dataset de referencia (p. ej. semestres anteriores)"""
+        planes = pd.unique(df['PLAN'].dropna()) if 'PLAN' in df.columns else None
+        return cls(planes_conocidos=planes, **opciones)
+
+    @classmethod
+    def desde_pipeline(cls, pipeline, **opciones):
+        """Contrato con los códigos de PLAN vistos al ajustar un ``PipelinePreprocesamiento``"""
+        planes = getattr(pipeline, 'categorias_onehot_', {}).get('PLAN')
+        return cls(planes_conocidos=planes, **opciones)
+
+    @property
+    def errores(self):
+        return sum(v['violaciones'] for v in self.violaciones_.values() if v['severidad'] == 'error')
+
+    @property
+    def advertencias(self):
+        return sum(v['violaciones'] for v in self.violaciones_.values() if v['severidad'] == 'advertencia')
+
+    def _registrar(self, columna, nombre, severidad, mascara, serie):
+        n = int(np.count_nonzero(mascara))
+        if n == 0:
+            return
+        clave = (columna, nombre)
+        if clave not in self.violaciones_:
+            self.violaciones_[clave] = {'severidad': severidad, 'violaciones': 0, 'muestras': 0}
+        registro = self.violaciones_[clave]
+        registro['violaciones'] += n
+        faltan = self.max_muestras - registro['muestras']
+        if faltan > 0 and serie is not None:
+            posiciones = np.flatnonzero(mascara)[:faltan]
+            for posicion, valor in zip(posiciones, serie.iloc[posiciones].tolist()):
+                self.muestras_.append({'Columna': columna, 'Regla': nombre,
+                                       'Fila': self.filas_ + int(posicion), 'Valor': valor})
+            registro['muestras'] += len(posiciones)
+
+    def validar_bloque(self, df):
+        """
+        Evaluar todas las reglas sobre un bloque de filas
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame
+            Bloque siguiente del archivo (las posiciones continúan las del anterior)
+
+        Returns:
+        --------
+        bool : True si el bloque agregó violaciones de severidad 'error'
+        """
+        errores_antes = self.errores
+        if self.bloques_ == 0:
+            for columna, regla in self.reglas.items():
+                if regla.get('requerida') and columna not in df.columns:
+                    self._registrar(columna, 'ausente', 'error', np.ones(1, dtype=bool), None)
+
+        for columna, regla in self.reglas.items():
+            if columna not in df.columns:
+                continue
+            serie = df[columna]
+            severidad = regla.get('severidad', 'error')
+            nulos = serie.isna().to_numpy()
+            if regla.get('nulos', True) is False:
+                self._registrar(columna, 'nulo', severidad, nulos, serie)
+
+            if regla.get('tipo') in ('numero', 'entero'):
+                valores = _como_numero(serie)
+                validos = ~np.isnan(valores)
+                self._registrar(columna, 'tipo', severidad, ~nulos & ~validos, serie)
+                if regla['tipo'] == 'entero':
+                    self._registrar(columna, 'entero', severidad, validos & (valores != np.floor(valores)), serie)
+                fuera = np.zeros(len(valores), dtype=bool)
+                if regla.get('minimo') is not None:
+                    fuera |= valores < regla['minimo']
+                if regla.get('maximo') is not None:
+                    fuera |= valores > regla['maximo']
+                self._registrar(columna, 'rango', severidad, fuera, serie)
+
+            if columna in self._vistos or columna in self._permitidos:
+                presentes = ~nulos
+                if columna in self._vistos:
+                    # hashear_valores descarta los nulos: los hashes quedan alineados con ``presentes``
+                    hashes = hashear_valores(serie)
+                    repetidos = pd.Series(hashes).duplicated().to_numpy() | self._vistos[columna].contiene(hashes)
+                    self._vistos[columna].agregar_hashes(hashes)
+                    mascara = np.zeros(len(serie), dtype=bool)
+                    mascara[presentes] = repetidos
+                    unico = regla['unico']
+                    self._registrar(columna, 'unico', unico if isinstance(unico, str) else severidad, mascara, serie)
+                if columna in self._permitidos:
+                    codigos = _normalizar_codigos(serie[presentes])
+                    mascara = np.zeros(len(serie), dtype=bool)
+                    mascara[presentes] = ~codigos.isin(self._permitidos[columna]).to_numpy()
+                    self._registrar(columna, 'conocido', severidad, mascara, serie)
+
+        self.filas_ += len(df)
+        self.bloques_ += 1
+        return self.errores > errores_antes
+
+    def reporte(self):
+        """
+        Returns:
+        --------
+        pandas.DataFrame : Una fila por columna y regla violada, errores primero
+        """
+        filas = [{'Columna': columna, 'Regla': nombre, 'Severidad': v['severidad'],
+                  'Esperado': _esperado(nombre, self.reglas.get(columna, {})),
+                  'Violaciones': v['violaciones'],
+                  'Porcentaje': 100 * v['violaciones'] / self.filas_ if self.filas_ else np.nan}
+                 for (columna, nombre), v in self.violaciones_.items()]
+        columnas = ['Columna', 'Regla', 'Severidad', 'Esperado', 'Violaciones', 'Porcentaje']
+        if not filas:
+            return pd.DataFrame(columns=columnas)
+        df = pd.DataFrame(filas, columns=columnas)
+        df['_orden'] = df['Severidad'].map({s: i for i, s in enumerate(SEVERIDADES)})
+        return df.sort_values(['_orden', 'Violaciones'], ascending=[True, False]).drop(columns='_orden') \
+                 .reset_index(drop=True)
+
+    def muestras(self):
+        """
+        Returns:
+        --------
+        pandas.DataFrame : Filas de ejemplo de cada violación (Columna, Regla, Fila, Valor)
+        """
+        return pd.DataFrame(self.muestras_, columns=['Columna', 'Regla', 'Fila', 'Valor'])
+
+    def resumen(self, nombre="datos"):
+        """Texto con el reporte y las muestras, para mensajes de error y logs"""
+        texto = [f"{nombre}: {self.errores:,} violaciones de error y {self.advertencias:,} advertencias "
+                 f"en {self.filas_:,} filas revisadas"]
+        if self.violaciones_:
+            texto += ["", self.reporte().to_string(index=False), "", "Muestras:",
+                      self.muestras().to_string(index=False)]
+        return "\n".join(texto)
+
+
+def _bloques_fuente(fuente, tamano_bloque, hoja):
+    if isinstance(fuente, (str, Path)):
+        if Path(fuente).suffix.lower() == '.feather':
+            return _iterar_bloques(pd.read_feather(fuente), tamano_bloque)
+        return leer_por_bloques(fuente, tamano_bloque, hoja)
+    return _iterar_bloques(fuente, tamano_bloque)
+
+
+def validar_datos(fuente, contrato=None, tamano_bloque=50000, hoja=None, detener=True, verbose=True):
+    """
+    Validar un archivo contra el contrato de calidad mientras se lee por bloques
+
+    Parameters:
+    -----------
+    fuente : str, Path, pandas.DataFrame o iterable de DataFrames
+        Archivo .csv/.xlsx/.parquet/.feather o bloques ya leídos
+    contrato : Contrato, optional
+        Reglas a aplicar (por defecto ``Contrato()`` con ``REGLAS_COLUMNAS``)
+    tamano_bloque : int
+        Filas por bloque al leer desde archivo
+    hoja : str, optional
+        Hoja de Excel a leer
+    detener : bool
+        Dejar de leer en el primer bloque con violaciones de error
+    verbose : bool
+        Imprimir el resumen
+
+    Returns:
+    --------
+    dict : valido, errores, advertencias, filas_leidas, detenido, segundos,
+           reporte (DataFrame) y muestras (DataFrame)
+    """
+    contrato = contrato if contrato is not None else Contrato()
+    inicio = time.time()
+    bloques = _bloques_fuente(fuente, tamano_bloque, hoja)
+    detenido = False
+    try:
+        for bloque in bloques:
+            if contrato.validar_bloque(bloque) and detener:
+                detenido = True
+                break
+    finally:
+        if hasattr(bloques, 'close'):
+            bloques.close()
+    segundos = time.time() - inicio
+
+    if verbose:
+        nombre = Path(fuente).name if isinstance(fuente, (str, Path)) else "datos"
+        if contrato.errores:
+            print(f"❌ {nombre}: {contrato.errores:,} violaciones de error"
+                  f"{' (lectura detenida)' if detenido else ''} en {contrato.filas_:,} filas ({segundos:.2f}s)")
+        else:
+            print(f"✅ {nombre}: {contrato.filas_:,} filas cumplen el contrato ({segundos:.2f}s)")
+        if contrato.advertencias:
+            print(f"⚠️  {contrato.advertencias:,} advertencias")
+        if contrato.violaciones_:
+            print(contrato.reporte().to_string(index=False))
+
+    return {
+        'valido': contrato.errores == 0,
+        'errores': contrato.errores,
+        'advertencias': contrato.advertencias,
+        'filas_leidas': contrato.filas_,
+        'detenido': detenido,
+        'segundos': segundos,
+        'reporte': contrato.reporte(),
+        'muestras': contrato.muestras(),
+    }
+
+
+def leer_validado(ruta, contrato=None, tamano_bloque=50000, hoja=None):
+    """
+    Leer un archivo por bloques validando cada uno antes de seguir
+
+    La lectura se interrumpe en el primer bloque con violaciones de error, así
+    que un archivo defectuoso se rechaza sin terminar de parsearlo.
+
+    Parameters:
+    -----------
+    ruta : str o Path
+        Archivo .csv/.xlsx/.parquet/.feather
+    contrato : Contrato, optional
+        Reglas a aplicar (por defecto ``Contrato()``)
+    tamano_bloque : int
+        Filas por bloque
+    hoja : str, optional
+        Hoja de Excel a leer
+
+    Returns:
+    --------
+    pandas.DataFrame : Contenido completo del archivo
+
+    Raises:
+    -------
+    ValueError : Con el reporte y las filas de ejemplo si hay violaciones de error
+    """
+    contrato = contrato if contrato is not None else Contrato()
+    bloques_leidos = []
+    bloques = _bloques_fuente(ruta, tamano_bloque, hoja)
+    try:
+        for bloque in bloques:
+            if contrato.validar_bloque(bloque):
+                raise ValueError(contrato.resumen(Path(ruta).name))
+            bloques_leidos.append(bloque)
+    finally:
+        if hasattr(bloques, 'close'):
+            bloques.close()
+
+    if contrato.advertencias:
+        print(f"⚠️  {Path(ruta).name}: {contrato.advertencias:,} advertencias de calidad")
+        print(contrato.reporte().to_string(index=False))
+    if not bloques_leidos:
+        return pd.DataFrame()
+    # Los bloques de openpyxl llegan como objetos de Python: infer_objects recupera los tipos
+    return pd.concat(bloques_leidos, ignore_index=True).infer_objects()